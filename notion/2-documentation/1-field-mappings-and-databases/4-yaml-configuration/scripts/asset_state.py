@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Asset State Store - Per-Asset Previous Values for Stateful Mappings
+
+The `*_last_changed_at` / `*_last_updated_at` mappings need each asset's
+previous value and timestamp. AssetStateStore keeps them in memory as
+array-backed columns (one row per asset, one slot per stateful field of the
+compiled mapping), so each lookup is O(1) with no database round trip:
+
+    slot kind   columns per asset                       used by
+    change      value id (int32) + changed_at (float64)  LAST_CHANGED_FUNCTIONS
+    update      updated_at (float64)                     LAST_UPDATED_FUNCTIONS
+    location    lat + lng + changed_at (float64)         LOCATION_CHANGED_FUNCTIONS
+    transit     status id (int32) + stationary_since +   TRANSIT_FUNCTIONS
+                at (float64) + ignition (int8)
+
+Timestamps are epoch seconds (NaN = never). Values of `change` slots are
+stored as ids into a shared value table (status codes, booleans, driver
+keys), so a row has a fixed size whatever the values are.
+
+Usage:
+    store = AssetStateStore.for_engine(engine)
+    fleeti = engine.transform(packet, store.bind(context, asset_id))
+    store.snapshot(path)                    # survive restarts
+    store = AssetStateStore.restore(path)
+
+Asset ids must be integers (Navixy tracker / Fleeti asset ids).
+"""
+
+import argparse
+import json
+import math
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from mapping_functions import (
+    LAST_CHANGED_FUNCTIONS,
+    LAST_UPDATED_FUNCTIONS,
+    LOCATION_CHANGED_FUNCTIONS,
+    TRANSIT_FUNCTIONS,
+)
+from status_engine import PARKED_AFTER_SECONDS, transit_transition
+
+
+SNAPSHOT_MAGIC = b'FASTATE1'
+SNAPSHOT_FORMAT = 2
+NEVER = math.nan
+NO_VALUE = -1
+EARTH_RADIUS_M = 6371008.8
+TUPLE_TAG = '__tuple__'
+JSON_SCALARS = (str, int, float, bool)
+
+SLOT_KINDS = {
+    **{name: 'change' for name in LAST_CHANGED_FUNCTIONS},
+    **{name: 'update' for name in LAST_UPDATED_FUNCTIONS},
+    **{name: 'location' for name in LOCATION_CHANGED_FUNCTIONS},
+    **{name: 'transit' for name in TRANSIT_FUNCTIONS},
+}
+
+# Column layout per slot kind: (column suffix, array typecode, initial value)
+KIND_COLUMNS = {
+    'change': (('value', 'i', NO_VALUE), ('at', 'd', NEVER)),
+    'update': (('at', 'd', NEVER),),
+    'location': (('lat', 'd', NEVER), ('lng', 'd', NEVER), ('at', 'd', NEVER)),
+    'transit': (('value', 'i', NO_VALUE), ('since', 'd', NEVER), ('at', 'd', NEVER), ('ignition', 'b', NO_VALUE)),
+}
+
+
+def distance_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Haversine distance in meters."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def stored_time(value: float) -> Optional[float]:
+    return None if value != value else value  # NaN -> None
+
+
+def value_key(value: Any) -> Tuple[str, Any]:
+    """Intern key of a state value: type name + value, or its JSON form when unhashable."""
+    try:
+        key = (type(value).__name__, value)
+        hash(key)
+    except TypeError:  # unhashable (lists...) -> compare by JSON form
+        key = ('json', json.dumps(value, sort_keys=True, default=str))
+    return key
+
+
+def encode_value(value: Any) -> Any:
+    """JSON form of a state value; tuples are tagged so restore() gives back tuples, not lists."""
+    if value is None or isinstance(value, JSON_SCALARS):
+        return value
+    if isinstance(value, tuple):
+        return {TUPLE_TAG: [encode_value(item) for item in value]}
+    if isinstance(value, list):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict) and all(isinstance(key, str) for key in value) and TUPLE_TAG not in value:
+        return {key: encode_value(item) for key, item in value.items()}
+    raise ValueError(f"Cannot snapshot state value {value!r} ({type(value).__name__}): "
+                     f"only JSON values and tuples are supported")
+
+
+def decode_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1 and TUPLE_TAG in value:
+            return tuple(decode_value(item) for item in value[TUPLE_TAG])
+        return {key: decode_value(item) for key, item in value.items()}
+    return value
+
+
+class AssetState:
+    """Per-asset view handed to stateful functions as context['state']."""
+
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store: 'AssetStateStore', row: int):
+        self.store = store
+        self.row = row
+
+    def last_changed_at(self, key: str, value: Any, timestamp: Optional[float]) -> Optional[float]:
+        return self.store.update_changed(self.row, key, value, timestamp)
+
+    def last_updated_at(self, key: str, present: bool, timestamp: Optional[float]) -> Optional[float]:
+        return self.store.update_presence(self.row, key, present, timestamp)
+
+    def location_changed_at(self, key: str, lat: Optional[float], lng: Optional[float],
+                            timestamp: Optional[float], threshold_m: float = 0.0) -> Optional[float]:
+        return self.store.update_location(self.row, key, lat, lng, timestamp, threshold_m)
+
+    def transit_status(self, key: str, ignition: Optional[bool], moving: Optional[bool], speed: Optional[float],
+                       timestamp: Optional[float], parked_after: float = PARKED_AFTER_SECONDS) -> Optional[str]:
+        return self.store.update_transit(self.row, key, ignition, moving, speed, timestamp, parked_after)
+
+
+class AssetStateStore:
+    """
+    Array-backed per-asset state for stateful mapping functions.
+
+    Args:
+        slots: Slot keys (stateful function names) in slot id order; the
+            kind of each slot comes from SLOT_KINDS
+    """
+
+    def __init__(self, slots: List[str]):
+        unknown = [key for key in slots if key not in SLOT_KINDS]
+        if unknown:
+            raise ValueError(f"Not stateful functions: {', '.join(unknown)}")
+        self.slots = list(slots)
+        self.slot_ids = {key: index for index, key in enumerate(self.slots)}
+        self.slot_kinds = [SLOT_KINDS[key] for key in self.slots]
+
+        # columns[slot_id][column suffix] -> array, one entry per asset row
+        self.columns: List[Dict[str, array]] = [
+            {suffix: array(typecode) for suffix, typecode, _ in KIND_COLUMNS[kind]}
+            for kind in self.slot_kinds
+        ]
+        self._row_defaults: List[Tuple[array, Any]] = [
+            (column[suffix], initial)
+            for column, kind in zip(self.columns, self.slot_kinds)
+            for suffix, _, initial in KIND_COLUMNS[kind]
+        ]
+        self.asset_ids = array('q')
+        self.rows: Dict[int, int] = {}
+        self.values: List[Any] = []
+        self.value_ids: Dict[Any, int] = {}
+
+    @classmethod
+    def for_engine(cls, engine) -> 'AssetStateStore':
+        """Slots for the stateful functions used by a compiled MappingEngine (field order = slot id order)."""
+        slots = []
+        for name in engine.field_names:
+            function_name = engine.field_functions.get(name)
+            if function_name in SLOT_KINDS and function_name not in slots:
+                slots.append(function_name)
+        return cls(slots)
+
+    def __len__(self) -> int:
+        return len(self.asset_ids)
+
+    # ------------------------------------------------------------------
+    # Rows
+    # ------------------------------------------------------------------
+
+    def row(self, asset_id: int) -> int:
+        """Row index of an asset, allocating a fresh row on first sight."""
+        row = self.rows.get(asset_id)
+        if row is None:
+            row = len(self.asset_ids)
+            self.rows[asset_id] = row
+            self.asset_ids.append(asset_id)
+            for column, initial in self._row_defaults:
+                column.append(initial)
+        return row
+
+    def view(self, asset_id: int) -> AssetState:
+        return AssetState(self, self.row(asset_id))
+
+    def bind(self, context: Optional[Dict], asset_id: int) -> Dict:
+        """Copy of the packet context with `state` set to this asset's view."""
+        bound = dict(context) if context else {}
+        bound['state'] = self.view(asset_id)
+        return bound
+
+    def value_id(self, value: Any) -> int:
+        if value is None:
+            return NO_VALUE
+        key = value_key(value)
+        value_id = self.value_ids.get(key)
+        if value_id is None:
+            value_id = len(self.values)
+            self.value_ids[key] = value_id
+            self.values.append(value)
+        return value_id
+
+    # ------------------------------------------------------------------
+    # Slot updates (called through AssetState)
+    # ------------------------------------------------------------------
+
+    def update_changed(self, row: int, key: str, value: Any, timestamp: Optional[float]) -> Optional[float]:
+        """Record value at timestamp; returns when the value last changed (null values keep state)."""
+        columns = self.columns[self.slot_ids[key]]
+        changed_at = columns['at']
+        stored = changed_at[row]
+        if value is None or timestamp is None or (stored == stored and timestamp < stored):
+            return stored_time(stored)
+        value_id = self.value_id(value)
+        if columns['value'][row] != value_id:
+            columns['value'][row] = value_id
+            changed_at[row] = timestamp
+            return timestamp
+        return stored_time(stored)
+
+    def update_presence(self, row: int, key: str, present: bool, timestamp: Optional[float]) -> Optional[float]:
+        """Returns the latest timestamp at which the field carried a value."""
+        updated_at = self.columns[self.slot_ids[key]]['at']
+        stored = updated_at[row]
+        if present and timestamp is not None and not stored >= timestamp:
+            updated_at[row] = timestamp
+            return timestamp
+        return stored_time(stored)
+
+    def update_location(self, row: int, key: str, lat: Optional[float], lng: Optional[float],
+                        timestamp: Optional[float], threshold_m: float = 0.0) -> Optional[float]:
+        """Returns when the position last moved by more than threshold_m."""
+        columns = self.columns[self.slot_ids[key]]
+        changed_at = columns['at']
+        stored = changed_at[row]
+        if lat is None or lng is None or timestamp is None or (stored == stored and timestamp < stored):
+            return stored_time(stored)
+        previous_lat = columns['lat'][row]
+        previous_lng = columns['lng'][row]
+        if previous_lat == previous_lat:
+            if previous_lat == lat and previous_lng == lng:
+                return stored_time(stored)
+            if threshold_m > 0 and distance_m(previous_lat, previous_lng, lat, lng) <= threshold_m:
+                return stored_time(stored)
+        columns['lat'][row] = lat
+        columns['lng'][row] = lng
+        changed_at[row] = timestamp
+        return timestamp
+
+    def update_transit(self, row: int, key: str, ignition: Optional[bool], moving: Optional[bool],
+                       speed: Optional[float], timestamp: Optional[float],
+                       parked_after: float = PARKED_AFTER_SECONDS) -> Optional[str]:
+        """Advance the transit state machine; out-of-order packets return the current status unchanged."""
+        columns = self.columns[self.slot_ids[key]]
+        value_id = columns['value'][row]
+        previous = self.values[value_id] if value_id != NO_VALUE else None
+        stored = columns['at'][row]
+        if timestamp is None or (stored == stored and timestamp < stored):
+            return previous
+        previous_ignition = columns['ignition'][row]
+        status, since = transit_transition(
+            previous, columns['since'][row],
+            None if previous_ignition == NO_VALUE else bool(previous_ignition),
+            ignition, moving, speed, timestamp, parked_after,
+        )
+        if status != previous:
+            columns['value'][row] = self.value_id(status)
+        columns['since'][row] = since
+        columns['at'][row] = timestamp
+        if ignition is not None:
+            columns['ignition'][row] = int(bool(ignition))
+        return status
+
+    # ------------------------------------------------------------------
+    # Snapshot / restore
+    # ------------------------------------------------------------------
+
+    def snapshot(self, path: Path) -> int:
+        """
+        Write all state to disk (atomic rename); returns the file size.
+
+        The value table is written in id order. Values must be JSON values or
+        tuples; anything else raises ValueError before the file is touched.
+        """
+        header = json.dumps({
+            'format': SNAPSHOT_FORMAT,
+            'slots': self.slots,
+            'assets': len(self.asset_ids),
+            'values': [encode_value(value) for value in self.values],
+        }).encode('utf-8')
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            self.asset_ids.tofile(f)
+            for column in self.columns:
+                for values in column.values():
+                    values.tofile(f)
+        tmp_path.replace(path)
+        return path.stat().st_size
+
+    @classmethod
+    def restore(cls, path: Path) -> 'AssetStateStore':
+        """Load a store written by snapshot()."""
+        with open(path, 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path.name} is not an asset state snapshot")
+            (header_size,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_size))
+            if header.get('format') != SNAPSHOT_FORMAT:
+                raise ValueError(f"{path.name}: unsupported snapshot format {header.get('format')!r}")
+
+            store = cls(header['slots'])
+            count = header['assets']
+            store.asset_ids.fromfile(f, count)
+            for column in store.columns:
+                for values in column.values():
+                    values.fromfile(f, count)
+
+        store.rows = {asset_id: row for row, asset_id in enumerate(store.asset_ids)}
+        # Value ids are positions in the stored table; never re-intern them
+        store.values = [decode_value(value) for value in header['values']]
+        for value_id, value in enumerate(store.values):
+            store.value_ids.setdefault(value_key(value), value_id)
+        return store
+
+    # ------------------------------------------------------------------
+    # Footprint
+    # ------------------------------------------------------------------
+
+    def footprint(self) -> Dict[str, int]:
+        """Approximate memory use in bytes (columns, asset index, value table)."""
+        column_bytes = self.asset_ids.itemsize * len(self.asset_ids) + sum(
+            values.itemsize * len(values) for column in self.columns for values in column.values()
+        )
+        index_bytes = sys.getsizeof(self.rows) + sum(sys.getsizeof(asset_id) for asset_id in self.rows)
+        value_bytes = sys.getsizeof(self.values) + sys.getsizeof(self.value_ids) + sum(
+            sys.getsizeof(value) for value in self.values
+        )
+        total = column_bytes + index_bytes + value_bytes
+        return {
+            'assets': len(self.asset_ids),
+            'slots': len(self.slots),
+            'column_bytes': column_bytes,
+            'index_bytes': index_bytes,
+            'value_bytes': value_bytes,
+            'total_bytes': total,
+            'bytes_per_asset': total // len(self.asset_ids) if self.asset_ids else 0,
+        }
+
+
+def main():
+    """Fill a store for N assets through the engine and report footprint and snapshot timings."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('yaml_file', nargs='?', type=Path, help='Mapping YAML (default: latest in output/)')
+    parser.add_argument('--assets', type=int, default=1_000_000, help='Assets in the store')
+    parser.add_argument('--packets', type=int, default=50_000, help='Packets transformed through the engine')
+    args = parser.parse_args()
+
+    from mapping_engine import OUTPUT_DIR, MappingEngine, build_sample_packet, find_latest_yaml_file
+
+    yaml_file = args.yaml_file or find_latest_yaml_file(OUTPUT_DIR)
+    engine = MappingEngine.from_file(yaml_file)
+    store = AssetStateStore.for_engine(engine)
+    print(f"Mapping: {yaml_file.name} ({len(store.slots)} stateful slots: "
+          f"{', '.join(f'{k}={store.slot_kinds.count(k)}' for k in KIND_COLUMNS)})")
+
+    packet = build_sample_packet()
+    context = {'asset': {'installation': {'ignition_input_number': 1}}}
+    start = time.perf_counter()
+    for index in range(args.packets):
+        engine.transform(packet, store.bind(context, index % args.assets))
+    elapsed = time.perf_counter() - start
+    print(f"Engine with state: {args.packets / elapsed:,.0f} packets/s")
+
+    start = time.perf_counter()
+    slots = store.slots
+    for asset_id in range(args.assets):
+        state = store.view(asset_id)
+        for key, kind in zip(slots, store.slot_kinds):
+            if kind == 'change':
+                state.last_changed_at(key, 'in_transit' if asset_id % 3 else 'parked', 1.7e9 + asset_id)
+            elif kind == 'update':
+                state.last_updated_at(key, True, 1.7e9 + asset_id)
+            elif kind == 'transit':
+                state.transit_status(key, None, asset_id % 3 == 0, None, 1.7e9 + asset_id)
+            else:
+                state.location_changed_at(key, -20.28 + asset_id * 1e-6, 57.43, 1.7e9 + asset_id)
+    elapsed = time.perf_counter() - start
+    print(f"Filled {len(store):,} assets in {elapsed:.1f} s")
+
+    footprint = store.footprint()
+    print(f"Footprint: {footprint['total_bytes'] / 1e6:,.1f} MB ({footprint['bytes_per_asset']} bytes/asset: "
+          f"columns {footprint['column_bytes'] / 1e6:,.1f} MB, index {footprint['index_bytes'] / 1e6:,.1f} MB)")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / 'asset-state.bin'
+        start = time.perf_counter()
+        size = store.snapshot(path)
+        snapshot_s = time.perf_counter() - start
+        start = time.perf_counter()
+        restored = AssetStateStore.restore(path)
+        restore_s = time.perf_counter() - start
+    mismatches = sum(
+        restored.values[row] != value or type(restored.values[row]) is not type(value)
+        for row, value in enumerate(store.values)
+    ) + sum(
+        restored_values != values
+        for restored_column, column in zip(restored.columns, store.columns)
+        for restored_values, values in zip(restored_column.values(), column.values())
+        if values.typecode != 'd'  # NaN != NaN
+    )
+    print(f"Snapshot: {size / 1e6:,.1f} MB in {snapshot_s:.2f} s, restore {restore_s:.2f} s "
+          f"({len(restored):,} assets, {mismatches} value table/id mismatches)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Config Overlays - Hierarchical Mapping Configuration Resolution
+
+Mapping Fields rows carry a `Configuration Level` (default, customer,
+asset_group, asset); lower levels override higher levels. This module
+resolves the effective mapping for an asset from the default mapping YAML
+and its override layers:
+
+    default -> customer -> asset_group -> asset
+
+Each layer is a `mappings` dict in the YAML mapping format. An entry replaces
+the field's mapping entirely (same as a Mapping Fields row at that level);
+an entry set to null removes the field.
+
+Effective engines are cached in an LRU keyed by the tuple of applied layer
+(level, key, version), so assets sharing the same override combination share
+one compiled MappingEngine. Merging is copy-on-write: the merged mappings
+reuse the entry objects of the layers below for every field a layer does not
+override, and a CompiledStepCache shared by all engines compiles each entry
+once. Memory and compile time therefore grow with distinct override
+combinations and overridden entries, not with the number of assets.
+Engines leaving the LRU (or using a replaced / removed layer) are released
+from the step cache, which then drops entries no cached engine uses.
+
+Usage:
+    resolver = OverlayResolver.from_file(default_yaml)
+    resolver.add_layer('customer', 'acme', load_layer_file(path))
+    engine = resolver.resolve(customer='acme', asset_group='g-12', asset='a-981')
+    fleeti = engine.transform(packet, context)
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import yaml
+
+from mapping_engine import (
+    OUTPUT_DIR,
+    CompiledStepCache,
+    MappingEngine,
+    build_sample_packet,
+    find_latest_yaml_file,
+)
+
+
+# Override levels, in the order they are applied (later levels win)
+LAYER_LEVELS = ('customer', 'asset_group', 'asset')
+
+
+class ConfigLayer(NamedTuple):
+    """One override layer: mappings replacing (or removing, when null) default entries."""
+    level: str
+    key: str
+    version: str
+    mappings: Dict[str, Optional[Dict]]
+
+
+LayerKey = Tuple[Tuple[str, str, str], ...]
+
+
+def layer_version(mappings: Dict[str, Any]) -> str:
+    """Content hash of a layer's mappings (used when no explicit version is given)."""
+    data = json.dumps(mappings, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def load_layer_file(layer_path: Path) -> Dict[str, Optional[Dict]]:
+    """Read the `mappings` section of an override layer YAML."""
+    with open(layer_path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f) or {}
+    return data.get('mappings') or {}
+
+
+def merge_layers(base: Dict[str, Dict], layers: List[ConfigLayer]) -> Dict[str, Dict]:
+    """
+    Merge override layers onto base mappings (copy-on-write).
+
+    Only the top-level dict is copied; entries not overridden are the same
+    objects as in `base`, which is what lets engines share compiled steps.
+    """
+    merged = dict(base)
+    for layer in layers:
+        for name, entry in layer.mappings.items():
+            if entry is None:
+                merged.pop(name, None)
+            else:
+                merged[name] = entry
+    return merged
+
+
+class OverlayResolver:
+    """
+    Resolves (customer, asset_group, asset) to an effective compiled MappingEngine.
+
+    Args:
+        yaml_data: Default mapping YAML (version, provider, mappings)
+        functions: Function registry override (passed to MappingEngine)
+        max_engines: LRU capacity (distinct override combinations kept compiled)
+        strict: Passed to MappingEngine
+    """
+
+    def __init__(
+        self,
+        yaml_data: Dict,
+        functions: Optional[Dict[str, Callable]] = None,
+        max_engines: int = 512,
+        strict: bool = False
+    ):
+        self.version = yaml_data.get('version')
+        self.provider = yaml_data.get('provider')
+        self.base_mappings: Dict[str, Dict] = yaml_data.get('mappings') or {}
+        self.functions = functions
+        self.strict = strict
+        self.max_engines = max_engines
+        self.layers: Dict[Tuple[str, str], ConfigLayer] = {}
+        self.step_cache = CompiledStepCache()
+        self._engines: 'OrderedDict[LayerKey, MappingEngine]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_file(cls, yaml_path: Path, **kwargs) -> 'OverlayResolver':
+        """Load the default mapping YAML."""
+        with open(yaml_path, 'r', encoding='utf-8') as f:
+            return cls(yaml.safe_load(f), **kwargs)
+
+    def add_layer(
+        self,
+        level: str,
+        key: str,
+        mappings: Dict[str, Optional[Dict]],
+        version: Optional[str] = None
+    ) -> ConfigLayer:
+        """Register (or replace) an override layer; a new version drops cached combinations using it."""
+        if level not in LAYER_LEVELS:
+            raise ValueError(f"Unknown configuration level '{level}' (expected one of {', '.join(LAYER_LEVELS)})")
+        layer = ConfigLayer(level, str(key), version or layer_version(mappings), mappings)
+        previous = self.layers.get((level, layer.key))
+        if previous is not None and previous.version != layer.version:
+            self._drop_engines(level, layer.key)
+        self.layers[(level, layer.key)] = layer
+        return layer
+
+    def remove_layer(self, level: str, key: str) -> None:
+        if self.layers.pop((level, str(key)), None) is not None:
+            self._drop_engines(level, str(key))
+
+    def _drop_engines(self, level: str, key: str) -> None:
+        """Drop cached engines compiled with a layer, releasing their compiled steps."""
+        stale = [cache_key for cache_key in self._engines
+                 if any(layer_level == level and layer_key == key for layer_level, layer_key, _ in cache_key)]
+        for cache_key in stale:
+            self.step_cache.release(self._engines.pop(cache_key))
+
+    def applicable_layers(self, **keys: Optional[str]) -> List[ConfigLayer]:
+        """Registered layers for the given level keys, in application order."""
+        layers = []
+        for level in LAYER_LEVELS:
+            key = keys.get(level)
+            if key is None:
+                continue
+            layer = self.layers.get((level, str(key)))
+            if layer is not None and layer.mappings:
+                layers.append(layer)
+        return layers
+
+    def resolve(
+        self,
+        customer: Optional[str] = None,
+        asset_group: Optional[str] = None,
+        asset: Optional[str] = None
+    ) -> MappingEngine:
+        """Effective engine for an asset (compiled on first use of its layer combination)."""
+        layers = self.applicable_layers(customer=customer, asset_group=asset_group, asset=asset)
+        cache_key: LayerKey = tuple((layer.level, layer.key, layer.version) for layer in layers)
+
+        engine = self._engines.get(cache_key)
+        if engine is not None:
+            self._engines.move_to_end(cache_key)
+            self.hits += 1
+            return engine
+
+        self.misses += 1
+        engine = MappingEngine(
+            {'version': self.version, 'provider': self.provider,
+             'mappings': merge_layers(self.base_mappings, layers)},
+            functions=self.functions,
+            strict=self.strict,
+            step_cache=self.step_cache,
+        )
+        self._engines[cache_key] = engine
+        if len(self._engines) > self.max_engines:
+            self.step_cache.release(self._engines.popitem(last=False)[1])
+            self.evictions += 1
+        return engine
+
+    def stats(self) -> Dict[str, int]:
+        """LRU and compiled-step sharing counters."""
+        return {
+            'cached_engines': len(self._engines),
+            'engine_hits': self.hits,
+            'engine_misses': self.misses,
+            'engine_evictions': self.evictions,
+            'compiled_entries': len(self.step_cache.entries),
+            'step_reuses': self.step_cache.hits,
+            'released_entries': self.step_cache.evicted,
+        }
+
+
+def synthetic_override(entry: Dict, variant: int) -> Dict:
+    """Copy of a prioritized entry with a rotated source priority order (benchmark overrides)."""
+    sources = entry['sources']
+    shift = variant % len(sources) or 1
+    rotated = sources[shift:] + sources[:shift]
+    return dict(entry, sources=[dict(source, priority=index + 1) for index, source in enumerate(rotated)])
+
+
+def main():
+    """Resolve engines for a synthetic fleet and compare against compiling one engine per asset."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('yaml_file', nargs='?', type=Path, help='Default mapping YAML (default: latest in output/)')
+    parser.add_argument('--assets', type=int, default=20000, help='Assets in the synthetic fleet')
+    parser.add_argument('--customers', type=int, default=40, help='Customers with an override layer')
+    parser.add_argument('--groups', type=int, default=200, help='Asset groups with an override layer')
+    parser.add_argument('--asset-overrides', type=int, default=100, help='Assets with their own override layer')
+    parser.add_argument('--max-engines', type=int, default=512, help='Resolver LRU capacity')
+    args = parser.parse_args()
+
+    yaml_file = args.yaml_file or find_latest_yaml_file(OUTPUT_DIR)
+    resolver = OverlayResolver.from_file(yaml_file, max_engines=args.max_engines)
+    base = resolver.base_mappings
+    prioritized = [name for name, entry in base.items()
+                   if entry.get('type') == 'prioritized' and len(entry.get('sources') or []) > 1]
+
+    rng = random.Random(7)
+    for index in range(args.customers):
+        name = prioritized[index % len(prioritized)]
+        resolver.add_layer('customer', f'c{index}', {name: synthetic_override(base[name], index)})
+    for index in range(args.groups):
+        name = rng.choice(prioritized)
+        resolver.add_layer('asset_group', f'g{index}', {name: synthetic_override(base[name], index)})
+    for index in range(args.asset_overrides):
+        name = rng.choice(prioritized)
+        resolver.add_layer('asset', f'a{index}', {name: synthetic_override(base[name], index + 1)})
+
+    # Customers have 1-10 groups each; a quarter of the customers have no override layer
+    fleet = []
+    for index in range(args.assets):
+        customer = rng.randrange(args.customers * 4 // 3)
+        group = (customer * 10 + rng.randrange(1, 11)) % (args.groups * 2)
+        fleet.append({'customer': f'c{customer}', 'asset_group': f'g{group}', 'asset': f'a{index}'})
+
+    start = time.perf_counter()
+    for asset in fleet:
+        resolver.resolve(**asset)
+    resolve_seconds = time.perf_counter() - start
+    stats = resolver.stats()
+
+    start = time.perf_counter()
+    MappingEngine({'version': resolver.version, 'provider': resolver.provider, 'mappings': base})
+    compile_seconds = time.perf_counter() - start
+
+    print(f"Default mapping: {yaml_file.name} ({len(base)} mappings)")
+    print(f"Layers: {args.customers} customer, {args.groups} asset group, {args.asset_overrides} asset")
+    print(f"Resolved {len(fleet):,} assets in {resolve_seconds * 1000:.0f} ms: "
+          f"{stats['engine_misses']} distinct combinations compiled, {stats['engine_hits']:,} LRU hits")
+    print(f"Compiled entries: {stats['compiled_entries']} "
+          f"(reused {stats['step_reuses']:,} times instead of recompiling)")
+    print(f"One engine per asset would compile {len(fleet) * len(base):,} entries "
+          f"(~{len(fleet) * compile_seconds:.1f} s)")
+
+    # Overlay engines must match a standalone compile of the same merged mappings
+    packet = build_sample_packet()
+    context = {'asset': {'installation': {'ignition_input_number': 1}}}
+    mismatches = 0
+    for asset in rng.sample(fleet, min(200, len(fleet))):
+        merged = merge_layers(base, resolver.applicable_layers(**asset))
+        reference = MappingEngine({'version': resolver.version, 'provider': resolver.provider, 'mappings': merged})
+        if resolver.resolve(**asset).transform(packet, context) != reference.transform(packet, context):
+            mismatches += 1
+    print(f"Mismatches vs standalone compile (200 sampled assets): {mismatches}")
+
+    # Customer layers change: engines using the old versions are dropped and their steps released
+    for index in range(args.customers):
+        name = prioritized[index % len(prioritized)]
+        resolver.add_layer('customer', f'c{index}', {name: synthetic_override(base[name], index + 1)})
+    for asset in fleet:
+        resolver.resolve(**asset)
+    referenced = {key for engine in resolver._engines.values() for key in engine.step_keys}
+    stats = resolver.stats()
+    print(f"After replacing customer layers: {stats['cached_engines']} cached engines, "
+          f"{stats['compiled_entries']} compiled entries held ({len(referenced)} referenced by cached engines), "
+          f"{stats['released_entries']} released")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Connectivity Timers - Time-Driven Online/Offline Transitions
+
+Connectivity turns offline when last_updated_at ages past the asset's window
+(24 h, 1 h for cold room sites; 2-status-rules.md) - without any packet
+arriving. Instead of scanning the whole fleet periodically, every packet
+(re)schedules the asset's online -> offline deadline in a hierarchical timer
+wheel, and advancing the wheel emits exactly the assets whose deadline
+passed, each at its own deadline.
+
+Timer wheel (one tick = `resolution` seconds, 1 s by default):
+
+    level   slots   slot width      horizon
+    0       256     1 tick          256 s
+    1       64      256 ticks       ~4.5 h
+    2       64      16384 ticks     ~12 days
+    3       64      1048576 ticks   ~2 years
+
+Slots are sets and each asset remembers its slot, so scheduling, rescheduling
+and cancelling are O(1); an entry is moved down at most once per level as
+its deadline approaches (cascade).
+
+Emitted events carry the fields the derive_statuses_connectivity_* mappings
+produce (statuses_connectivity_code / _last_changed_at) plus the resulting
+top status, using the compatibility profiles of status_engine.py.
+
+Usage:
+    monitor = ConnectivityMonitor(start_time=time.time())
+    monitor.on_packet(asset_id, fleeti['last_updated_at'], context['asset'])
+    for event in monitor.advance(time.time()):          # e.g. once per second
+        publish(event.fields())
+"""
+
+import argparse
+import math
+import random
+import time
+from typing import Any, Dict, Hashable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from mapping_functions import FUNCTION_REGISTRY, from_epoch_seconds, to_epoch_seconds
+from status_engine import CONNECTIVITY_BIT, StatusEngine
+
+
+LEVEL_BITS = (8, 6, 6, 6)
+
+
+class TimerWheel:
+    """
+    Hierarchical timer wheel of keyed deadlines (one pending deadline per key).
+
+    Args:
+        start_time: Epoch seconds of the wheel's current time
+        resolution: Seconds per tick; deadlines fire at the first tick at or after them
+    """
+
+    def __init__(self, start_time: float, resolution: float = 1.0):
+        self.resolution = resolution
+        self.tick = int(start_time // resolution)
+        self.shifts: List[int] = []
+        shift = 0
+        for bits in LEVEL_BITS:
+            self.shifts.append(shift)
+            shift += bits
+        self.masks = [(1 << bits) - 1 for bits in LEVEL_BITS]
+        self.spans = [1 << (shift + bits) for shift, bits in zip(self.shifts, LEVEL_BITS)]
+        self.levels: List[List[Set[Hashable]]] = [[set() for _ in range(1 << bits)] for bits in LEVEL_BITS]
+        # key -> (deadline, deadline tick, slot set)
+        self.entries: Dict[Hashable, Tuple[float, int, Set[Hashable]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _slot(self, expires: int) -> Set[Hashable]:
+        delta = expires - self.tick
+        for level, span in enumerate(self.spans):
+            if delta < span:
+                return self.levels[level][(expires >> self.shifts[level]) & self.masks[level]]
+        # Beyond the last level: park in its furthest slot, re-placed when cascaded
+        last = len(LEVEL_BITS) - 1
+        return self.levels[last][((self.tick >> self.shifts[last]) - 1) & self.masks[last]]
+
+    def schedule(self, key: Hashable, deadline: float) -> None:
+        """Set (or move) the key's deadline."""
+        expires = max(math.ceil(deadline / self.resolution), self.tick + 1)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[1] == expires:
+                self.entries[key] = (deadline, expires, entry[2])
+                return
+            entry[2].discard(key)
+        slot = self._slot(expires)
+        slot.add(key)
+        self.entries[key] = (deadline, expires, slot)
+
+    def cancel(self, key: Hashable) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            entry[2].discard(key)
+
+    def deadline(self, key: Hashable) -> Optional[float]:
+        entry = self.entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def _cascade(self, level: int) -> None:
+        slot = self.levels[level][(self.tick >> self.shifts[level]) & self.masks[level]]
+        if not slot:
+            return
+        keys = list(slot)
+        slot.clear()
+        entries = self.entries
+        for key in keys:
+            deadline, expires, _ = entries[key]
+            target = self._slot(expires)
+            target.add(key)
+            entries[key] = (deadline, expires, target)
+
+    def advance(self, now: float) -> Iterator[Tuple[Hashable, float]]:
+        """Move time to `now`, yielding (key, deadline) for every expired key in deadline-tick order."""
+        target = int(now // self.resolution)
+        level0 = self.levels[0]
+        mask0 = self.masks[0]
+        entries = self.entries
+        while self.tick < target:
+            self.tick += 1
+            if not self.tick & mask0:
+                for level in range(1, len(LEVEL_BITS)):
+                    self._cascade(level)
+                    if (self.tick >> self.shifts[level]) & self.masks[level]:
+                        break
+            slot = level0[self.tick & mask0]
+            if slot:
+                fired = sorted(slot, key=lambda key: entries[key][0])
+                slot.clear()
+                for key in fired:
+                    deadline = entries.pop(key)[0]
+                    yield key, deadline
+
+
+class ConnectivityEvent(NamedTuple):
+    """Connectivity status change of one asset."""
+    asset_id: Hashable
+    code: str
+    changed_at: float
+    last_updated_at: float
+
+    def fields(self) -> Dict[str, Any]:
+        """Fleeti fields as produced by the connectivity (and top status) mappings."""
+        out = {
+            'statuses_connectivity_code': self.code,
+            'statuses_connectivity_last_changed_at': from_epoch_seconds(self.changed_at),
+        }
+        if self.code == 'offline':  # offline always wins the top status
+            out['top_status_family'] = 'connectivity'
+            out['top_status_code'] = 'offline'
+        return out
+
+
+class ConnectivityMonitor:
+    """
+    Per-asset connectivity state driven by packets and a timer wheel.
+
+    Args:
+        start_time: Current time (epoch seconds)
+        status_engine: Compatibility profiles (default: StatusEngine())
+        resolution: Timer wheel tick in seconds
+    """
+
+    def __init__(self, start_time: float, status_engine: Optional[StatusEngine] = None, resolution: float = 1.0):
+        self.status_engine = status_engine or StatusEngine()
+        self.wheel = TimerWheel(start_time, resolution)
+        self.now = start_time
+        # asset id -> last_updated_at (epoch); offline assets are those without a pending deadline
+        self.last_updated: Dict[Hashable, float] = {}
+        self.windows: Dict[Hashable, float] = {}
+
+    def on_packet(self, asset_id: Hashable, last_updated_at: Any, asset: Optional[Dict] = None) -> Optional[ConnectivityEvent]:
+        """Record a packet; returns an online event when the asset comes back from offline."""
+        moment = to_epoch_seconds(last_updated_at)
+        if moment is None:
+            return None
+        profile = self.status_engine.profile(asset)
+        if not profile.mask & CONNECTIVITY_BIT:
+            self.forget(asset_id)
+            return None
+        previous = self.last_updated.get(asset_id)
+        if previous is not None and moment <= previous:
+            return None  # late or recovered packet: last_updated_at does not move back
+        was_online = self.wheel.deadline(asset_id) is not None
+        self.last_updated[asset_id] = moment
+        self.windows[asset_id] = profile.online_window
+
+        deadline = moment + profile.online_window
+        if deadline <= self.now:
+            self.wheel.cancel(asset_id)  # already past its window (recovered data)
+            return None
+        self.wheel.schedule(asset_id, deadline)
+        if not was_online:
+            return ConnectivityEvent(asset_id, 'online', moment, moment)
+        return None
+
+    def forget(self, asset_id: Hashable) -> None:
+        self.wheel.cancel(asset_id)
+        self.last_updated.pop(asset_id, None)
+        self.windows.pop(asset_id, None)
+
+    def advance(self, now: float) -> List[ConnectivityEvent]:
+        """Offline events for every asset whose window expired up to `now` (changed_at = its deadline)."""
+        if now < self.now:
+            return []
+        self.now = now
+        return [ConnectivityEvent(asset_id, 'offline', deadline, self.last_updated[asset_id])
+                for asset_id, deadline in self.wheel.advance(now)]
+
+    def code(self, asset_id: Hashable) -> Optional[str]:
+        """Current connectivity code (None for unknown or incompatible assets)."""
+        if asset_id not in self.last_updated:
+            return None
+        return 'online' if self.wheel.deadline(asset_id) is not None else 'offline'
+
+
+def main():
+    """Fleet simulation: timer-driven transitions vs the connectivity mapping evaluated by full scans."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--assets', type=int, default=1_000_000, help='Assets in the fleet')
+    parser.add_argument('--packets', type=int, default=2_000_000, help='Packets spread over the simulated period')
+    parser.add_argument('--hours', type=float, default=36.0, help='Simulated period')
+    parser.add_argument('--checks', type=int, default=6, help='Full-scan comparisons against the mapping function')
+    args = parser.parse_args()
+
+    rng = random.Random(13)
+    start = to_epoch_seconds('2025-11-26T00:00:00Z')
+    end = start + args.hours * 3600
+    kinds = ({'type': 'Vehicle', 'subtype': 'Truck'}, {'type': 'Site', 'subtype': 'Coldroom'}, {'type': 'Phone'})
+    assets = [kinds[0] if index % 10 else kinds[1 + index // 10 % 2] for index in range(args.assets)]
+
+    # A fifth of the fleet stops reporting early (goes offline), the rest report throughout
+    packets = []
+    for _ in range(args.packets):
+        asset_id = rng.randrange(args.assets)
+        horizon = end if asset_id % 5 else start + (end - start) * 0.3
+        packets.append((start + rng.random() * (horizon - start), asset_id))
+    packets.sort()
+
+    monitor = ConnectivityMonitor(start)
+    connectivity = FUNCTION_REGISTRY['derive_statuses_connectivity_code']
+    check_times = {start + (end - start) * (index + 1) / (args.checks + 1) for index in range(args.checks)}
+    events: List[ConnectivityEvent] = []
+    late_events = 0
+    mismatches = 0
+    scan_seconds = 0.0
+    packet_seconds = 0.0
+    advance_seconds = 0.0
+    index = 0
+    clock = start
+    while clock < end:
+        clock = min(clock + 1.0, end)
+        begin = time.perf_counter()
+        while index < len(packets) and packets[index][0] <= clock:
+            moment, asset_id = packets[index]
+            event = monitor.on_packet(asset_id, moment, assets[asset_id])
+            if event is not None:
+                events.append(event)
+            index += 1
+        middle = time.perf_counter()
+        fired = monitor.advance(clock)
+        advance_seconds += time.perf_counter() - middle
+        packet_seconds += middle - begin
+        late_events += sum(1 for event in fired if not clock - 1.0 < event.changed_at <= clock)
+        events.extend(fired)
+
+        if any(clock - 1.0 < check <= clock for check in check_times):
+            begin = time.perf_counter()
+            context = {'now': clock}
+            for asset_id, moment in monitor.last_updated.items():
+                context['asset'] = assets[asset_id]
+                if connectivity(None, {'last_updated_at': moment}, {}, context) != monitor.code(asset_id):
+                    mismatches += 1
+            scan_seconds += time.perf_counter() - begin
+
+    offline = sum(1 for event in events if event.code == 'offline')
+    seconds = int(end - start)
+    print(f"Simulated {args.hours:.0f} h: {len(packets):,} packets for {args.assets:,} assets "
+          f"({len(packets) / packet_seconds:,.0f} reschedules/s)")
+    print(f"Events: {offline:,} offline, {len(events) - offline:,} online; "
+          f"fired outside their tick: {late_events}")
+    print(f"Wheel: {len(monitor.wheel):,} pending deadlines; advancing {seconds:,} ticks took "
+          f"{advance_seconds:.2f} s ({advance_seconds / seconds * 1e6:,.0f} us/tick incl. expiries)")
+    print(f"Full scan with the mapping function: {scan_seconds / max(args.checks, 1):.2f} s per scan "
+          f"(a 1 s scan cadence would need {scan_seconds / max(args.checks, 1) * seconds / 3600:,.0f} CPU-hours)")
+    print(f"Mismatches vs mapping at {args.checks} checkpoints: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
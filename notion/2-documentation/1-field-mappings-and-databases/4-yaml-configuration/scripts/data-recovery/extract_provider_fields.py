@@ -198,15 +198,23 @@ def extract_provider_fields(yaml_data: Dict[str, Any]) -> Set[str]:
     return columns
 
 
-def generate_json_output(columns: Set[str], yaml_date: str, yaml_version: str = None) -> Dict[str, Any]:
-    """Generate JSON structure matching cURL_reference.json format."""
+def generate_json_output(
+    columns: Set[str],
+    yaml_date: str,
+    yaml_version: str = None,
+    tracker_id: str = "3312229",
+    date_from: str = "2025-11-26T00:00:00Z",
+    date_to: str = "2025-11-26T23:59:59Z",
+    api_hash: str = "{{navixy_hash}}"
+) -> Dict[str, Any]:
+    """Generate JSON structure matching cURL_reference.json format (defaults: reference tracker and day)."""
     sorted_columns = sorted(columns)
     
     json_output = {
-        "hash": "{{navixy_hash}}",
-        "tracker_id": "3312229",
-        "from": "2025-11-26T00:00:00Z",
-        "to": "2025-11-26T23:59:59Z",
+        "hash": api_hash,
+        "tracker_id": str(tracker_id),
+        "from": date_from,
+        "to": date_to,
         "columns": sorted_columns
     }
     
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Gap Detector - Automatic Gap Detection for Data Recovery
+
+F1.5 automatic gap detection: consumes the packet timestamp stream of every
+tracker (as forwarded by F1.1) and turns missing time into recovery jobs for
+recovery_replay.py.
+
+Per tracker, covered time is kept as a compact, sorted interval set: packets
+closer than `max_silence` seconds extend the current interval, a longer
+silence opens a new one. In-order packets (the common case) only touch the
+last interval, so work per packet is O(1) amortized; late packets are placed
+by bisection and merge neighbouring intervals.
+
+detect() reads the gaps between intervals ("last packet loss" = end of an
+interval, "last packet received" = start of the next one, or the current
+time when nothing was received since), merges gaps separated by less than
+`merge_seconds` of coverage into one range, splits ranges longer than the
+recovery API window (`max_request_seconds`) and returns jobs ordered by gap
+size, largest first. Emitted ranges are claimed as covered so the same gap is
+not queued twice. Claims only go into the coverage used for detection; the
+received-packet intervals behind boundaries() are kept apart (shared with the
+coverage until a tracker's first claim).
+
+Jobs become Raw Data Read payloads (data-recovery/cURL_reference.json format)
+with the columns extracted from the mapping by extract_provider_fields.py.
+
+Usage:
+    detector = GapDetector(max_silence=300)
+    detector.observe(tracker_id, msg_time)          # for every forwarded packet
+    for job in detector.detect(now=time.time()):
+        queue(job.request(template))                 # template from recovery_template()
+"""
+
+import argparse
+import json
+import random
+import time
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+import yaml
+
+from mapping_engine import OUTPUT_DIR, find_latest_yaml_file
+from mapping_functions import from_epoch_seconds, to_epoch_seconds
+from recovery_replay import REQUEST_TEMPLATE, load_request, request_columns
+
+
+# One request covers at most one day (cURL_reference.json range); longer gaps are split
+MAX_REQUEST_SECONDS = 86400
+
+
+class RecoveryJob(NamedTuple):
+    """One recovery API range for a tracker; gap_seconds is the missing time of the whole merged gap."""
+    tracker_id: str
+    start: float
+    end: float
+    gap_seconds: float
+
+    def request(self, template: Dict[str, Any]) -> Dict[str, Any]:
+        """Raw Data Read payload for this range."""
+        return dict(template, tracker_id=self.tracker_id,
+                    **{'from': from_epoch_seconds(self.start), 'to': from_epoch_seconds(self.end)})
+
+
+class Coverage:
+    """Sorted, disjoint [start, end] intervals of time covered by received packets."""
+
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, start: float):
+        self.starts = [start]
+        self.ends = [start]
+
+    def copy(self) -> 'Coverage':
+        coverage = Coverage.__new__(Coverage)
+        coverage.starts = list(self.starts)
+        coverage.ends = list(self.ends)
+        return coverage
+
+    def add(self, start: float, end: float, max_silence: float) -> None:
+        """Cover [start, end], merging intervals that end up closer than max_silence."""
+        starts, ends = self.starts, self.ends
+        if start >= starts[-1]:
+            if start - ends[-1] <= max_silence:
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+            return
+
+        index = bisect_right(starts, start) - 1
+        if index >= 0 and start - ends[index] <= max_silence:
+            if end > ends[index]:
+                ends[index] = end
+        else:
+            index += 1
+            starts.insert(index, start)
+            ends.insert(index, end)
+        # Absorb following intervals now within reach
+        following = index + 1
+        while following < len(starts) and starts[following] - ends[index] <= max_silence:
+            if ends[following] > ends[index]:
+                ends[index] = ends[following]
+            following += 1
+        del starts[index + 1:following], ends[index + 1:following]
+
+    def prune(self, before: float) -> None:
+        """
+        Forget intervals ending before `before`, except the last of them.
+
+        The kept interval bounds a gap that may straddle `before`; the last
+        interval is always kept.
+        """
+        drop = bisect_right(self.ends, before, 0, len(self.ends) - 1) - 1
+        if drop > 0:
+            del self.starts[:drop], self.ends[:drop]
+
+
+class GapDetector:
+    """
+    Online per-tracker gap detection producing recovery jobs.
+
+    Args:
+        max_silence: Seconds without packets that count as a gap
+        merge_seconds: Gaps separated by less coverage than this are recovered as one range
+        max_request_seconds: Longest range per recovery request
+        retention_seconds: Gaps older than this (relative to detect's `now`) are not recovered
+        include_open: Also recover from the last packet to `now` for silent trackers
+    """
+
+    def __init__(
+        self,
+        max_silence: float = 300.0,
+        merge_seconds: float = 600.0,
+        max_request_seconds: float = MAX_REQUEST_SECONDS,
+        retention_seconds: float = 7 * 86400,
+        include_open: bool = True,
+    ):
+        self.max_silence = max_silence
+        self.merge_seconds = merge_seconds
+        self.max_request_seconds = max_request_seconds
+        self.retention_seconds = retention_seconds
+        self.include_open = include_open
+        self.trackers: Dict[str, Coverage] = {}
+        # Received packets only (claims excluded); same object as trackers[id] until the first claim
+        self.received: Dict[str, Coverage] = {}
+        self.packets = 0
+
+    def observe(self, tracker_id: Any, timestamp: Any) -> None:
+        """Record one received packet (timestamp in epoch seconds or ISO 8601)."""
+        moment = timestamp if isinstance(timestamp, (int, float)) else to_epoch_seconds(timestamp)
+        if moment is None:
+            return
+        self.packets += 1
+        received = self.received.get(tracker_id)
+        if received is None:
+            received = self.received[tracker_id] = Coverage(moment)
+        else:
+            received.add(moment, moment, self.max_silence)
+        coverage = self.trackers.get(tracker_id)
+        if coverage is None:
+            self.trackers[tracker_id] = received
+        elif coverage is not received:
+            coverage.add(moment, moment, self.max_silence)
+
+    def claim(self, tracker_id: Any, start: float, end: float) -> None:
+        """Mark a range as covered (queued for recovery, or recovered by other means)."""
+        self._claimed_coverage(tracker_id, start).add(start, end, self.max_silence)
+
+    def _claimed_coverage(self, tracker_id: Any, start: float) -> Coverage:
+        """Detection coverage of a tracker, unshared from its received intervals before a claim."""
+        coverage = self.trackers.get(tracker_id)
+        if coverage is None:
+            coverage = self.trackers[tracker_id] = Coverage(start)
+        elif coverage is self.received.get(tracker_id):
+            coverage = self.trackers[tracker_id] = coverage.copy()
+        return coverage
+
+    def boundaries(self, tracker_id: Any, now: Optional[float] = None) -> Optional[Dict[str, Optional[float]]]:
+        """
+        Latest gap in received packets of a tracker (claimed ranges are not received).
+
+        last_packet_loss is the end of the interval before the gap and
+        last_packet_received the start of the next one, or `now` while the
+        tracker is still silent; both None without a gap. last_packet is the
+        latest packet received.
+        """
+        received = self.received.get(tracker_id)
+        if received is None:
+            return None
+        last_packet = received.ends[-1]
+        if now is not None and now - last_packet > self.max_silence:
+            last_loss, last_received = last_packet, now
+        elif len(received.ends) > 1:
+            last_loss, last_received = received.ends[-2], received.starts[-1]
+        else:
+            last_loss = last_received = None
+        return {'last_packet_loss': last_loss, 'last_packet_received': last_received, 'last_packet': last_packet}
+
+    def gaps(self, tracker_id: Any, now: Optional[float] = None, horizon: Optional[float] = None) -> List[List[float]]:
+        """Merged [start, end, missing seconds] gap ranges of one tracker, clipped to start at `horizon`."""
+        coverage = self.trackers.get(tracker_id)
+        if coverage is None:
+            return []
+        starts, ends = coverage.starts, coverage.ends
+        edges = list(zip(ends, starts[1:]))
+        if self.include_open and now is not None and now - ends[-1] > self.max_silence:
+            edges.append((ends[-1], now))
+        if horizon is not None:
+            edges = [(max(start, horizon), end) for start, end in edges if end > horizon]
+
+        merged: List[List[float]] = []
+        for start, end in edges:
+            if merged and start - merged[-1][1] < self.merge_seconds:
+                merged[-1][1] = end
+                merged[-1][2] += end - start
+            else:
+                merged.append([start, end, end - start])
+        return merged
+
+    def detect(self, now: float, claim: bool = True) -> List[RecoveryJob]:
+        """Recovery jobs for every tracker's gaps, largest gap first; emitted ranges are claimed."""
+        horizon = now - self.retention_seconds
+        jobs: List[RecoveryJob] = []
+        for tracker_id, coverage in self.trackers.items():
+            coverage.prune(horizon)
+            received = self.received.get(tracker_id)
+            if received is not None and received is not coverage:
+                received.prune(horizon)
+            if len(coverage.starts) == 1 and (not self.include_open or now - coverage.ends[-1] <= self.max_silence):
+                continue
+            for start, end, missing in self.gaps(tracker_id, now, horizon):
+                cursor = start
+                while cursor < end:
+                    chunk_end = min(cursor + self.max_request_seconds, end)
+                    jobs.append(RecoveryJob(str(tracker_id), cursor, chunk_end, missing))
+                    cursor = chunk_end
+                if claim and end > start:
+                    coverage = self._claimed_coverage(tracker_id, start)
+                    coverage.add(start, end, self.max_silence)
+        # Largest gaps first; chunks of one gap stay in chronological order
+        jobs.sort(key=lambda job: (-job.gap_seconds, job.tracker_id, job.start))
+        return jobs
+
+    def footprint(self) -> Dict[str, int]:
+        """Trackers and intervals held (received intervals counted once while shared)."""
+        unshared = [received for tracker_id, received in self.received.items()
+                    if received is not self.trackers.get(tracker_id)]
+        return {'trackers': len(self.trackers),
+                'intervals': sum(len(coverage.starts) for coverage in self.trackers.values())
+                + sum(len(received.starts) for received in unshared)}
+
+
+def recovery_template(yaml_data: Dict[str, Any], request_path: Path = REQUEST_TEMPLATE) -> Dict[str, Any]:
+    """Request payload template with the columns the mapping needs (extract_provider_fields)."""
+    template = load_request(request_path)
+    template['columns'] = request_columns({}, yaml_data)
+    template['yaml_config_version'] = yaml_data.get('version')
+    return template
+
+
+def reference_gaps(timestamps: Iterable[float], detector: GapDetector, now: float) -> List[List[float]]:
+    """Gaps from the sorted full timestamp list (used to check the online interval sets)."""
+    ordered = sorted(timestamps)
+    coverage = Coverage(ordered[0])
+    for moment in ordered[1:]:
+        coverage.add(moment, moment, detector.max_silence)
+    scratch = GapDetector(detector.max_silence, detector.merge_seconds, include_open=detector.include_open)
+    scratch.trackers['t'] = coverage
+    return scratch.gaps('t', now)
+
+
+def reference_boundaries(timestamps: Iterable[float], max_silence: float, now: float) -> Dict[str, Optional[float]]:
+    """boundaries() from the sorted full timestamp list."""
+    ordered = sorted(timestamps)
+    last_loss = last_received = None
+    if now - ordered[-1] > max_silence:
+        last_loss, last_received = ordered[-1], now
+    else:
+        for previous, moment in zip(ordered, ordered[1:]):
+            if moment - previous > max_silence:
+                last_loss, last_received = previous, moment
+    return {'last_packet_loss': last_loss, 'last_packet_received': last_received, 'last_packet': ordered[-1]}
+
+
+def main():
+    """Detect gaps in a synthetic fleet stream with outages and late packets."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('yaml_file', nargs='?', type=Path, help='Mapping YAML for the request columns (default: latest in output/)')
+    parser.add_argument('--trackers', type=int, default=100_000, help='Trackers in the synthetic fleet')
+    parser.add_argument('--packets', type=int, default=40, help='Packets per tracker')
+    parser.add_argument('--interval', type=float, default=30.0, help='Seconds between packets')
+    parser.add_argument('--output', type=Path, help='Write recovery request payloads as JSON Lines')
+    args = parser.parse_args()
+
+    yaml_file = args.yaml_file or find_latest_yaml_file(OUTPUT_DIR)
+    with open(yaml_file, 'r', encoding='utf-8') as f:
+        template = recovery_template(yaml.safe_load(f))
+
+    rng = random.Random(11)
+    start_time = to_epoch_seconds('2025-11-26T00:00:00Z')
+    # 5% of trackers lose a run of packets, 1% go silent before the end; 2% of packets arrive late
+    stream = []
+    history: Dict[str, List[float]] = {}
+    for tracker in range(args.trackers):
+        tracker_id = str(3312229 + tracker)
+        lost = range(0)
+        draw = rng.random()
+        if draw < 0.05:
+            first = rng.randrange(1, args.packets - 1)
+            lost = range(first, first + rng.randrange(5, args.packets // 2))
+        elif draw < 0.06:
+            lost = range(rng.randrange(1, args.packets), args.packets)
+        offset = start_time + rng.random() * args.interval
+        moments = [offset + index * args.interval for index in range(args.packets) if index not in lost]
+        stream.extend((tracker_id, moment) for moment in moments)
+        history[tracker_id] = moments
+    late = [index for index in range(len(stream)) if rng.random() < 0.02]
+    for index in late:
+        swap = min(len(stream) - 1, index + rng.randrange(1, 2000))
+        stream[index], stream[swap] = stream[swap], stream[index]
+
+    detector = GapDetector(max_silence=args.interval * 4)
+    begin = time.perf_counter()
+    for tracker_id, moment in stream:
+        detector.observe(tracker_id, moment)
+    observe_seconds = time.perf_counter() - begin
+    now = start_time + args.packets * args.interval
+
+    begin = time.perf_counter()
+    jobs = detector.detect(now, claim=False)
+    detect_seconds = time.perf_counter() - begin
+    footprint = detector.footprint()
+
+    print(f"Observed {len(stream):,} packets from {args.trackers:,} trackers: "
+          f"{len(stream) / observe_seconds:,.0f} packets/s ({len(late):,} out of order)")
+    print(f"Intervals held: {footprint['intervals']:,} ({footprint['intervals'] / footprint['trackers']:.2f} per tracker)")
+    print(f"detect(): {len(jobs):,} recovery jobs in {detect_seconds * 1000:.0f} ms "
+          f"({len({job.tracker_id for job in jobs}):,} trackers)")
+    for job in jobs[:5]:
+        print(f"  {job.tracker_id}: {from_epoch_seconds(job.start)} -> {from_epoch_seconds(job.end)} "
+              f"(gap {job.gap_seconds / 3600:.1f} h)")
+    print(f"Request columns: {len(template['columns'])} (mapping {template['yaml_config_version']})")
+
+    checked = rng.sample(sorted(history), min(2000, len(history)))
+    mismatches = sum(1 for tracker_id in checked
+                     if detector.gaps(tracker_id, now) != reference_gaps(history[tracker_id], detector, now))
+    print(f"Mismatches vs sorted-stream gaps ({len(checked)} trackers): {mismatches}")
+
+    requeued = detector.detect(now)
+    print(f"After claiming: {len(detector.detect(now)):,} jobs left (claimed {len(requeued):,})")
+    boundary_mismatches = sum(1 for tracker_id in checked
+                              if detector.boundaries(tracker_id, now)
+                              != reference_boundaries(history[tracker_id], detector.max_silence, now))
+    print(f"Boundary mismatches after claiming ({len(checked)} trackers): {boundary_mismatches}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for job in jobs:
+                f.write(json.dumps(job.request(template)) + '\n')
+        print(f"Requests written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
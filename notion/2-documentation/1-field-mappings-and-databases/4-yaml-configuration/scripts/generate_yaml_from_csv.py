@@ -7,35 +7,34 @@ an optimized YAML configuration file following the specifications in
 yaml-mapping-reference.yaml.
 """
 
+import argparse
 import csv
+import hashlib
+import heapq
 import json
 import re
 import yaml
 from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from collections import OrderedDict
+
+from mapping_artifact import artifact_path_for, build_artifact_payload, read_version_hash, write_artifact
+from validate_yaml import ProviderCatalog, find_latest_csv, validate_mapping
 
 
 # Paths
 SCRIPT_DIR = Path(__file__).parent
 EXPORT_DIR = SCRIPT_DIR.parent.parent / "3-mapping-fields" / "export"
 OUTPUT_DIR = SCRIPT_DIR.parent / "output"
+CACHE_DIR = OUTPUT_DIR / ".generation-cache"
 
 # Ensure output directory exists
 OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 
 def find_most_recent_csv() -> Optional[Path]:
-    """Find the most recent CSV file matching the pattern."""
-    pattern = "Mapping Fields (db) *.csv"
-    csv_files = list(EXPORT_DIR.glob("Mapping Fields (db) *.csv"))
-    
-    if not csv_files:
-        return None
-    
-    # Return the most recently modified file
-    return max(csv_files, key=lambda p: p.stat().st_mtime)
+    """Find the most recent CSV export by the date in its filename (same choice as validate_yaml.py)."""
+    return find_latest_csv(EXPORT_DIR)
 
 
 def extract_field_name(notion_link: str) -> str:
@@ -395,45 +394,274 @@ def process_csv_row(row: Dict, provider: str) -> Optional[tuple]:
     return (field_name, optimized, field_path, computation_approach, deps)
 
 
-def order_mappings_by_dependencies(entries: List[Dict]) -> List[str]:
-    """Topologically sort mappings by parameters.fleeti dependencies."""
-    name_to_entry = {e['name']: e for e in entries}
+class DependencyCycleError(ValueError):
+    """Raised when parameters.fleeti dependencies contain a cycle.
+
+    Attributes:
+        cycles: Strongly connected components (lists of field names, in
+            CSV order) that form the cycles
+        blocked: Field names that cannot be ordered because they depend
+            (directly or transitively) on a cycle
+    """
+
+    def __init__(self, cycles: List[List[str]], blocked: List[str]):
+        self.cycles = cycles
+        self.blocked = blocked
+        details = '; '.join(f"[{', '.join(cycle)}]" for cycle in cycles)
+        message = f"Dependency cycle detected in parameters.fleeti between: {details}."
+        if blocked:
+            message += f" {len(blocked)} dependent mapping(s) blocked: {', '.join(blocked)}."
+        super().__init__(message + " Aborting YAML generation.")
+
+
+def build_dependency_graph(entries: List[Dict]) -> tuple:
+    """Return (deps_map, reverse_deps, order_index) restricted to known, non-self dependencies."""
     order_index = {e['name']: e['order'] for e in entries}
 
     deps_map = {}
     reverse_deps = {}
-    in_degree = {}
-
-    for name, entry in name_to_entry.items():
-        deps = [d for d in entry['deps'] if d in name_to_entry and d != name]
+    for entry in entries:
+        name = entry['name']
+        deps = [d for d in entry['deps'] if d in order_index and d != name]
         deps_map[name] = deps
-        in_degree[name] = len(deps)
         for dep in deps:
             reverse_deps.setdefault(dep, []).append(name)
 
-    available = [name for name, deg in in_degree.items() if deg == 0]
-    available.sort(key=lambda n: order_index[n])
+    return deps_map, reverse_deps, order_index
+
+
+def find_strongly_connected_components(nodes: List[str], deps_map: Dict[str, List[str]]) -> List[List[str]]:
+    """Tarjan's algorithm (iterative) over the given nodes; returns components with more than one node."""
+    index_of = {}
+    lowlink = {}
+    on_stack = set()
+    stack = []
+    components = []
+    node_set = set(nodes)
+    counter = 0
+
+    for root in nodes:
+        if root in index_of:
+            continue
+        work = [(root, iter(deps_map.get(root, [])))]
+        index_of[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            node, children = work[-1]
+            advanced = False
+            for child in children:
+                if child not in node_set:
+                    continue
+                if child not in index_of:
+                    index_of[child] = lowlink[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(deps_map.get(child, []))))
+                    advanced = True
+                    break
+                if child in on_stack:
+                    lowlink[node] = min(lowlink[node], index_of[child])
+            if advanced:
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index_of[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                if len(component) > 1:
+                    components.append(component)
+
+    return components
+
+
+def sort_dependency_graph(entries: List[Dict]) -> tuple:
+    """
+    Kahn's algorithm with a heap keyed on CSV order.
+
+    Returns (ordered_names, levels) where levels maps each name to its
+    dependency depth (0 = no parameters.fleeti dependencies, otherwise
+    1 + deepest dependency). Among mappings whose dependencies are
+    satisfied, the one that appears first in the CSV is emitted first.
+
+    Raises:
+        DependencyCycleError: If the dependencies contain a cycle
+    """
+    deps_map, reverse_deps, order_index = build_dependency_graph(entries)
+    in_degree = {name: len(deps) for name, deps in deps_map.items()}
+    levels = {}
+
+    available = [(order_index[name], name) for name, deg in in_degree.items() if deg == 0]
+    heapq.heapify(available)
+    for _, name in available:
+        levels[name] = 0
 
     ordered = []
     while available:
-        name = available.pop(0)
+        _, name = heapq.heappop(available)
         ordered.append(name)
+        level = levels[name] + 1
         for dependent in reverse_deps.get(name, []):
+            if levels.get(dependent, 0) < level:
+                levels[dependent] = level
             in_degree[dependent] -= 1
             if in_degree[dependent] == 0:
-                insert_at = 0
-                while insert_at < len(available) and order_index[available[insert_at]] <= order_index[dependent]:
-                    insert_at += 1
-                available.insert(insert_at, dependent)
+                heapq.heappush(available, (order_index[dependent], dependent))
 
     if len(ordered) != len(entries):
-        raise ValueError("Dependency ordering incomplete (cycle detected). Aborting YAML generation.")
+        remaining = sorted((n for n, deg in in_degree.items() if deg > 0), key=order_index.get)
+        cycles = [
+            sorted(component, key=order_index.get)
+            for component in find_strongly_connected_components(remaining, deps_map)
+        ]
+        cycles.sort(key=lambda component: order_index[component[0]])
+        in_cycle = {name for component in cycles for name in component}
+        raise DependencyCycleError(cycles, [n for n in remaining if n not in in_cycle])
+
+    return ordered, levels
+
 
+def order_mappings_by_dependencies(entries: List[Dict]) -> List[str]:
+    """Topologically sort mappings by parameters.fleeti dependencies (CSV order as tiebreak)."""
+    ordered, _ = sort_dependency_graph(entries)
     return ordered
 
 
-def generate_yaml_config(csv_path: Path) -> Path:
-    """Generate YAML configuration from CSV file."""
+def group_by_dependency_level(entries: List[Dict]) -> List[List[str]]:
+    """
+    Group mappings into dependency levels.
+
+    Level N only depends on levels < N, so the mappings inside one level
+    are independent of each other and can be evaluated in parallel. Each
+    level keeps the topological (CSV tiebreak) order.
+    """
+    ordered, levels = sort_dependency_graph(entries)
+    grouped: List[List[str]] = []
+    for name in ordered:
+        level = levels[name]
+        while len(grouped) <= level:
+            grouped.append([])
+        grouped[level].append(name)
+    return grouped
+
+
+def render_mapping_fragment(field_name: str, yaml_entry: Dict, field_path: str, computation_approach: str) -> str:
+    """Render one mapping entry (with Field Path / Computation Approach comments) as YAML text."""
+    yaml_lines = []
+    # Add field name
+    yaml_lines.append(f'  {field_name}:')
+
+    # Generate YAML for the entry (without the field name)
+    entry_yaml = yaml.dump(
+        yaml_entry,
+        default_flow_style=False,
+        sort_keys=False,
+        allow_unicode=True,
+        indent=2,
+        width=1000
+    )
+
+    # Indent all lines by 4 spaces (2 for mappings level + 2 for field level)
+    for line in entry_yaml.split('\n'):
+        if line.strip():  # Skip empty lines
+            yaml_lines.append('    ' + line)
+
+    # Add comments at the end (after all properties)
+    if field_path:
+        yaml_lines.append(f'    # Field Path: {field_path}')
+
+    if computation_approach:
+        comp_lines = computation_approach.split('\n')
+        for i, line in enumerate(comp_lines):
+            if i == 0:
+                yaml_lines.append(f'    # Computation Approach: {line}')
+            else:
+                yaml_lines.append(f'    # {line}')
+
+    yaml_lines.append('')  # Empty line between fields
+    return '\n'.join(yaml_lines)
+
+
+def hash_csv_row(row: Dict, provider: str) -> str:
+    """Content hash of a CSV row (plus provider), used as incremental cache key."""
+    payload = json.dumps([provider, sorted(row.items(), key=lambda item: str(item[0]))], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def hash_dependency_graph(entries: List[Dict]) -> str:
+    """Hash of (name, deps, order) for all entries; ordering only changes when this does."""
+    payload = json.dumps([[e['name'], e['deps'], e['order']] for e in entries])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def generator_fingerprint() -> str:
+    """Hash of this script; a cache written by different generator code is discarded."""
+    return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+
+def validation_fingerprint() -> List[List[Any]]:
+    """
+    (path, size, mtime) of everything validation and the artifact depend on
+    besides the rows: the catalog files ProviderCatalog.load() reads and the
+    validator, function registry and artifact modules.
+    """
+    modules = [SCRIPT_DIR / name for name in ('validate_yaml.py', 'mapping_functions.py', 'mapping_artifact.py')]
+    return [
+        [str(path), path.stat().st_size, path.stat().st_mtime_ns]
+        for path in ProviderCatalog.source_files() + modules
+    ]
+
+
+def load_generation_cache(cache_path: Path) -> Dict:
+    """Load the incremental cache, or an empty one if missing, corrupt or stale."""
+    empty = {'generator': generator_fingerprint(), 'rows': {}, 'order': None}
+    if not cache_path.exists():
+        return empty
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: Ignoring unreadable cache {cache_path.name}: {e}")
+        return empty
+    if cache.get('generator') != empty['generator']:
+        print("Generator changed since last run, rebuilding cache")
+        return empty
+    return cache
+
+
+def save_generation_cache(cache_path: Path, cache: Dict) -> None:
+    """Write the incremental cache atomically."""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    tmp_path.replace(cache_path)
+
+
+def generate_yaml_config(csv_path: Path, incremental: bool = False, cache_dir: Path = CACHE_DIR) -> Path:
+    """
+    Generate YAML configuration from CSV file.
+
+    With incremental=True, rows are keyed by content hash in a per-provider
+    cache under cache_dir (optimized entry + rendered YAML fragment). Only
+    new or changed rows are re-parsed and re-dumped, the dependency sort is
+    reused unless names/order/parameters.fleeti changed, and the output is
+    spliced from cached fragments. The output is identical to a full run.
+    When every row and the order are reused and the previous outputs and
+    validation inputs (catalog files, validator modules) are unchanged, validation and the artifact write are
+    skipped (the cached validation summary is printed).
+    """
     print("=== YAML GENERATION ===")
     print(f"CSV file: {csv_path.name}")
     print("Reading CSV...")
@@ -451,105 +679,148 @@ def generate_yaml_config(csv_path: Path) -> Path:
     provider = rows[0].get('Provider', 'navixy').strip().lower()
     if not provider:
         provider = 'navixy'
+
+    cache_path = cache_dir / f"{provider}-generation-cache.json"
+    cache = load_generation_cache(cache_path) if incremental else None
+    cached_rows = cache['rows'] if cache else {}
+    next_rows = {}
+    reused = 0
     
     # Process rows
-    mappings = OrderedDict()
-    comments_dict = {}  # Store comments separately
     entries_by_name = {}
     
     for row in rows:
-        result = process_csv_row(row, provider)
+        row_key = hash_csv_row(row, provider) if incremental else None
+        cached = cached_rows.get(row_key) if incremental else None
+        if cached is not None:
+            reused += 1
+            next_rows[row_key] = cached
+            result = cached['entry']
+        else:
+            result = process_csv_row(row, provider)
+            if result:
+                field_name, yaml_entry, field_path, computation_approach, deps = result
+                result = {
+                    'name': field_name,
+                    'yaml_entry': yaml_entry,
+                    'deps': deps,
+                    'field_path': field_path,
+                    'fragment': render_mapping_fragment(field_name, yaml_entry, field_path, computation_approach)
+                }
+            if incremental:
+                next_rows[row_key] = {'entry': result}
+
         if result:
-            field_name, yaml_entry, field_path, computation_approach, deps = result
+            field_name = result['name']
             if field_name in entries_by_name:
                 print(f"Warning: Duplicate Fleeti field '{field_name}' found. Using last occurrence.")
-            entries_by_name[field_name] = {
-                'name': field_name,
-                'yaml_entry': yaml_entry,
-                'field_path': field_path,
-                'computation_approach': computation_approach,
-                'deps': deps,
-                'order': len(entries_by_name)
-            }
+            entries_by_name[field_name] = dict(result, order=len(entries_by_name))
 
     entries = list(entries_by_name.values())
-    ordered_names = order_mappings_by_dependencies(entries)
-    for name in ordered_names:
-        entry = entries_by_name[name]
-        mappings[name] = entry['yaml_entry']
-        comments_dict[name] = {
-            'field_path': entry['field_path'],
-            'computation_approach': entry['computation_approach']
-        }
-    
-    # Build final YAML structure
-    yaml_config = OrderedDict([
-        ('version', '1.0.0'),
-        ('provider', provider),
-        ('mappings', mappings)
-    ])
-    
+    graph_hash = hash_dependency_graph(entries)
+    cached_order = cache.get('order') if cache else None
+    if cached_order and cached_order['graph'] == graph_hash:
+        ordered_names = cached_order['names']
+        print("Dependencies unchanged, reusing mapping order")
+    else:
+        ordered_names, _ = sort_dependency_graph(entries)
+
     # Generate output filename with date
     today = datetime.now().strftime('%Y-%m-%d')
     output_filename = f"{provider}-mapping-{today}.yaml"
     output_path = OUTPUT_DIR / output_filename
+    artifact_path = artifact_path_for(output_path)
+
+    # Full cache hit: same rows, same order, and the last run's outputs and
+    # validation inputs are untouched, so validation and the artifact would
+    # come out identical
+    previous = None
+    if incremental:
+        print(f"Rows reused from cache: {reused}/{len(rows)} ({len(rows) - reused} reprocessed)")
+        previous = cache.get('outputs')
+        if not (next_rows.keys() == cached_rows.keys() and cached_order and cached_order['graph'] == graph_hash
+                and previous and previous['yaml'] == output_filename and output_path.exists()
+                and read_version_hash(artifact_path) == previous['version_hash']
+                and previous['inputs'] == validation_fingerprint()):
+            previous = None
+        cache['rows'] = next_rows
+        cache['order'] = {'graph': graph_hash, 'names': ordered_names}
     
     # Generate YAML string with comments
-    # Since PyYAML doesn't support comments well, we'll generate the YAML
-    # and then manually add comments by post-processing
+    # Since PyYAML doesn't support comments well, each entry is dumped
+    # separately and its comments appended (see render_mapping_fragment)
     yaml_lines = []
     yaml_lines.append('version: "1.0.0"')
     yaml_lines.append(f'provider: "{provider}"')
     yaml_lines.append('')
     yaml_lines.append('mappings:')
     
-    # Process each mapping with comments
-    for field_name, yaml_entry in mappings.items():
-        # Add field name
-        yaml_lines.append(f'  {field_name}:')
-        
-        # Generate YAML for the entry (without the field name)
-        entry_yaml = yaml.dump(
-            yaml_entry,
-            default_flow_style=False,
-            sort_keys=False,
-            allow_unicode=True,
-            indent=2,
-            width=1000
-        )
-        
-        # Indent all lines by 4 spaces (2 for mappings level + 2 for field level)
-        for line in entry_yaml.split('\n'):
-            if line.strip():  # Skip empty lines
-                yaml_lines.append('    ' + line)
-        
-        # Add comments at the end (after all properties)
-        comments = comments_dict.get(field_name, {})
-        if comments.get('field_path'):
-            yaml_lines.append(f'    # Field Path: {comments["field_path"]}')
-        
-        if comments.get('computation_approach'):
-            comp_lines = comments['computation_approach'].split('\n')
-            for i, line in enumerate(comp_lines):
-                if i == 0:
-                    yaml_lines.append(f'    # Computation Approach: {line}')
-                else:
-                    yaml_lines.append(f'    # {line}')
-        
-        yaml_lines.append('')  # Empty line between fields
+    # Splice each mapping fragment in dependency order
+    for field_name in ordered_names:
+        yaml_lines.append(entries_by_name[field_name]['fragment'])
     
     # Write to file
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write('\n'.join(yaml_lines))
     
     print(f"Generated YAML file: {output_path}")
-    print(f"Processed {len(mappings)} mappings")
+    print(f"Processed {len(ordered_names)} mappings")
+
+    if previous is not None:
+        print(f"Validation: {previous['validation']} (unchanged, cached)")
+        print(f"Artifact unchanged: {artifact_path} (version hash {previous['version_hash'][:16]})")
+        save_generation_cache(cache_path, cache)
+        return output_path
+
+    # In-process validation of the generated mappings against the same CSV rows
+    report = validate_mapping(
+        {'version': '1.0.0', 'provider': provider,
+         'mappings': {name: entries_by_name[name]['yaml_entry'] for name in ordered_names}},
+        rows,
+        file=str(output_path),
+        csv_file=str(csv_path),
+        catalog=ProviderCatalog.load()
+    )
+    validation = (f"{'VALID' if report['valid'] else 'INVALID'} "
+                  f"({report['error_count']} errors, {report['warning_count']} warnings)")
+    print(f"Validation: {validation}")
+    for issue in report['issues']:
+        if issue['severity'] == 'error':
+            print(f"  {issue['code']}: {issue['field']}: {issue['message']}")
+
+    # Precompiled artifact for fast worker startup (same stem, .mapc)
+    payload = build_artifact_payload(
+        provider,
+        '1.0.0',
+        ordered_names,
+        {name: entries_by_name[name]['yaml_entry'] for name in ordered_names},
+        {
+            entries_by_name[name]['field_path'].replace('[]', ''): name
+            for name in ordered_names if entries_by_name[name]['field_path']
+        }
+    )
+    version_hash = write_artifact(artifact_path, payload)
+    print(f"Generated artifact: {artifact_path} (version hash {version_hash[:16]})")
+
+    if incremental:
+        cache['outputs'] = {
+            'yaml': output_filename,
+            'version_hash': version_hash,
+            'validation': validation,
+            'inputs': validation_fingerprint()
+        }
+        save_generation_cache(cache_path, cache)
     
     return output_path
 
 
 def main():
     """Main entry point."""
+    parser = argparse.ArgumentParser(description="Generate YAML configuration from Mapping Fields CSV")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"Reuse unchanged rows from the generation cache ({CACHE_DIR})")
+    args = parser.parse_args()
+
     # Find most recent CSV file
     csv_path = find_most_recent_csv()
     if not csv_path:
@@ -560,7 +831,7 @@ def main():
     print(f"Using CSV: {csv_path.name}")
     
     # Generate YAML
-    output_path = generate_yaml_config(csv_path)
+    output_path = generate_yaml_config(csv_path, incremental=args.incremental)
     print(f"Generated YAML: {output_path.name}")
     print("=== DONE ===")
 
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Geofence Index - Cell-Covered Polygons for derive_geofences
+
+`geofences[]` lists every customer geofence containing the packet location.
+Testing the point against every polygon is the most expensive per-packet
+step; this index answers it with a handful of hash lookups:
+
+- Cells are a lat/lng quadtree (level L = 360 / 2^L degree squares, keyed by
+  one integer). Each polygon is covered starting at the level where its
+  bounding box spans at most 2x2 cells, refined `refine_levels` times where
+  the outline crosses the cell.
+- Cells the outline does not cross are interior (no polygon test needed) or
+  dropped (outside); only the finest boundary cells keep an exact
+  point-in-polygon test.
+- A lookup probes one cell per level in use; cells of a polygon never
+  overlap, so each geofence is reported at most once.
+- add() / remove() only touch the cells of that geofence, so customer edits
+  update the index in place.
+
+GeofenceCatalog keeps one index per customer and each asset's previous
+geofence set, turning lookups into enter / exit transitions. Polygons are
+rings of (lat, lng) vertices and must not cross the antimeridian.
+
+Usage:
+    catalog = GeofenceCatalog()
+    catalog.upsert(customer, Geofence(42, 'Warehouse', [(lat, lng), ...]))
+    context['geofences'] = catalog.index(customer)      # read by derive_geofences
+    transition = catalog.update_asset(asset_id, customer, lat, lng)
+"""
+
+import argparse
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, FrozenSet, Hashable, List, NamedTuple, Optional, Sequence, Tuple
+
+from mapping_functions import FUNCTION_REGISTRY
+
+
+MAX_LEVEL = 24          # ~2.4 m cells at the equator
+REFINE_LEVELS = 2       # boundary cells are 1/4 of the starting cell
+LEVEL_SHIFT = 52
+ROW_SHIFT = 26
+
+Edge = Tuple[float, float, float, float]
+EMPTY_CELL: Tuple[tuple, tuple] = ((), ())
+
+
+def cell_key(level: int, ix: int, iy: int) -> int:
+    return (level << LEVEL_SHIFT) | (iy << ROW_SHIFT) | ix
+
+
+def segment_crosses_rect(edge: Edge, rx0: float, ry0: float, rx1: float, ry1: float) -> bool:
+    """Whether the segment touches the closed rectangle (Liang-Barsky clipping)."""
+    x0, y0, x1, y1 = edge
+    if (x0 < rx0 and x1 < rx0) or (x0 > rx1 and x1 > rx1) or (y0 < ry0 and y1 < ry0) or (y0 > ry1 and y1 > ry1):
+        return False
+    dx = x1 - x0
+    dy = y1 - y0
+    t0, t1 = 0.0, 1.0
+    for p, q in ((-dx, x0 - rx0), (dx, rx1 - x0), (-dy, y0 - ry0), (dy, ry1 - y0)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        r = q / p
+        if p < 0:
+            if r > t1:
+                return False
+            if r > t0:
+                t0 = r
+        else:
+            if r < t0:
+                return False
+            if r < t1:
+                t1 = r
+    return True
+
+
+# ============================================================================
+# Geofences and the per-customer index
+# ============================================================================
+
+class Geofence:
+    """Polygon geofence; `points` is a ring of (lat, lng) vertices (closing vertex optional)."""
+
+    __slots__ = ('geofence_id', 'name', 'xs', 'ys', 'min_x', 'min_y', 'max_x', 'max_y')
+
+    def __init__(self, geofence_id: Hashable, name: str, points: Sequence[Tuple[float, float]]):
+        if len(points) > 1 and tuple(points[0]) == tuple(points[-1]):
+            points = points[:-1]
+        if len(points) < 3:
+            raise ValueError(f"Geofence {geofence_id}: a polygon needs at least 3 vertices")
+        self.geofence_id = geofence_id
+        self.name = name
+        self.xs = [float(lng) for _, lng in points]
+        self.ys = [float(lat) for lat, _ in points]
+        self.min_x, self.max_x = min(self.xs), max(self.xs)
+        self.min_y, self.max_y = min(self.ys), max(self.ys)
+
+    def contains(self, lat: float, lng: float) -> bool:
+        """Even-odd ray casting."""
+        if lng < self.min_x or lng > self.max_x or lat < self.min_y or lat > self.max_y:
+            return False
+        xs, ys = self.xs, self.ys
+        inside = False
+        j = len(xs) - 1
+        for i in range(len(xs)):
+            yi, yj = ys[i], ys[j]
+            if (yi > lat) != (yj > lat) and lng < (xs[j] - xs[i]) * (lat - yi) / (yj - yi) + xs[i]:
+                inside = not inside
+            j = i
+        return inside
+
+    def edges(self) -> List[Edge]:
+        xs, ys = self.xs, self.ys
+        return [(xs[i - 1], ys[i - 1], xs[i], ys[i]) for i in range(len(xs))]
+
+    def info(self) -> Dict[str, Any]:
+        return {'geofence_id': self.geofence_id, 'geofence_name': self.name}
+
+
+def cover(geofence: Geofence, refine_levels: int = REFINE_LEVELS) -> List[Tuple[int, bool]]:
+    """Quadtree cells covering the polygon as (cell key, interior) pairs; cells are disjoint."""
+    extent = max(geofence.max_x - geofence.min_x, geofence.max_y - geofence.min_y, 1e-9)
+    start = min(max(int(math.floor(math.log2(360.0 / extent))), 0), MAX_LEVEL - refine_levels)
+    finest = start + refine_levels
+    cells: List[Tuple[int, bool]] = []
+
+    def refine(level: int, ix: int, iy: int, edges: List[Edge]) -> None:
+        size = 360.0 / (1 << level)
+        rx0 = ix * size - 180.0
+        ry0 = iy * size - 90.0
+        rx1 = rx0 + size
+        ry1 = ry0 + size
+        crossing = [edge for edge in edges if segment_crosses_rect(edge, rx0, ry0, rx1, ry1)]
+        if not crossing:
+            if geofence.contains(ry0 + size / 2, rx0 + size / 2):
+                cells.append((cell_key(level, ix, iy), True))
+            return
+        if level == finest:
+            cells.append((cell_key(level, ix, iy), False))
+            return
+        for dx in (0, 1):
+            for dy in (0, 1):
+                refine(level + 1, 2 * ix + dx, 2 * iy + dy, crossing)
+
+    size = 360.0 / (1 << start)
+    edges = geofence.edges()
+    for ix in range(int((geofence.min_x + 180.0) / size), int((geofence.max_x + 180.0) / size) + 1):
+        for iy in range(int((geofence.min_y + 90.0) / size), int((geofence.max_y + 90.0) / size) + 1):
+            refine(start, ix, iy, edges)
+    return cells
+
+
+class GeofenceIndex:
+    """
+    Cell index over one customer's geofences.
+
+    Args:
+        refine_levels: Quadtree levels below a polygon's starting level used
+            to narrow its boundary cells (more levels: fewer exact tests, more cells)
+    """
+
+    def __init__(self, refine_levels: int = REFINE_LEVELS):
+        self.refine_levels = refine_levels
+        self.geofences: Dict[Hashable, Geofence] = {}
+        # cell key -> (ids of geofences covering the whole cell, geofences crossing it)
+        self.cells: Dict[int, Tuple[Tuple[Hashable, ...], Tuple[Geofence, ...]]] = {}
+        self.covers: Dict[Hashable, Tuple[int, ...]] = {}
+        self.level_cells: Dict[int, int] = {}
+        self.levels: List[Tuple[int, float]] = []
+        self.exact_tests = 0
+        # Lookups may run on several threads (LevelScheduler pool)
+        self._stats_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.geofences)
+
+    def _refresh_levels(self) -> None:
+        self.levels = [(level << LEVEL_SHIFT, (1 << level) / 360.0) for level in sorted(self.level_cells)]
+
+    def add(self, geofence: Geofence) -> None:
+        """Insert or replace a geofence."""
+        if geofence.geofence_id in self.geofences:
+            self.remove(geofence.geofence_id)
+        geofence_id = geofence.geofence_id
+        keys = []
+        new_level = False
+        for key, interior in cover(geofence, self.refine_levels):
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = EMPTY_CELL
+                level = key >> LEVEL_SHIFT
+                new_level |= level not in self.level_cells
+                self.level_cells[level] = self.level_cells.get(level, 0) + 1
+            if interior:
+                self.cells[key] = (cell[0] + (geofence_id,), cell[1])
+            else:
+                self.cells[key] = (cell[0], cell[1] + (geofence,))
+            keys.append(key)
+        self.geofences[geofence_id] = geofence
+        self.covers[geofence_id] = tuple(keys)
+        if new_level:
+            self._refresh_levels()
+
+    def remove(self, geofence_id: Hashable) -> bool:
+        if self.geofences.pop(geofence_id, None) is None:
+            return False
+        dropped_level = False
+        for key in self.covers.pop(geofence_id):
+            interior, boundary = self.cells[key]
+            cell = (tuple(other for other in interior if other != geofence_id),
+                    tuple(other for other in boundary if other.geofence_id != geofence_id))
+            if cell[0] or cell[1]:
+                self.cells[key] = cell
+            else:
+                del self.cells[key]
+                level = key >> LEVEL_SHIFT
+                self.level_cells[level] -= 1
+                if not self.level_cells[level]:
+                    del self.level_cells[level]
+                    dropped_level = True
+        if dropped_level:
+            self._refresh_levels()
+        return True
+
+    def lookup(self, lat: float, lng: float) -> List[Hashable]:
+        """Ids of the geofences containing the point."""
+        x = lng + 180.0
+        y = lat + 90.0
+        cells = self.cells
+        found = []
+        exact_tests = 0
+        for level_bits, scale in self.levels:
+            cell = cells.get(level_bits | (int(y * scale) << ROW_SHIFT) | int(x * scale))
+            if cell is not None:
+                found.extend(cell[0])
+                exact_tests += len(cell[1])
+                for geofence in cell[1]:
+                    if geofence.contains(lat, lng):
+                        found.append(geofence.geofence_id)
+        if exact_tests:
+            with self._stats_lock:
+                self.exact_tests += exact_tests
+        return found
+
+    def geofences_at(self, lat: float, lng: float) -> List[Dict[str, Any]]:
+        """`geofences[]` value: geofence_id / geofence_name of every containing geofence."""
+        geofences = self.geofences
+        return [geofences[geofence_id].info() for geofence_id in sorted(self.lookup(lat, lng), key=str)]
+
+    def footprint(self) -> Dict[str, int]:
+        interior = sum(len(cell[0]) for cell in self.cells.values())
+        entries = interior + sum(len(cell[1]) for cell in self.cells.values())
+        return {'geofences': len(self.geofences), 'cells': len(self.cells), 'entries': entries,
+                'interior_entries': interior, 'levels': len(self.levels)}
+
+
+# ============================================================================
+# Per-customer catalog and enter / exit transitions
+# ============================================================================
+
+class GeofenceTransition(NamedTuple):
+    """Geofences containing an asset after a packet, and the change since its previous packet."""
+    inside: FrozenSet[Hashable]
+    entered: FrozenSet[Hashable]
+    exited: FrozenSet[Hashable]
+
+
+EMPTY: FrozenSet[Hashable] = frozenset()
+
+
+class GeofenceCatalog:
+    """Geofence indexes per customer plus the previous geofence set of every asset."""
+
+    def __init__(self, refine_levels: int = REFINE_LEVELS):
+        self.refine_levels = refine_levels
+        self.indexes: Dict[Hashable, GeofenceIndex] = {}
+        self.previous: Dict[Hashable, FrozenSet[Hashable]] = {}
+
+    def index(self, customer: Hashable) -> GeofenceIndex:
+        index = self.indexes.get(customer)
+        if index is None:
+            index = self.indexes[customer] = GeofenceIndex(self.refine_levels)
+        return index
+
+    def upsert(self, customer: Hashable, geofence: Geofence) -> None:
+        self.index(customer).add(geofence)
+
+    def remove(self, customer: Hashable, geofence_id: Hashable) -> bool:
+        index = self.indexes.get(customer)
+        return index.remove(geofence_id) if index is not None else False
+
+    def update_asset(self, asset_id: Hashable, customer: Hashable,
+                     lat: Optional[float], lng: Optional[float]) -> Optional[GeofenceTransition]:
+        """Look up the asset's location and diff it with its previous geofence set (None without a location)."""
+        if lat is None or lng is None:
+            return None
+        index = self.indexes.get(customer)
+        inside = frozenset(index.lookup(lat, lng)) if index is not None else EMPTY
+        previous = self.previous.get(asset_id, EMPTY)
+        if inside != previous:
+            if inside:
+                self.previous[asset_id] = inside
+            else:
+                del self.previous[asset_id]
+            return GeofenceTransition(inside, inside - previous, previous - inside)
+        return GeofenceTransition(inside, EMPTY, EMPTY)
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def random_polygon(rng: random.Random, lat: float, lng: float, radius_km: float) -> List[Tuple[float, float]]:
+    """Star-shaped polygon around a center (irregular radii, 6-40 vertices)."""
+    vertices = rng.randint(6, 40)
+    lat_scale = radius_km / 111.0
+    lng_scale = lat_scale / max(math.cos(math.radians(lat)), 0.1)
+    points = []
+    for index in range(vertices):
+        angle = 2 * math.pi * index / vertices
+        reach = rng.uniform(0.4, 1.0)
+        points.append((lat + math.sin(angle) * reach * lat_scale, lng + math.cos(angle) * reach * lng_scale))
+    return points
+
+
+def main():
+    """Build per-customer indexes over random polygons and compare lookups with naive per-polygon tests."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--polygons', type=int, default=100_000, help='Geofences across all customers')
+    parser.add_argument('--customers', type=int, default=100, help='Customers (one index each)')
+    parser.add_argument('--points', type=int, default=1_000_000, help='Packet locations to look up')
+    parser.add_argument('--naive-points', type=int, default=2_000, help='Points also checked against every polygon')
+    parser.add_argument('--refine-levels', type=int, default=REFINE_LEVELS, help='Boundary refinement levels')
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    # Each customer operates in a ~600 km region; geofences cluster around depots
+    regions = [(rng.uniform(-30.0, 55.0), rng.uniform(-15.0, 45.0)) for _ in range(args.customers)]
+    catalog = GeofenceCatalog(args.refine_levels)
+    owned: Dict[int, List[Geofence]] = {customer: [] for customer in range(args.customers)}
+    centers = []
+    started = time.perf_counter()
+    for geofence_id in range(args.polygons):
+        customer = geofence_id % args.customers
+        lat0, lng0 = regions[customer]
+        lat, lng = lat0 + rng.uniform(-3.0, 3.0), lng0 + rng.uniform(-3.0, 3.0)
+        radius = math.exp(rng.uniform(math.log(0.2), math.log(20.0)))
+        geofence = Geofence(geofence_id, f'Zone {geofence_id}', random_polygon(rng, lat, lng, radius))
+        catalog.upsert(customer, geofence)
+        owned[customer].append(geofence)
+        centers.append((customer, lat, lng, radius))
+    build_seconds = time.perf_counter() - started
+
+    points = []
+    for _ in range(args.points):
+        customer, lat, lng, radius = centers[rng.randrange(len(centers))]
+        spread = radius * 1.5 / 111.0
+        points.append((customer, lat + rng.uniform(-spread, spread), lng + rng.uniform(-spread, spread)))
+
+    indexes = catalog.indexes
+    started = time.perf_counter()
+    hits = 0
+    for customer, lat, lng in points:
+        hits += len(indexes[customer].lookup(lat, lng))
+    lookup_seconds = time.perf_counter() - started
+
+    sample = points[:args.naive_points]
+    started = time.perf_counter()
+    naive = [sorted(geofence.geofence_id for geofence in owned[customer] if geofence.contains(lat, lng))
+             for customer, lat, lng in sample]
+    naive_seconds = time.perf_counter() - started
+    mismatches = sum(1 for (customer, lat, lng), expected in zip(sample, naive)
+                     if sorted(indexes[customer].lookup(lat, lng)) != expected)
+
+    # Incremental updates: move 1% of the geofences, then re-check the sample
+    moved = rng.sample(range(args.polygons), max(1, args.polygons // 100))
+    started = time.perf_counter()
+    for geofence_id in moved:
+        customer, lat, lng, radius = centers[geofence_id]
+        geofence = Geofence(geofence_id, f'Zone {geofence_id}', random_polygon(rng, lat, lng, radius))
+        catalog.upsert(customer, geofence)
+        owned[customer][geofence_id // args.customers] = geofence
+    update_seconds = time.perf_counter() - started
+    mismatches += sum(1 for customer, lat, lng in sample
+                      if sorted(indexes[customer].lookup(lat, lng))
+                      != sorted(g.geofence_id for g in owned[customer] if g.contains(lat, lng)))
+
+    # derive_geofences through the registered mapping function, plus transitions along a track
+    derive = FUNCTION_REGISTRY['derive_geofences']
+    customer, lat, lng, radius = centers[0]
+    context = {'geofences': catalog.index(customer)}
+    entered = exited = 0
+    for step in range(200):
+        offset = (step - 100) * radius / 111.0 / 50
+        fleeti = {'location_latitude': lat, 'location_longitude': lng + offset}
+        expected = derive(None, fleeti, {}, context)
+        transition = catalog.update_asset('track', customer, lat, lng + offset)
+        mismatches += sorted(item['geofence_id'] for item in expected) != sorted(transition.inside)
+        entered += len(transition.entered)
+        exited += len(transition.exited)
+
+    footprint = [index.footprint() for index in indexes.values()]
+    cells = sum(item['cells'] for item in footprint)
+    entries = sum(item['entries'] for item in footprint)
+    interior = sum(item['interior_entries'] for item in footprint)
+    exact_tests = sum(index.exact_tests for index in indexes.values())
+    lookups = args.points + 2 * len(sample) + 200
+    print(f"Indexed {args.polygons:,} geofences for {args.customers} customers in {build_seconds:.1f} s "
+          f"({cells:,} cells, {entries:,} entries, {interior / max(entries, 1):.0%} interior)")
+    print(f"Lookups: {args.points:,} points in {lookup_seconds:.2f} s "
+          f"({args.points / lookup_seconds:,.0f} points/s, {hits / args.points:.2f} geofences/point, "
+          f"{exact_tests / lookups:.2f} exact tests/point)")
+    print(f"Naive: {naive_seconds / len(sample) * 1e3:.2f} ms/point "
+          f"({args.polygons // args.customers:,} polygons per customer) vs "
+          f"{lookup_seconds / args.points * 1e6:.1f} us/point indexed")
+    print(f"Updates: {len(moved):,} geofences replaced in {update_seconds * 1e3:.0f} ms; "
+          f"track crossing: {entered} enters, {exited} exits")
+    print(f"Mismatches vs naive: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
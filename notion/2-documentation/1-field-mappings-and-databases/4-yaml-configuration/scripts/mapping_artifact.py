@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Mapping Artifact - Precompiled Binary Form of a Mapping YAML
+
+Workers load the mapping on every start; yaml.safe_load of a generated
+mapping (~1600 lines) dominates cold start. The artifact stores the
+already-ordered, optimized mapping as a marshal payload that loads in well
+under a millisecond:
+
+    header:  ARTIFACT_MAGIC (8 bytes) + build tag (4 bytes: Python major,
+             minor, marshal.version) + SHA-256 of the payload (32 bytes)
+    payload: marshal dict
+        format, provider, version
+        field_names      fields in dependency order (interned strings)
+        field_paths      Fleeti field path -> field name
+        mappings         field name -> optimized mapping entry (dependency order)
+
+Only what MappingEngine.from_artifact() reads is stored: the engine derives
+dependency levels and resolves functions by name while compiling.
+
+The payload hash doubles as the artifact version hash: two artifacts with
+the same hash hold the same mapping. load_artifact() memory-maps the file,
+verifies the header and unmarshals straight from the mapping.
+
+marshal data is only valid for the interpreter version that wrote it, so an
+artifact whose build tag differs from the running interpreter is rejected
+with StaleArtifactError; MappingEngine.from_artifact() then rebuilds it from
+the mapping YAML beside it.
+
+This module only depends on the standard library so generate_yaml_from_csv.py
+can write artifacts without importing the engine.
+"""
+
+import argparse
+import hashlib
+import marshal
+import mmap
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+ARTIFACT_MAGIC = b'FMAPART1'
+ARTIFACT_FORMAT = 3
+ARTIFACT_SUFFIX = '.mapc'
+BUILD_TAG = struct.pack('<BBH', sys.version_info[0], sys.version_info[1], marshal.version)
+DIGEST_SIZE = 32
+DIGEST_OFFSET = len(ARTIFACT_MAGIC) + len(BUILD_TAG)
+HEADER_SIZE = DIGEST_OFFSET + DIGEST_SIZE
+
+
+class StaleArtifactError(ValueError):
+    """Artifact written by another Python / marshal version; rebuild it from the YAML."""
+
+
+def describe_build_tag(tag: bytes) -> str:
+    major, minor, marshal_version = struct.unpack('<BBH', tag)
+    return f"Python {major}.{minor}, marshal v{marshal_version}"
+
+
+def intern_keys(value: Any) -> Any:
+    """Intern dict keys and strings recursively (marshal then stores each name once)."""
+    if isinstance(value, dict):
+        return {sys.intern(str(key)): intern_keys(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [intern_keys(item) for item in value]
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def build_artifact_payload(
+    provider: str,
+    version: Optional[str],
+    field_names: List[str],
+    mappings: Dict[str, Dict],
+    field_paths: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """Assemble the artifact payload from ordered, optimized mapping entries."""
+    return intern_keys({
+        'format': ARTIFACT_FORMAT,
+        'provider': provider,
+        'version': version,
+        'field_names': list(field_names),
+        'field_paths': dict(field_paths or {}),
+        'mappings': {name: mappings[name] for name in field_names},
+    })
+
+
+def write_artifact(path: Path, payload: Dict[str, Any]) -> str:
+    """Write a payload with its header; returns the version hash (hex)."""
+    data = marshal.dumps(payload)
+    digest = hashlib.sha256(data).digest()
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(ARTIFACT_MAGIC)
+        f.write(BUILD_TAG)
+        f.write(digest)
+        f.write(data)
+    tmp_path.replace(path)
+    return digest.hex()
+
+
+def load_artifact(path: Path, verify: bool = True) -> Dict[str, Any]:
+    """
+    Memory-map and unmarshal an artifact.
+
+    Returns the payload with `version_hash` added. Raises StaleArtifactError
+    when the artifact was built by another Python / marshal version (the
+    payload is not unmarshalled), ValueError on a bad header, unknown format
+    or (with verify=True) hash mismatch.
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if len(mapped) < HEADER_SIZE or mapped[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC:
+                raise ValueError(f"{path.name} is not a mapping artifact")
+            build_tag = mapped[len(ARTIFACT_MAGIC):DIGEST_OFFSET]
+            if build_tag != BUILD_TAG:
+                raise StaleArtifactError(
+                    f"{path.name}: built by {describe_build_tag(build_tag)}, "
+                    f"running {describe_build_tag(BUILD_TAG)}; rebuild it from the YAML"
+                )
+            digest = mapped[DIGEST_OFFSET:HEADER_SIZE]
+            with memoryview(mapped) as view:
+                body = view[HEADER_SIZE:]
+                if verify and hashlib.sha256(body).digest() != digest:
+                    body.release()
+                    raise ValueError(f"{path.name}: payload hash mismatch (corrupt artifact)")
+                payload = marshal.loads(body)
+                body.release()
+
+    if payload.get('format') != ARTIFACT_FORMAT:
+        raise ValueError(f"{path.name}: unsupported artifact format {payload.get('format')!r}")
+    payload['version_hash'] = digest.hex()
+    return payload
+
+
+def read_version_hash(path: Path) -> Optional[str]:
+    """
+    Version hash from an artifact header (payload not read), or None if
+    missing, not an artifact or built by another Python / marshal version.
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+    except OSError:
+        return None
+    if (len(header) < HEADER_SIZE or header[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC
+            or header[len(ARTIFACT_MAGIC):DIGEST_OFFSET] != BUILD_TAG):
+        return None
+    return header[DIGEST_OFFSET:].hex()
+
+
+def artifact_path_for(yaml_path: Path) -> Path:
+    """Artifact written next to a mapping YAML (same stem)."""
+    return yaml_path.with_suffix(ARTIFACT_SUFFIX)
+
+
+def main():
+    """Build the artifact for a mapping YAML and compare cold start (load + compile + first packet)."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('yaml_file', nargs='?', type=Path, help='Mapping YAML (default: latest in output/)')
+    parser.add_argument('--runs', type=int, default=20, help='Cold starts per variant')
+    args = parser.parse_args()
+
+    from mapping_engine import OUTPUT_DIR, MappingEngine, build_sample_packet, find_latest_yaml_file, rebuild_artifact
+
+    yaml_file = args.yaml_file or find_latest_yaml_file(OUTPUT_DIR)
+    artifact_file, version_hash = rebuild_artifact(yaml_file)
+    print(f"Artifact: {artifact_file.name} ({artifact_file.stat().st_size:,} bytes, "
+          f"YAML {yaml_file.stat().st_size:,} bytes), version hash {version_hash[:16]}")
+
+    packet = build_sample_packet()
+    for label, load in (('YAML', lambda: MappingEngine.from_file(yaml_file)),
+                        ('artifact', lambda: MappingEngine.from_artifact(artifact_file))):
+        timings = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            load().transform(packet)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"{label:>9}: cold start to first packet {timings[len(timings) // 2] * 1000:8.2f} ms (median)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1003 @@
+#!/usr/bin/env python3
+"""
+Mapping Engine - Compiled Executor for YAML Mapping Configurations
+
+Compiles a mapping YAML (as generated by generate_yaml_from_csv.py) once into
+a flat list of pre-resolved steps and then transforms provider-agnostic
+packets into Fleeti telemetry dicts. All YAML interpretation (path splitting,
+unit conversion resolution, function resolution, priority sorting) happens at
+compile time; the per-packet loop only calls closures.
+
+Packet format (provider-agnostic):
+    {
+        "msg_time": "2025-10-06T10:43:10Z",
+        "lat": -20.28516, "lng": 57.43321, "speed": 78, "heading": 143,
+        "alt": 243, "satellites": 15, "hdop": None,
+        "inputs": 9, "outputs": 1, "adc": [0.172, 0.172], "ibutton": None,
+        "params": {"avl_io_1": 1, "board_voltage": 13.642, ...}
+    }
+
+Mapping semantics follow yaml-mapping-reference.yaml. Output is a dict keyed
+by Fleeti field name, in dependency order.
+"""
+
+import argparse
+import ast
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import yaml
+
+from generate_yaml_from_csv import (
+    OUTPUT_DIR,
+    extract_fleeti_dependencies,
+    sort_dependency_graph,
+)
+from mapping_artifact import (
+    StaleArtifactError,
+    artifact_path_for,
+    build_artifact_payload,
+    load_artifact,
+    write_artifact,
+)
+from mapping_functions import FUNCTION_REGISTRY, shared_status_engine
+from packet_paths import provider_field_path
+from status_engine import FAMILIES, STATUS_FUNCTIONS
+from unit_registry import resolve_conversion
+
+EMPTY_PARAMS: Dict[str, Any] = {}
+
+Getter = Callable[[Dict, Dict, Dict], Any]
+
+
+def make_path_getter(path: str) -> Callable[[Dict], Any]:
+    """Compile a dotted packet path (e.g. `params.avl_io_69`) into a getter."""
+    keys = path.split('.')
+
+    if len(keys) == 1:
+        key = keys[0]
+
+        def get_root(packet):
+            return packet.get(key)
+        return get_root
+
+    if len(keys) == 2:
+        section, key = keys
+
+        def get_nested(packet):
+            container = packet.get(section)
+            if container is None:
+                return None
+            return container.get(key)
+        return get_nested
+
+    def get_deep(packet):
+        value = packet
+        for key in keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+    return get_deep
+
+
+def make_source_getter(path: str, convert: Optional[Callable]) -> Getter:
+    """Compile a direct source (path + optional unit conversion) into a step getter."""
+    keys = path.split('.')
+
+    if len(keys) == 2 and convert is None:
+        section, key = keys
+
+        def get_nested(packet, out, context):
+            container = packet.get(section)
+            if container is None:
+                return None
+            return container.get(key)
+        return get_nested
+
+    if len(keys) == 1 and convert is None:
+        key = keys[0]
+
+        def get_root(packet, out, context):
+            return packet.get(key)
+        return get_root
+
+    path_get = make_path_getter(path)
+
+    if convert is None:
+        def get_direct(packet, out, context):
+            return path_get(packet)
+        return get_direct
+
+    def get_converted(packet, out, context):
+        value = path_get(packet)
+        if value is None:
+            return None
+        return convert(value)
+    return get_converted
+
+
+def make_unit_converter(source_unit: Optional[str], target_unit: Optional[str]) -> Optional[Callable]:
+    """Resolve a (source unit, Fleeti unit) pair to a converter (None when no conversion is needed)."""
+    conversion = resolve_conversion(source_unit, target_unit)
+    if conversion is None:
+        return None
+    return conversion.scalar()
+
+
+# Byte value -> its 8 bits, least significant first (table-driven bitmask unpack)
+BYTE_BITS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple((byte >> bit) & 1 for bit in range(8)) for byte in range(256)
+)
+
+
+class BitmaskDecoder:
+    """
+    Shared decode of one packet bitmask (e.g. `inputs`) for every
+    extract_bit_from_bitmask step reading it. The first step of a packet
+    parses the integer once and unpacks it byte by byte through BYTE_BITS;
+    the following steps index the cached bit tuple.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.positions: List[int] = []
+        self.byte_count = 0
+        # (raw value, bits) of the last decoded bitmask, replaced atomically
+        self.cached: Tuple[Any, Tuple[int, ...]] = (None, ())
+
+    def require(self, position: int) -> None:
+        """Register a bit position (compile time); widens the decode as needed."""
+        self.positions.append(position)
+        if position // 8 + 1 > self.byte_count:
+            self.byte_count = position // 8 + 1
+            self.cached = (None, ())  # decoded with a narrower width
+
+    def decode(self, raw: Any) -> Tuple[Any, Tuple[int, ...]]:
+        value = int(raw)
+        bits: Tuple[int, ...] = ()
+        for shift in range(0, self.byte_count * 8, 8):
+            bits += BYTE_BITS[(value >> shift) & 0xFF]
+        self.cached = cached = (raw, bits)
+        return cached
+
+    def bit_getter(self, position: int) -> Getter:
+        """Step getter returning bit `position` (None when the bitmask is missing)."""
+        self.require(position)
+        raw_get = make_path_getter(self.path)
+
+        def extract_bit(packet, out, context):
+            raw = raw_get(packet)
+            if raw is None:
+                return None
+            cached = self.cached
+            if raw.__class__ is not cached[0].__class__ or raw != cached[0]:
+                cached = self.decode(raw)
+            return cached[1][position]
+        return extract_bit
+
+
+class CompiledStepCache:
+    """
+    Compiled steps shared by engines built from overlapping mappings.
+
+    Keyed by (field name, mapping entry identity): merged overlay configs
+    reuse the default layer's entry objects for fields they do not
+    override, so those fields are compiled once for all engines.
+
+    Each entry counts the engines compiled through it; release(engine)
+    drops the entries no other engine uses, so the cache only holds entries
+    of engines its owner still keeps. A held entry keeps a reference to its
+    mapping dict, so its identity cannot be recycled while it is cached.
+    """
+
+    def __init__(self):
+        # (field name, id(entry)) -> (entry, step, param names, missing functions)
+        self.entries: Dict[Tuple[str, int], Tuple[Dict, Optional[Getter], FrozenSet[str], Tuple[str, ...]]] = {}
+        # (field name, id(entry)) -> engines compiled through the entry
+        self.users: Dict[Tuple[str, int], int] = {}
+        self.bitmask_decoders: Dict[str, BitmaskDecoder] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def release(self, engine: 'MappingEngine') -> None:
+        """Forget an engine's uses (e.g. evicted from an LRU); entries no engine uses are dropped."""
+        for key in engine.step_keys:
+            count = self.users[key] - 1
+            if count:
+                self.users[key] = count
+            else:
+                del self.users[key], self.entries[key]
+                self.evicted += 1
+        engine.step_keys = []
+
+
+def coerce_boolean(value: Any) -> bool:
+    """Coerce provider 0/1 values to booleans."""
+    if value.__class__ is bool:
+        return value
+    return bool(int(value))
+
+
+# Provider values arrive typed (parser / recovery API JSON); only booleans
+# need coercion from 0/1 integers.
+COERCERS = {
+    'boolean': coerce_boolean,
+}
+
+
+class _TransformScope(dict):
+    """Name resolution for `transformed` expressions: Fleeti fields, then packet root."""
+
+    def __init__(self, packet: Dict, out: Dict, static: Dict):
+        super().__init__()
+        self.packet = packet
+        self.out = out
+        self.static = static
+
+    def __missing__(self, name):
+        if name == 'static':
+            return _AttributeView(self.static)
+        if name in self.out:
+            return self.out[name]
+        return self.packet.get(name)
+
+
+class _AttributeView:
+    """Expose a dict as attributes (`static.tank_capacity`)."""
+
+    def __init__(self, values: Dict):
+        self._values = values
+
+    def __getattr__(self, name):
+        return self._values.get(name)
+
+
+ALLOWED_TRANSFORM_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Name,
+    ast.Attribute, ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div,
+    ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd
+)
+
+
+def compile_transformation(expression: str):
+    """Compile a `transformation` arithmetic expression, rejecting anything else."""
+    tree = ast.parse(expression, mode='eval')
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_TRANSFORM_NODES):
+            raise ValueError(
+                f"Unsupported syntax in transformation '{expression}': {type(node).__name__}"
+            )
+    return compile(tree, '<transformation>', 'eval')
+
+
+# Fleeti field paths consumed by each WebSocket stream (2-websocket-contracts)
+STREAM_FIELD_PATHS: Dict[str, Tuple[str, ...]] = {
+    'live.map.markers': (
+        'last_updated_at',
+        'location.latitude',
+        'location.longitude',
+        'location.heading',
+        'status.top_status',
+        'status.statuses.connectivity.code',
+        'status.statuses.immobilization.code',
+        'status.statuses.engine.code',
+        'status.statuses.transit.code',
+        'motion.speed.value',
+    ),
+}
+
+FIELD_PATH_COMMENT = re.compile(r'^    # Field Path: (\S+)')
+FIELD_NAME_LINE = re.compile(r'^  ([A-Za-z0-9_]+):\s*$')
+
+
+def read_field_paths(yaml_path: Path) -> Dict[str, str]:
+    """
+    Read Fleeti field path -> field name from the `# Field Path:` comments
+    written by generate_yaml_from_csv.py (comments are dropped by yaml.safe_load).
+    Array markers are stripped (`geofences[]` -> `geofences`).
+    """
+    field_paths = {}
+    current_name = None
+    with open(yaml_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            name_match = FIELD_NAME_LINE.match(line)
+            if name_match:
+                current_name = name_match.group(1)
+                continue
+            path_match = FIELD_PATH_COMMENT.match(line)
+            if path_match and current_name:
+                field_paths[path_match.group(1).replace('[]', '')] = current_name
+    return field_paths
+
+
+def resolve_required_fields(
+    required: List[str],
+    field_names: List[str],
+    field_paths: Optional[Dict[str, str]] = None
+) -> Set[str]:
+    """
+    Resolve required Fleeti fields to field names.
+
+    Each entry may be a field name (`location_latitude`), a field path
+    (`location.latitude`) or a path prefix selecting a whole object
+    (`status.top_status`). Unknown entries raise ValueError.
+    """
+    field_paths = field_paths or {}
+    known = set(field_names)
+    resolved = set()
+    unknown = []
+    for entry in required:
+        entry = entry.replace('[]', '')
+        if entry in known:
+            resolved.add(entry)
+            continue
+        matches = {
+            name for path, name in field_paths.items()
+            if name in known and (path == entry or path.startswith(entry + '.'))
+        }
+        if not matches:
+            unknown.append(entry)
+        resolved |= matches
+    if unknown:
+        raise ValueError(f"Unknown required Fleeti field(s): {', '.join(unknown)}")
+    return resolved
+
+
+def dependency_closure(required: Set[str], deps_map: Dict[str, List[str]]) -> Set[str]:
+    """Required fields plus everything they transitively depend on."""
+    closure = set()
+    stack = list(required)
+    while stack:
+        name = stack.pop()
+        if name in closure:
+            continue
+        closure.add(name)
+        stack.extend(dep for dep in deps_map.get(name, ()) if dep not in closure)
+    return closure
+
+
+class MappingEngine:
+    """
+    Compiled executor for a mapping YAML configuration.
+
+    Usage:
+        engine = MappingEngine.from_file(yaml_path)
+        fleeti = engine.transform(packet, context={'asset': {...}})
+
+    Args:
+        yaml_data: Parsed mapping YAML (version, provider, mappings)
+        functions: Function registry override (defaults to FUNCTION_REGISTRY)
+        strict: If True, unknown function references raise ValueError at
+            compile time; otherwise they are listed in `missing_functions`
+            and evaluate to null.
+        required_fields: Fleeti field names / paths the consumer needs. Only
+            these and their transitive dependencies are compiled; all other
+            mappings are pruned (listed in `pruned_fields`).
+        field_paths: Field path -> field name, used to resolve paths in
+            required_fields (see read_field_paths; from_file reads it).
+        step_cache: CompiledStepCache shared with other engines; mapping
+            entries already compiled by another engine (same object) reuse
+            its step instead of compiling again (see config_overlays.py).
+    """
+
+    def __init__(
+        self,
+        yaml_data: Dict,
+        functions: Optional[Dict[str, Callable]] = None,
+        strict: bool = False,
+        required_fields: Optional[List[str]] = None,
+        field_paths: Optional[Dict[str, str]] = None,
+        step_cache: Optional['CompiledStepCache'] = None
+    ):
+        self.version = yaml_data.get('version')
+        self.provider = (yaml_data.get('provider') or 'navixy').strip().lower()
+        self.functions = FUNCTION_REGISTRY if functions is None else functions
+        self.strict = strict
+        self.missing_functions: List[str] = []
+        # Names of `params` section entries the compiled mapping reads
+        self.param_names: Set[str] = set()
+        # Field name -> dependency depth (0 = no parameters.fleeti dependencies)
+        self.field_levels: Dict[str, int] = {}
+        # Packet path -> shared decoder of fused extract_bit_from_bitmask steps
+        self.bitmask_decoders: Dict[str, BitmaskDecoder] = (
+            {} if step_cache is None else step_cache.bitmask_decoders
+        )
+        # step_cache keys this engine holds (see CompiledStepCache.release)
+        self.step_keys: List[Tuple[str, int]] = []
+
+        mappings = yaml_data.get('mappings') or {}
+        deps_map = self._mapping_dependencies(mappings)
+        self.pruned_fields: List[str] = []
+        if required_fields is not None:
+            required = resolve_required_fields(required_fields, list(mappings), field_paths)
+            keep = dependency_closure(required, deps_map)
+            self.pruned_fields = [name for name in mappings if name not in keep]
+            mappings = {name: mapping for name, mapping in mappings.items() if name in keep}
+        # Status fields computed by one StatusEngine.evaluate() per packet: field name -> function
+        self.status_fields = self._status_fields(mappings, deps_map)
+        if self.status_fields:
+            deps_map = self._group_status_dependencies(deps_map)
+        self.field_names = self._order_fields(mappings, deps_map)
+        # Mapping entries in dependency order (what build_artifact_payload stores)
+        self.mappings: Dict[str, Dict] = {name: mappings[name] for name in self.field_names}
+        # Set when loaded from a precompiled artifact (see mapping_artifact.py)
+        self.version_hash: Optional[str] = None
+        # Field name -> top-level `function` of calculated mappings
+        self.field_functions: Dict[str, str] = {
+            name: mapping['function'] for name, mapping in mappings.items() if mapping.get('function')
+        }
+
+        # Output template: every field starts as null, so mappings that can
+        # only ever produce null (unregistered functions) get no step at all.
+        self._template: Dict[str, Any] = dict.fromkeys(self.field_names)
+        self._steps: List[Tuple[str, Getter]] = []
+        status_step = None
+        for name in self.field_names:
+            if name in self.status_fields:
+                # The first status field in order runs the fused step; it writes the others
+                if status_step is None:
+                    status_step = self._compile_status()
+                    self._steps.append((name, status_step))
+                continue
+            if step_cache is None:
+                step = self._compile_mapping(name, mappings[name])
+            else:
+                step = self._compile_shared(name, mappings[name], step_cache)
+            if step is not None:
+                self._steps.append((name, step))
+
+    @classmethod
+    def from_file(cls, yaml_path: Path, **kwargs) -> 'MappingEngine':
+        """Load and compile a mapping YAML file."""
+        if kwargs.get('required_fields') is not None and kwargs.get('field_paths') is None:
+            kwargs['field_paths'] = read_field_paths(yaml_path)
+        with open(yaml_path, 'r', encoding='utf-8') as f:
+            return cls(yaml.safe_load(f), **kwargs)
+
+    @classmethod
+    def from_artifact(cls, artifact_path: Path, **kwargs) -> 'MappingEngine':
+        """Load and compile a precompiled mapping artifact (see mapping_artifact.py)."""
+        artifact = load_current_artifact(artifact_path)
+        kwargs.setdefault('field_paths', artifact['field_paths'])
+        engine = cls({
+            'version': artifact['version'],
+            'provider': artifact['provider'],
+            'mappings': artifact['mappings'],
+        }, **kwargs)
+        engine.version_hash = artifact['version_hash']
+        return engine
+
+    # ------------------------------------------------------------------
+    # Runtime
+    # ------------------------------------------------------------------
+
+    def transform(self, packet: Dict, context: Optional[Dict] = None) -> Dict[str, Any]:
+        """Transform one provider-agnostic packet into a Fleeti telemetry dict."""
+        if context is None:
+            context = EMPTY_PARAMS
+        out = self._template.copy()
+        for name, step in self._steps:
+            try:
+                out[name] = step(packet, out, context)
+            except Exception:
+                # error_handling: return_null (field stays null)
+                pass
+        return out
+
+    # ------------------------------------------------------------------
+    # Compilation
+    # ------------------------------------------------------------------
+
+    def _mapping_dependencies(self, mappings: Dict[str, Dict]) -> Dict[str, List[str]]:
+        """Fleeti fields each mapping reads: parameters.fleeti, io_mapped candidates, transformed names."""
+        deps_map = {}
+        for name, mapping in mappings.items():
+            deps = extract_fleeti_dependencies(mapping, name)
+            if mapping.get('type') == 'io_mapped':
+                deps = sorted(set(deps) | set(self._io_mapped_candidates(mapping, mappings)))
+            elif mapping.get('type') == 'transformed':
+                tree = ast.parse(mapping['transformation'], mode='eval')
+                names = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+                deps = sorted(set(deps) | (names & set(mappings)))
+            deps_map[name] = deps
+        return deps_map
+
+    def _status_fields(self, mappings: Dict[str, Dict], deps_map: Dict[str, List[str]]) -> Dict[str, str]:
+        """
+        Calculated fields whose (registry) function StatusEngine.evaluate()
+        covers, when all four family codes are among them (evaluate runs
+        the transit state machine, so it only replaces per-field functions
+        that would run it anyway). Empty when the group cannot be fused,
+        including when one of its inputs depends on a status field.
+        """
+        fields = {
+            name: mapping['function'] for name, mapping in mappings.items()
+            if mapping.get('type') == 'calculated' and mapping.get('function') in STATUS_FUNCTIONS
+            and self.functions.get(mapping['function']) is FUNCTION_REGISTRY.get(mapping['function'])
+        }
+        if not {f'derive_statuses_{family}_code' for family in FAMILIES} <= set(fields.values()):
+            return {}
+        inputs = {dep for name in fields for dep in deps_map.get(name, ()) if dep not in fields}
+        if dependency_closure(inputs, deps_map) & set(fields):
+            return {}
+        return fields
+
+    def _group_status_dependencies(self, deps_map: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """Give every status field the inputs of the whole group, so the fused step runs after all of them."""
+        inputs = {dep for name in self.status_fields for dep in deps_map.get(name, ()) if dep not in self.status_fields}
+        return {
+            name: sorted(set(deps) | inputs) if name in self.status_fields else deps
+            for name, deps in deps_map.items()
+        }
+
+    def _order_fields(self, mappings: Dict[str, Dict], deps_map: Dict[str, List[str]]) -> List[str]:
+        """Order mappings with sort_dependency_graph (YAML order as tiebreak) and record their levels."""
+        entries = [
+            {'name': name, 'deps': deps_map[name], 'order': index}
+            for index, name in enumerate(mappings)
+        ]
+        ordered, self.field_levels = sort_dependency_graph(entries)
+        return ordered
+
+    def _compile_mapping(self, name: str, mapping: Dict) -> Optional[Getter]:
+        """Compile one mapping entry; returns None when it can only produce null."""
+        mapping_type = mapping.get('type', 'direct')
+        error_handling = mapping.get('error_handling', 'return_null')
+        target_unit = mapping.get('unit')
+        coerce = COERCERS.get(mapping.get('data_type'))
+
+        if mapping_type in ('direct', 'prioritized'):
+            return self._compile_sources(mapping.get('sources', []), target_unit, error_handling, coerce)
+        elif mapping_type == 'calculated':
+            step = self._compile_function_call(
+                mapping.get('function'), mapping.get('parameters') or {}
+            )
+        elif mapping_type == 'transformed':
+            step = self._compile_transformed(mapping)
+        elif mapping_type == 'io_mapped':
+            step = self._compile_io_mapped(mapping)
+        else:
+            raise ValueError(f"Unsupported mapping type '{mapping_type}' for {name}")
+
+        if step is None or coerce is None or mapping_type == 'calculated':
+            return step
+
+        def coerced_step(packet, out, context):
+            value = step(packet, out, context)
+            if value is None:
+                return None
+            return coerce(value)
+        return coerced_step
+
+    def _compile_shared(self, name: str, mapping: Dict, cache: 'CompiledStepCache') -> Optional[Getter]:
+        """Compile through a CompiledStepCache, keeping param_names / missing_functions complete on reuse."""
+        if mapping.get('type') == 'io_mapped':
+            # Candidates are resolved against this engine's field set
+            return self._compile_mapping(name, mapping)
+
+        key = (name, id(mapping))
+        cached = cache.entries.get(key)
+        if cached is None or cached[0] is not mapping:
+            param_names, missing_functions = self.param_names, self.missing_functions
+            self.param_names, self.missing_functions = set(), []
+            try:
+                step = self._compile_mapping(name, mapping)
+                cached = (mapping, step, frozenset(self.param_names), tuple(self.missing_functions))
+            finally:
+                self.param_names, self.missing_functions = param_names, missing_functions
+            cache.entries[key] = cached
+            cache.misses += 1
+        else:
+            cache.hits += 1
+        cache.users[key] = cache.users.get(key, 0) + 1
+        self.step_keys.append(key)
+
+        _, step, entry_params, entry_missing = cached
+        self.param_names.update(entry_params)
+        for function_name in entry_missing:
+            if function_name not in self.missing_functions:
+                self.missing_functions.append(function_name)
+        return step
+
+    def _compile_sources(
+        self,
+        sources: List[Dict],
+        target_unit: Optional[str],
+        error_handling: str,
+        coerce: Optional[Callable]
+    ) -> Optional[Getter]:
+        """Compile direct/prioritized sources into a first-available-value chain."""
+        ordered = [
+            source for _, source in sorted(
+                enumerate(sources),
+                key=lambda item: (item[1].get('priority', item[0] + 1), item[0])
+            )
+        ]
+        for source in ordered:
+            if 'path' in source and source.get('provider', self.provider) == self.provider:
+                self._track_param(source['path'])
+
+        lookups = self._plain_path_lookups(ordered, target_unit)
+        if lookups is not None and len(lookups) > 1:
+            # All sources are same-provider paths without unit conversion:
+            # resolve them inline instead of one getter call per source.
+            def first_available_path(packet, out, context):
+                for section, key in lookups:
+                    if section is None:
+                        value = packet.get(key)
+                    else:
+                        container = packet.get(section)
+                        if container is None:
+                            continue
+                        value = container.get(key)
+                    if value is not None:
+                        return value if coerce is None else coerce(value)
+                return None
+            return first_available_path
+
+        getters = [self._compile_source(source, target_unit) for source in ordered]
+        getters = [get for get in getters if get is not None]
+
+        if not getters:
+            return None
+
+        if len(getters) == 1 and coerce is None:
+            return getters[0]
+
+        if error_handling == 'use_fallback':
+            def first_available_with_fallback(packet, out, context):
+                for get in getters:
+                    try:
+                        value = get(packet, out, context)
+                    except Exception:
+                        continue
+                    if value is not None:
+                        return value if coerce is None else coerce(value)
+                return None
+            return first_available_with_fallback
+
+        if coerce is None:
+            def first_available(packet, out, context):
+                for get in getters:
+                    value = get(packet, out, context)
+                    if value is not None:
+                        return value
+                return None
+            return first_available
+
+        def first_available_coerced(packet, out, context):
+            for get in getters:
+                value = get(packet, out, context)
+                if value is not None:
+                    return coerce(value)
+            return None
+        return first_available_coerced
+
+    def _plain_path_lookups(self, sources: List[Dict], target_unit: Optional[str]) -> Optional[List[Tuple]]:
+        """Return (section, key) lookups when every source is a plain packet path, else None."""
+        lookups = []
+        for source in sources:
+            if source.get('type') == 'calculated' or 'function' in source:
+                return None
+            if source.get('provider', self.provider) != self.provider:
+                return None
+            if make_unit_converter(source.get('unit'), target_unit) is not None:
+                return None
+            keys = source['path'].split('.')
+            if len(keys) == 1:
+                lookups.append((None, keys[0]))
+            elif len(keys) == 2:
+                lookups.append((keys[0], keys[1]))
+            else:
+                return None
+        return lookups
+
+    def _compile_source(self, source: Dict, target_unit: Optional[str]) -> Optional[Getter]:
+        if source.get('type') == 'calculated' or 'function' in source:
+            # Calculated sources already return values in the Fleeti unit
+            return self._compile_function_call(source.get('function'), source.get('parameters') or {})
+
+        convert = make_unit_converter(source.get('unit'), target_unit)
+        source_provider = source.get('provider', self.provider)
+
+        if source_provider == self.provider:
+            return make_source_getter(source['path'], convert)
+
+        # Sources from another provider read that provider's packet from context
+        path_get = make_path_getter(source['path'])
+
+        def get_other_provider(packet, out, context):
+            other = (context.get('providers') or EMPTY_PARAMS).get(source_provider)
+            if other is None:
+                return None
+            value = path_get(other)
+            if value is None or convert is None:
+                return value
+            return convert(value)
+        return get_other_provider
+
+    def _track_param(self, path: str) -> None:
+        if path.startswith('params.'):
+            self.param_names.add(path[len('params.'):])
+
+    def _compile_provider_params(self, parameters: Dict) -> Optional[Callable[[Dict], Any]]:
+        """Compile `parameters.provider.<provider>` into a packet getter."""
+        provider_params = (parameters.get('provider') or {}).get(self.provider)
+        if provider_params is None:
+            return None
+        for field_name in (provider_params if isinstance(provider_params, list) else [provider_params]):
+            self._track_param(provider_field_path(field_name))
+
+        if isinstance(provider_params, list):
+            param_names = tuple(provider_params)
+            if all(provider_field_path(name) == f'params.{name}' for name in param_names):
+                # All in `params` (the common case): one section lookup, no getter per field
+                def get_params(packet):
+                    params = packet.get('params')
+                    if params is None:
+                        return dict.fromkeys(param_names)
+                    return {name: params.get(name) for name in param_names}
+                return get_params
+
+            field_getters = [
+                (field_name, make_path_getter(provider_field_path(field_name)))
+                for field_name in provider_params
+            ]
+
+            def get_fields(packet):
+                return {field_name: get(packet) for field_name, get in field_getters}
+            return get_fields
+
+        return make_path_getter(provider_field_path(provider_params))
+
+    def _compile_function_call(self, function_name: Optional[str], parameters: Dict) -> Optional[Getter]:
+        """Resolve a function reference; returns None for unregistered functions (null)."""
+        fn = self.functions.get(function_name)
+        if fn is None:
+            if self.strict:
+                raise ValueError(f"Unknown function '{function_name}'")
+            if function_name not in self.missing_functions:
+                self.missing_functions.append(function_name)
+            return None
+
+        provider_get = self._compile_provider_params(parameters)
+        fleeti_names = tuple(parameters.get('fleeti') or ())
+        static = parameters.get('static') or EMPTY_PARAMS
+
+        if fn is FUNCTION_REGISTRY.get('extract_bit_from_bitmask') and not fleeti_names:
+            fused = self._compile_bit_extraction(parameters, static)
+            if fused is not None:
+                return fused
+
+        # `fleeti` is the output dict itself: the fields computed so far, every
+        # `parameters.fleeti` dependency among them (no per-call dict)
+        if provider_get is None:
+            def call_fleeti(packet, out, context):
+                return fn(None, out, static, context)
+            return call_fleeti
+
+        if not fleeti_names:
+            def call_provider(packet, out, context):
+                return fn(provider_get(packet), EMPTY_PARAMS, static, context)
+            return call_provider
+
+        def call(packet, out, context):
+            return fn(provider_get(packet), out, static, context)
+        return call
+
+    def _compile_status(self) -> Getter:
+        """
+        One StatusEngine.evaluate() per packet for all status fields: the step
+        returns the first field (in order) and writes the others into `out`.
+        """
+        evaluate = shared_status_engine().evaluate
+        names = [name for name in self.field_names if name in self.status_fields]
+        read_first = STATUS_FUNCTIONS[self.status_fields[names[0]]]
+        readers = [(name, STATUS_FUNCTIONS[self.status_fields[name]]) for name in names[1:]]
+
+        def evaluate_statuses(packet, out, context):
+            result = evaluate(out, context, keep_transit=False)
+            for name, read in readers:
+                out[name] = read(result)
+            return read_first(result)
+        return evaluate_statuses
+
+    def _compile_bit_extraction(self, parameters: Dict, static: Dict) -> Optional[Getter]:
+        """
+        Fuse an extract_bit_from_bitmask call into the shared BitmaskDecoder of
+        its bitmask path, so each packet bitmask is parsed once however many
+        bits are read from it. Returns None when the call cannot be fused.
+        """
+        field_name = (parameters.get('provider') or {}).get(self.provider)
+        try:
+            position = int(static['bit_position'])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not isinstance(field_name, str) or position < 0:
+            return None
+
+        path = provider_field_path(field_name)
+        decoder = self.bitmask_decoders.get(path)
+        if decoder is None:
+            decoder = self.bitmask_decoders[path] = BitmaskDecoder(path)
+        return decoder.bit_getter(position)
+
+    def _compile_transformed(self, mapping: Dict) -> Getter:
+        """
+        Compile a `transformed` mapping. Bare names resolve to Fleeti fields
+        computed so far, then packet root fields; `static.<name>` resolves
+        from context['static'] (asset service field values).
+        """
+        code = compile_transformation(mapping['transformation'])
+
+        def transformed(packet, out, context):
+            scope = _TransformScope(packet, out, context.get('static') or EMPTY_PARAMS)
+            return eval(code, {'__builtins__': {}}, scope)
+        return transformed
+
+    @staticmethod
+    def _io_mapped_names(mapping: Dict) -> Tuple[str, str]:
+        """Return (default Fleeti field name, field name prefix) for an io_mapped entry."""
+        default_name = mapping['default_source'].replace('.', '_')
+        prefix = re.sub(r'\d+$', '', default_name)
+        return default_name, prefix
+
+    def _io_mapped_candidates(self, mapping: Dict, mappings: Dict[str, Dict]) -> List[str]:
+        default_name, prefix = self._io_mapped_names(mapping)
+        pattern = re.compile(re.escape(prefix) + r'\d+$')
+        return [name for name in mappings if name == default_name or pattern.match(name)]
+
+    def _compile_io_mapped(self, mapping: Dict) -> Getter:
+        """
+        Compile an `io_mapped` entry: the installation metadata (e.g.
+        asset.installation.ignition_input_number) selects which individual
+        I/O Fleeti field to read, falling back to `default_source`.
+        """
+        default_name, prefix = self._io_mapped_names(mapping)
+        metadata_path = mapping.get('installation_metadata', '')
+        if metadata_path.startswith('asset.'):
+            metadata_path = metadata_path[len('asset.'):]
+        metadata_get = make_path_getter(metadata_path) if metadata_path else None
+        # I/O number (as written in installation metadata) -> compiled Fleeti field
+        candidates = {
+            name[len(prefix):]: name for name in self.field_names
+            if name.startswith(prefix) and name[len(prefix):].isdigit()
+        }
+
+        def io_mapped(packet, out, context):
+            number = None
+            if metadata_get is not None:
+                number = metadata_get(context.get('asset') or EMPTY_PARAMS)
+            if number is not None:
+                selected = candidates.get(number if number.__class__ is str else str(number))
+                if selected is not None:
+                    return out[selected]
+            return out.get(default_name)
+        return io_mapped
+
+
+def rebuild_artifact(yaml_path: Path) -> Tuple[Path, str]:
+    """Write the artifact for a mapping YAML (same stem); returns its path and version hash."""
+    engine = MappingEngine.from_file(yaml_path)
+    artifact_path = artifact_path_for(yaml_path)
+    payload = build_artifact_payload(
+        engine.provider, engine.version, engine.field_names,
+        engine.mappings, read_field_paths(yaml_path)
+    )
+    return artifact_path, write_artifact(artifact_path, payload)
+
+
+def load_current_artifact(artifact_path: Path) -> Dict[str, Any]:
+    """load_artifact(), rebuilding an artifact from another Python / marshal version from the YAML beside it."""
+    try:
+        return load_artifact(artifact_path)
+    except StaleArtifactError:
+        yaml_path = artifact_path.with_suffix('.yaml')
+        if not yaml_path.exists():
+            raise
+    rebuild_artifact(yaml_path)
+    return load_artifact(artifact_path)
+
+
+def find_latest_yaml_file(output_dir: Path) -> Path:
+    """Find the most recent mapping YAML by filename date."""
+    yaml_files = sorted(output_dir.glob('*-mapping-*.yaml'), key=lambda p: p.name, reverse=True)
+    if not yaml_files:
+        raise FileNotFoundError(f"No YAML files found in {output_dir}")
+    return yaml_files[0]
+
+
+def build_sample_packet() -> Dict[str, Any]:
+    """Sample packet matching the raw-packet-structure.md example, with common params."""
+    return {
+        'msg_time': '2025-10-06T10:43:10Z',
+        'lat': -20.28516,
+        'lng': 57.43321,
+        'speed': 78,
+        'heading': 143,
+        'alt': 243,
+        'satellites': 15,
+        'hdop': None,
+        'inputs': 9,
+        'outputs': 1,
+        'adc': [0.172, 0.172],
+        'ibutton': None,
+        'params': {
+            'EVENT': 2,
+            'avl_io_1': 1,
+            'avl_io_69': 1,
+            'avl_io_181': 9,
+            'avl_io_182': 7,
+            'avl_io_239': 1,
+            'avl_io_240': 1,
+            'avl_io_87': 46293146,
+            'avl_io_83': 12034,
+            'can_speed': 79,
+            'can_engine_hours': 1532.5,
+            'board_voltage': 13.642,
+            'battery_level': 92,
+            'hw_mileage': 46293.146,
+            'moving': 1,
+        },
+    }
+
+
+def run_benchmark(engine: MappingEngine, iterations: int) -> float:
+    """Transform the sample packet `iterations` times and return packets/s."""
+    packet = build_sample_packet()
+    context = {'asset': {'installation': {'ignition_input_number': 1}}}
+    transform = engine.transform
+    start = time.perf_counter()
+    for _ in range(iterations):
+        transform(packet, context)
+    elapsed = time.perf_counter() - start
+    return iterations / elapsed
+
+
+def main():
+    """Compile the latest (or given) mapping YAML and benchmark packet throughput."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('yaml_file', nargs='?', type=Path, help='Mapping YAML (default: latest in output/)')
+    parser.add_argument('--iterations', type=int, default=200000, help='Packets to transform')
+    parser.add_argument('--rounds', type=int, default=5, help='Rounds the iterations are split into')
+    parser.add_argument('--stream', choices=sorted(STREAM_FIELD_PATHS),
+                        help='Compile only the fields needed by this WebSocket stream')
+    parser.add_argument('--fields', help='Comma-separated Fleeti field names/paths to compile (with dependencies)')
+    args = parser.parse_args()
+
+    required_fields = None
+    if args.stream:
+        required_fields = list(STREAM_FIELD_PATHS[args.stream])
+    if args.fields:
+        required_fields = (required_fields or []) + [f.strip() for f in args.fields.split(',') if f.strip()]
+
+    yaml_file = args.yaml_file or find_latest_yaml_file(OUTPUT_DIR)
+    print(f"Compiling: {yaml_file.name}")
+
+    start = time.perf_counter()
+    engine = MappingEngine.from_file(yaml_file, required_fields=required_fields)
+    compile_ms = (time.perf_counter() - start) * 1000
+    print(f"Compiled {len(engine.field_names)} mappings in {compile_ms:.1f} ms")
+    if engine.pruned_fields:
+        print(f"Pruned {len(engine.pruned_fields)} mappings not needed by the required fields")
+    if engine.missing_functions:
+        print(f"Functions not registered ({len(engine.missing_functions)}, evaluate to null): "
+              f"{engine.missing_functions}")
+    for decoder in engine.bitmask_decoders.values():
+        print(f"Fused bitmask decode: {decoder.path} bits {sorted(decoder.positions)}")
+    if engine.status_fields:
+        print(f"Fused status fields: {len(engine.status_fields)} (one StatusEngine.evaluate() per packet)")
+
+    # Best and median of several rounds: single runs swing widely on a shared core
+    rounds = max(1, args.rounds)
+    rates = sorted(run_benchmark(engine, args.iterations // rounds) for _ in range(rounds))
+    print(f"Throughput: {rates[-1]:,.0f} packets/s best, {rates[len(rates) // 2]:,.0f} median "
+          f"({rounds} rounds of {args.iterations // rounds} packets)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Mapping Functions Registry
+
+Python implementations of the `function` references used by calculated
+mappings (and calculated sources of prioritized mappings) in the generated
+YAML configuration. The mapping engine resolves function names against
+FUNCTION_REGISTRY once at compile time.
+
+Every function uses the same calling convention:
+
+    fn(provider, fleeti, static, context) -> value
+
+- provider: resolved `parameters.provider.<provider>` value. A single value
+  when the YAML references one provider field (e.g. `navixy: inputs`), or a
+  dict of field name -> value when it references a list of fields.
+- fleeti: the Fleeti fields computed so far (the engine's output dict, in
+  dependency order), read with .get() by the `parameters.fleeti` names;
+  read-only. Fields the mapping does not define are absent.
+- static: `parameters.static` dict (empty dict when absent).
+- context: per-packet context dict (asset metadata under `asset`, current
+  time under `now`, the customer's GeofenceIndex under `geofences`, the
+  asset's TripSegmenter view under `trips`, its FuelMonitor view under
+  `fuel`). May be empty.
+
+Functions that need previous values per asset (`*_last_changed_at`,
+`*_last_updated_at`) read them from `context['state']`, a per-asset view of
+an AssetStateStore (see asset_state.py); without it they return null.
+Functions that need services not yet available in this repo (driver
+catalog...) are intentionally not registered here; the engine
+reports them as missing at compile time.
+"""
+
+import math
+from functools import lru_cache
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+
+FUNCTION_REGISTRY: Dict[str, Callable] = {}
+
+CARDINAL_DIRECTIONS = ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW']
+
+
+def register_function(name: str) -> Callable:
+    """Register a function implementation under its YAML `function` name."""
+    def decorator(fn: Callable) -> Callable:
+        FUNCTION_REGISTRY[name] = fn
+        return fn
+    return decorator
+
+
+@lru_cache(maxsize=4096)
+def parse_iso_timestamp(value: str) -> float:
+    """ISO 8601 string -> epoch seconds (cached: every stateful field of a packet parses the same msg_time)."""
+    text = value.strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def to_epoch_seconds(value: Any) -> Optional[float]:
+    """Convert a timestamp (epoch number, datetime or ISO 8601 string) to epoch seconds."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if isinstance(value, str):
+        return parse_iso_timestamp(value)
+    raise TypeError(f"Unsupported timestamp value: {value!r}")
+
+
+def from_epoch_seconds(value: Optional[float]) -> Optional[str]:
+    """Format epoch seconds as ISO 8601 UTC (`YYYY-MM-DDTHH:MM:SSZ`)."""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def get_installation_value(context: Optional[Dict], key: str, default: Any = None) -> Any:
+    """Read asset.installation.<key> from the packet context."""
+    if not context:
+        return default
+    asset = context.get('asset') or {}
+    installation = asset.get('installation') or {}
+    value = installation.get(key)
+    return default if value is None else value
+
+
+# ============================================================================
+# Provider-level functions (parameters.provider / parameters.static)
+# ============================================================================
+
+@register_function('extract_bit_from_bitmask')
+def extract_bit_from_bitmask(provider, fleeti, static, context):
+    """Extract bit `static.bit_position` from a digital inputs/outputs bitmask."""
+    if provider is None:
+        return None
+    return (int(provider) >> int(static['bit_position'])) & 1
+
+
+@register_function('divide_by_10')
+def divide_by_10(provider, fleeti, static, context):
+    """Convert a tenth-unit provider value (e.g. deciliters) to its base unit."""
+    if provider is None:
+        return None
+    return provider / 10
+
+
+@register_function('add_installation_offset_engine_hours')
+def add_installation_offset_engine_hours(provider, fleeti, static, context):
+    """Add asset.installation.initial_engine_hours to a relative engine hours counter."""
+    if provider is None:
+        return None
+    return provider + get_installation_value(context, 'initial_engine_hours', 0)
+
+
+@register_function('add_installation_offset_odometer')
+def add_installation_offset_odometer(provider, fleeti, static, context):
+    """Add asset.installation.initial_odometer to a relative odometer counter."""
+    if provider is None:
+        return None
+    return provider + get_installation_value(context, 'initial_odometer', 0)
+
+
+@register_function('derive_dtc_codes_combined')
+def derive_dtc_codes_combined(provider, fleeti, static, context):
+    """Concatenate complementary DTC arrays (avl_io_281, avl_io_282)."""
+    codes = []
+    for value in (provider or {}).values():
+        if isinstance(value, list):
+            codes.extend(value)
+    return codes
+
+
+# ============================================================================
+# Fleeti-level functions (parameters.fleeti)
+# ============================================================================
+
+@register_function('derive_cardinal_direction')
+def derive_cardinal_direction(provider, fleeti, static, context):
+    """Convert heading (0-359 degrees) to one of 8 cardinal directions."""
+    heading = fleeti.get('location_heading')
+    if heading is None:
+        return None
+    return CARDINAL_DIRECTIONS[int(math.floor((heading + 22.5) % 360 / 45))]
+
+
+@register_function('derive_ignition_value')
+def derive_ignition_value(provider, fleeti, static, context):
+    """Read the digital input wired to ignition (asset.installation.ignition_input_number, default 1)."""
+    input_number = get_installation_value(context, 'ignition_input_number', 1)
+    field_name = f'inputs_individual_input_{input_number}'
+    if field_name not in fleeti:
+        field_name = 'inputs_individual_input_1'
+    state = fleeti.get(field_name)
+    if state is None:
+        return None
+    return bool(state)
+
+
+@register_function('derive_movement_last_updated_at')
+def derive_movement_last_updated_at(provider, fleeti, static, context):
+    """last_updated_at when the packet carries motion data (is_moving_value or speed)."""
+    if fleeti.get('is_moving_value') is not None or fleeti.get('speed') is not None:
+        return fleeti.get('last_updated_at')
+    return None
+
+
+# ============================================================================
+# Status families (compiled compatibility profiles from status_engine.py)
+# ============================================================================
+# MappingEngine evaluates these fields together with StatusEngine.evaluate()
+# (status_engine.STATUS_FUNCTIONS); the functions serve engines with a
+# partial status group, batch fallbacks and the per-field reference check.
+
+_status_engine = None
+
+
+def shared_status_engine():
+    """StatusEngine shared by the status functions (matrix parsed on first use)."""
+    global _status_engine
+    if _status_engine is None:
+        from status_engine import StatusEngine
+        _status_engine = StatusEngine()
+    return _status_engine
+
+
+def status_profile(context: Optional[Dict]):
+    return shared_status_engine().profile(context.get('asset') if context else None)
+
+
+def make_compatible_function(function_name: str, family: str) -> Callable:
+    def derive_compatible(provider, fleeti, static, context):
+        return shared_status_engine().compatible(context, family)
+    derive_compatible.__name__ = function_name
+    derive_compatible.__doc__ = f"Compatibility matrix bit of the {family} family for asset.type/subtype."
+    return derive_compatible
+
+
+@register_function('derive_statuses_connectivity_code')
+def derive_statuses_connectivity_code(provider, fleeti, static, context):
+    """online / offline from last_updated_at vs context now (1 h window for cold room sites, else 24 h)."""
+    return shared_status_engine().connectivity_code(
+        status_profile(context),
+        to_epoch_seconds(fleeti.get('last_updated_at')),
+        to_epoch_seconds(context.get('now')) if context else None,
+    )
+
+
+@register_function('derive_statuses_engine_code')
+def derive_statuses_engine_code(provider, fleeti, static, context):
+    """running / standby from ignition_value for engine-compatible assets."""
+    return shared_status_engine().engine_code(status_profile(context), fleeti.get('ignition_value'))
+
+
+@register_function('derive_statuses_immobilization_code')
+def derive_statuses_immobilization_code(provider, fleeti, static, context):
+    """immobilized / free from the output wired to the immobilizer (default output 1)."""
+    return shared_status_engine().immobilization_code(status_profile(context), fleeti, context)
+
+
+@register_function('derive_statuses_transit_code')
+def derive_statuses_transit_code(provider, fleeti, static, context):
+    """
+    in_transit / parked state machine (per-asset state from context['state'], initial rules without).
+
+    Packet time is last_updated_at when passed as a parameter, else context now.
+    """
+    if not fleeti.get('statuses_transit_compatible'):
+        return None
+    context = context or {}
+    timestamp = to_epoch_seconds(fleeti.get('last_updated_at'))
+    if timestamp is None:
+        timestamp = to_epoch_seconds(context.get('now'))
+    return shared_status_engine().transit_code(
+        status_profile(context), fleeti, context.get('state'), 'derive_statuses_transit_code', timestamp,
+    )
+
+
+def fleeti_status_codes(fleeti: Dict) -> tuple:
+    return (
+        fleeti.get('statuses_connectivity_code'),
+        fleeti.get('statuses_immobilization_code'),
+        fleeti.get('statuses_engine_code'),
+        fleeti.get('statuses_transit_code'),
+    )
+
+
+@register_function('derive_top_status_family')
+def derive_top_status_family(provider, fleeti, static, context):
+    """Family of the highest-priority status (offline > immobilized > running > transit > online)."""
+    return shared_status_engine().top_status(fleeti_status_codes(fleeti))[0]
+
+
+@register_function('derive_top_status_code')
+def derive_top_status_code(provider, fleeti, static, context):
+    """Code of the highest-priority status (offline > immobilized > running > transit > online)."""
+    return shared_status_engine().top_status(fleeti_status_codes(fleeti))[1]
+
+
+for _family in ('connectivity', 'immobilization', 'engine', 'transit'):
+    _name = f'derive_statuses_{_family}_compatible'
+    register_function(_name)(make_compatible_function(_name, _family))
+
+
+# ============================================================================
+# Geofences (per-customer GeofenceIndex from geofence_index.py)
+# ============================================================================
+
+@register_function('derive_geofences')
+def derive_geofences(provider, fleeti, static, context):
+    """geofence_id / geofence_name of every geofence containing the location (context['geofences'] index)."""
+    index = context.get('geofences') if context else None
+    lat = fleeti.get('location_latitude')
+    lng = fleeti.get('location_longitude')
+    if index is None or lat is None or lng is None:
+        return None
+    return index.geofences_at(lat, lng)
+
+
+# ============================================================================
+# Stateful functions (previous value per asset from context['state'])
+# ============================================================================
+
+# Function -> Fleeti field whose value changes are timestamped
+LAST_CHANGED_FUNCTIONS = {
+    'derive_statuses_connectivity_last_changed_at': 'statuses_connectivity_code',
+    'derive_statuses_engine_last_changed_at': 'statuses_engine_code',
+    'derive_statuses_immobilization_last_changed_at': 'statuses_immobilization_code',
+    'derive_statuses_transit_last_changed_at': 'statuses_transit_code',
+    'derive_top_status_last_changed_at': 'top_status_code',
+    'derive_ignition_last_changed_at': 'ignition_value',
+    'derive_is_moving_last_updated_at': 'is_moving_value',
+    'derive_driver_last_changed_at': 'driver_key',
+}
+
+# Function -> Fleeti field whose presence (data freshness) is timestamped
+LAST_UPDATED_FUNCTIONS = {
+    'derive_engine_hours_last_updated_at': 'engine_hours_value',
+    'derive_odometer_last_updated_at': 'odometer_value',
+    'derive_fuel_tank_level_last_updated_at': 'fuel_tank_level_value',
+}
+
+# Function -> (latitude field, longitude field) whose position changes are timestamped
+LOCATION_CHANGED_FUNCTIONS = {
+    'derive_location_last_changed_at': ('location_latitude', 'location_longitude'),
+}
+
+# Functions running a state machine per asset (status + stationary since + ignition)
+TRANSIT_FUNCTIONS = {
+    'derive_statuses_transit_code',
+}
+
+
+def state_timestamp(fleeti: Dict, epoch: Optional[float], current: Optional[float]) -> Optional[str]:
+    """Return the packet's own last_updated_at when the state points at it, else the stored time."""
+    if epoch is None:
+        return None
+    if epoch == current:
+        return fleeti.get('last_updated_at')
+    return from_epoch_seconds(epoch)
+
+
+def make_last_changed_function(function_name: str, field_name: str) -> Callable:
+    def derive_last_changed_at(provider, fleeti, static, context):
+        state = context.get('state') if context else None
+        if state is None:
+            return None
+        value = fleeti.get(field_name)
+        if value == '':
+            value = None
+        current = to_epoch_seconds(fleeti.get('last_updated_at'))
+        return state_timestamp(fleeti, state.last_changed_at(function_name, value, current), current)
+    derive_last_changed_at.__name__ = function_name
+    derive_last_changed_at.__doc__ = f"last_updated_at of the packet where {field_name} last changed (per asset)."
+    return derive_last_changed_at
+
+
+def make_last_updated_function(function_name: str, field_name: str) -> Callable:
+    def derive_last_updated_at(provider, fleeti, static, context):
+        state = context.get('state') if context else None
+        if state is None:
+            return None
+        current = to_epoch_seconds(fleeti.get('last_updated_at'))
+        epoch = state.last_updated_at(function_name, fleeti.get(field_name) is not None, current)
+        return state_timestamp(fleeti, epoch, current)
+    derive_last_updated_at.__name__ = function_name
+    derive_last_updated_at.__doc__ = f"last_updated_at of the latest packet carrying {field_name} (per asset)."
+    return derive_last_updated_at
+
+
+def make_location_changed_function(function_name: str, lat_field: str, lng_field: str) -> Callable:
+    def derive_location_changed_at(provider, fleeti, static, context):
+        state = context.get('state') if context else None
+        if state is None:
+            return None
+        current = to_epoch_seconds(fleeti.get('last_updated_at'))
+        epoch = state.location_changed_at(
+            function_name, fleeti.get(lat_field), fleeti.get(lng_field), current,
+            float(static.get('distance_threshold_m', 0))
+        )
+        return state_timestamp(fleeti, epoch, current)
+    derive_location_changed_at.__name__ = function_name
+    derive_location_changed_at.__doc__ = (
+        f"last_updated_at of the packet where ({lat_field}, {lng_field}) last moved "
+        "by more than static.distance_threshold_m (default 0)."
+    )
+    return derive_location_changed_at
+
+
+for _name, _field in LAST_CHANGED_FUNCTIONS.items():
+    register_function(_name)(make_last_changed_function(_name, _field))
+for _name, _field in LAST_UPDATED_FUNCTIONS.items():
+    register_function(_name)(make_last_updated_function(_name, _field))
+for _name, (_lat, _lng) in LOCATION_CHANGED_FUNCTIONS.items():
+    register_function(_name)(make_location_changed_function(_name, _lat, _lng))
+
+
+# ============================================================================
+# Ongoing trip (per-asset TripSegmenter view from trip_segmenter.py)
+# ============================================================================
+
+@register_function('derive_ongoing_trip_started_at')
+def derive_ongoing_trip_started_at(provider, fleeti, static, context):
+    """Start of the trip (run of in_transit packets) the packet belongs to, from context['trips']."""
+    trips = context.get('trips') if context else None
+    if trips is None:
+        return None
+    current = to_epoch_seconds(fleeti.get('last_updated_at'))
+    if current is None:
+        current = to_epoch_seconds(context.get('now'))
+    return state_timestamp(fleeti, trips.transit(fleeti.get('statuses_transit_code'), current), current)
+
+
+@register_function('derive_ongoing_trip_mileage')
+def derive_ongoing_trip_mileage(provider, fleeti, static, context):
+    """odometer_value minus the odometer at trip start (km); null without odometer."""
+    trips = context.get('trips') if context else None
+    if trips is None or fleeti.get('ongoing_trip_started_at') is None:
+        return None
+    return trips.odometer(fleeti.get('odometer_value'))
+
+
+@register_function('derive_ongoing_trip_waypoints')
+def derive_ongoing_trip_waypoints(provider, fleeti, static, context):
+    """Simplified trip path as latitude / longitude dicts ([] outside a trip); odometer_value is kept per waypoint."""
+    trips = context.get('trips') if context else None
+    if trips is None:
+        return None
+    if fleeti.get('ongoing_trip_started_at') is None:
+        return []
+    return trips.position(fleeti.get('location_latitude'), fleeti.get('location_longitude'),
+                          fleeti.get('odometer_value'))
+
+
+# ============================================================================
+# Fuel levels (per-asset FuelMonitor view from fuel_levels.py)
+# ============================================================================
+
+@register_function('derive_fuel_levels')
+def derive_fuel_levels(provider, fleeti, static, context):
+    """
+    One smoothed level entry per fuel sensor of asset.accessories (context['fuel'] filters).
+
+    Packet time is last_updated_at when passed as a parameter, else context now.
+    """
+    fuel = context.get('fuel') if context else None
+    if fuel is None:
+        return None
+    updated_at = fleeti.get('last_updated_at')
+    timestamp = to_epoch_seconds(updated_at)
+    if timestamp is None:
+        timestamp = to_epoch_seconds(context.get('now'))
+        updated_at = from_epoch_seconds(timestamp)
+    asset = context.get('asset') or {}
+    return fuel.levels(provider if isinstance(provider, dict) else None, asset.get('accessories'),
+                       timestamp, updated_at)
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Packet Paths - Provider Field Names to Packet Paths
+
+Shared by the mapping engine (compile time) and validation (provider
+catalog): a `parameters.provider` field name either lives at the root of
+the provider-agnostic packet or in its `params` section.
+
+Standard library only, so validate_yaml.py and mapping_engine.py both
+import it at module level without importing each other.
+
+Usage:
+    provider_field_path('lat')          # 'lat'
+    provider_field_path('avl_io_69')    # 'params.avl_io_69'
+"""
+
+
+# Provider fields that live at the root of the packet; everything else is
+# resolved from the `params` section.
+ROOT_PACKET_FIELDS = {
+    'msg_time', 'lat', 'lng', 'alt', 'speed', 'heading', 'satellites',
+    'hdop', 'pdop', 'inputs', 'outputs', 'adc', 'ibutton',
+    'gps_fix_type', 'event_id', 'precision'
+}
+
+
+def provider_field_path(field_name: str) -> str:
+    """Resolve a `parameters.provider` field name to its packet path."""
+    if field_name in ROOT_PACKET_FIELDS:
+        return field_name
+    return f"params.{field_name}"
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Provider Merge - Field-Level Provider Priority Across Gateways
+
+Assets with several gateways (e.g. a Navixy tracker and an OEM feed) produce
+one Fleeti telemetry dict per gateway, each transformed with its provider's
+mapping ("transform first, select later"). This stage merges them per asset
+following the provider priority rules of
+6-epics-and-features/reference-helpers/provider-priority-configuration.md:
+
+    {"location.*": {"priority": ["navixy", "oem"]},
+     "counters.odometer": {"priority": ["oem", "navixy"]},
+     "*": {"priority": ["navixy", "oem"]}}
+
+Rules are matched against Fleeti field paths once, at construction time
+(exact path > deepest `prefix` / `prefix.*` > `*`). A rule on an object path
+(`counters.odometer`) applies to its sub-fields (`counters.odometer.value`).
+
+Instead of buffering packets, each asset keeps one latest-value slot per
+(field, provider in the field's priority list): a value and its timestamp.
+An update only overwrites slots whose timestamp is older, so out-of-order
+arrivals never regress a field, and null/empty values never erase one.
+Same-provider gateways share the slot (most_recent strategy). Per-asset
+memory is fixed: fields x providers slots, whatever the packet rate.
+
+When merging, the first provider in priority order with a value inside the
+freshness window (relative to the newest timestamp seen for the asset) wins;
+if no provider is fresh, the most recent value is used.
+"""
+
+import argparse
+import random
+import sys
+import time
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from mapping_engine import (
+    OUTPUT_DIR,
+    MappingEngine,
+    build_sample_packet,
+    find_latest_yaml_file,
+    read_field_paths,
+)
+from mapping_functions import to_epoch_seconds
+
+
+# Edge case 4 of the specification: no rules configured
+DEFAULT_PRIORITY_RULES: Dict[str, Dict] = {
+    '*': {'priority': ['navixy', 'oem'], 'same_provider_strategy': 'most_recent'},
+}
+
+SAME_PROVIDER_STRATEGIES = ('most_recent',)
+
+NEVER = float('-inf')
+
+
+def match_priority_rule(field_path: str, rules: Dict[str, Dict]) -> Optional[Dict]:
+    """Most specific rule for a field path: exact > deepest ancestor (exact or `.*`) > `*`."""
+    if field_path in rules:
+        return rules[field_path]
+    parts = field_path.split('.')
+    for depth in range(len(parts) - 1, 0, -1):
+        prefix = '.'.join(parts[:depth])
+        if prefix in rules:
+            return rules[prefix]
+        if f"{prefix}.*" in rules:
+            return rules[f"{prefix}.*"]
+    return rules.get('*')
+
+
+class ProviderMerger:
+    """
+    Per-asset, per-field latest-value slots merged by provider priority.
+
+    Args:
+        field_names: Fleeti field names to merge (e.g. MappingEngine.field_names)
+        field_paths: Field path -> field name (read_field_paths); fields
+            without a path are matched by name
+        rules: provider_priority.rules (defaults to DEFAULT_PRIORITY_RULES)
+        window_seconds: Freshness window for priority selection
+    """
+
+    def __init__(
+        self,
+        field_names: Iterable[str],
+        field_paths: Optional[Dict[str, str]] = None,
+        rules: Optional[Dict[str, Dict]] = None,
+        window_seconds: float = 300.0,
+    ):
+        rules = rules or DEFAULT_PRIORITY_RULES
+        for pattern, rule in rules.items():
+            strategy = rule.get('same_provider_strategy', 'most_recent')
+            if strategy not in SAME_PROVIDER_STRATEGIES:
+                raise ValueError(f"Unknown same_provider_strategy '{strategy}' for '{pattern}'")
+        path_by_name = {name: path for path, name in (field_paths or {}).items()}
+
+        self.window_seconds = window_seconds
+        self.field_names: List[str] = list(field_names)
+        # Per field: (first slot, provider count); slots are laid out field by field
+        self.field_slots: List[Tuple[int, int]] = []
+        # Provider -> [(field name, slot)] for fields whose priority lists it
+        self.provider_slots: Dict[str, List[Tuple[str, int]]] = {}
+        slot = 0
+        for name in self.field_names:
+            rule = match_priority_rule(path_by_name.get(name, name), rules) or {}
+            providers = list(dict.fromkeys(rule.get('priority') or ()))
+            self.field_slots.append((slot, len(providers)))
+            for provider in providers:
+                self.provider_slots.setdefault(provider, []).append((name, slot))
+                slot += 1
+        self.slot_count = slot
+
+        # asset id -> (values, timestamps, [newest timestamp])
+        self.assets: Dict[Any, Tuple[List[Any], array, List[float]]] = {}
+        self.updates = 0
+        self.ignored_updates = 0
+
+    def _asset(self, asset_id: Any) -> Tuple[List[Any], array, List[float]]:
+        state = self.assets.get(asset_id)
+        if state is None:
+            state = ([None] * self.slot_count, array('d', [NEVER]) * self.slot_count, [NEVER])
+            self.assets[asset_id] = state
+        return state
+
+    def update(self, asset_id: Any, provider: str, fleeti: Dict[str, Any], timestamp: Any = None) -> int:
+        """
+        Fold one gateway's Fleeti telemetry into the asset's slots.
+
+        timestamp defaults to fleeti['last_updated_at'] (epoch seconds or ISO
+        8601). Returns the number of slots updated; providers absent from
+        every priority list are ignored.
+        """
+        plan = self.provider_slots.get(provider)
+        if plan is None:
+            self.ignored_updates += 1
+            return 0
+        moment = to_epoch_seconds(fleeti.get('last_updated_at') if timestamp is None else timestamp)
+        if moment is None:
+            self.ignored_updates += 1
+            return 0
+
+        values, times, newest = self._asset(asset_id)
+        if moment > newest[0]:
+            newest[0] = moment
+        changed = 0
+        for name, slot in plan:
+            value = fleeti.get(name)
+            if value is None or value == '':
+                continue
+            # Strictly newer only: out-of-order packets never regress a field,
+            # equal timestamps keep the first arrival (spec edge case 3)
+            if moment > times[slot]:
+                values[slot] = value
+                times[slot] = moment
+                changed += 1
+        self.updates += 1
+        return changed
+
+    def merged(self, asset_id: Any) -> Dict[str, Any]:
+        """Merged Fleeti telemetry for an asset (null for fields no provider has)."""
+        state = self.assets.get(asset_id)
+        if state is None:
+            return dict.fromkeys(self.field_names)
+        values, times, newest = state
+        fresh_after = newest[0] - self.window_seconds
+
+        out = {}
+        for name, (first, count) in zip(self.field_names, self.field_slots):
+            selected = None
+            latest = NEVER
+            for slot in range(first, first + count):
+                moment = times[slot]
+                if moment >= fresh_after:
+                    selected = values[slot]
+                    break
+                if moment > latest:
+                    latest = moment
+                    selected = values[slot]
+            out[name] = selected
+        return out
+
+    def evict(self, asset_id: Any) -> None:
+        self.assets.pop(asset_id, None)
+
+    def evict_idle(self, before: float) -> int:
+        """Drop assets whose newest timestamp is older than `before` (epoch seconds)."""
+        idle = [asset_id for asset_id, state in self.assets.items() if state[2][0] < before]
+        for asset_id in idle:
+            del self.assets[asset_id]
+        return len(idle)
+
+    def footprint(self) -> int:
+        """Approximate bytes held by asset slots."""
+        per_asset = sys.getsizeof([None] * self.slot_count) + sys.getsizeof(array('d', [0.0]) * self.slot_count) + 120
+        return per_asset * len(self.assets)
+
+
+def reference_merge(
+    merger: ProviderMerger, packets: List[Tuple[str, Dict[str, Any], float]]
+) -> Dict[str, Any]:
+    """Buffer-everything merge of one asset's packets (same semantics; used to check ProviderMerger)."""
+    newest = max((moment for _, _, moment in packets), default=NEVER)
+    out = {}
+    for name, (first, count) in zip(merger.field_names, merger.field_slots):
+        providers = [''] * count
+        for provider, slots in merger.provider_slots.items():
+            for field_name, slot in slots:
+                if field_name == name:
+                    providers[slot - first] = provider
+        candidates = []
+        for rank, provider in enumerate(providers):
+            best = None
+            for packet_provider, fleeti, moment in packets:
+                value = fleeti.get(name)
+                if packet_provider != provider or value is None or value == '':
+                    continue
+                if best is None or moment > best[0]:
+                    best = (moment, value)
+            if best is not None:
+                candidates.append((rank, best[0], best[1]))
+        fresh = [c for c in candidates if c[1] >= newest - merger.window_seconds]
+        if fresh:
+            out[name] = min(fresh)[2]
+        elif candidates:
+            out[name] = max(candidates, key=lambda c: (c[1], -c[0]))[2]
+        else:
+            out[name] = None
+    return out
+
+
+def main():
+    """Merge a synthetic two-provider fleet with out-of-order arrivals and check against a buffering merge."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('yaml_file', nargs='?', type=Path, help='Mapping YAML (default: latest in output/)')
+    parser.add_argument('--assets', type=int, default=2000, help='Assets with a Navixy tracker and an OEM feed')
+    parser.add_argument('--packets', type=int, default=50, help='Packets per gateway per asset')
+    parser.add_argument('--jitter', type=float, default=120.0, help='Max arrival delay (seconds) for out-of-order packets')
+    args = parser.parse_args()
+
+    yaml_file = args.yaml_file or find_latest_yaml_file(OUTPUT_DIR)
+    engine = MappingEngine.from_file(yaml_file)
+    rules = {
+        'location.*': {'priority': ['navixy', 'oem']},
+        'counters.odometer': {'priority': ['oem', 'navixy']},
+        'counters.engine_hours': {'priority': ['oem', 'navixy']},
+        'fuel.tank_level.value': {'priority': ['oem', 'navixy']},
+        'motion.speed': {'priority': ['oem', 'navixy']},
+        'io.*': {'priority': ['navixy']},
+        '*': {'priority': ['navixy', 'oem']},
+    }
+    merger = ProviderMerger(engine.field_names, read_field_paths(yaml_file), rules)
+
+    rng = random.Random(3)
+    base = engine.transform(build_sample_packet())
+    oem_fields = ('odometer_value', 'engine_hours_value', 'speed', 'fuel_tank_level_value',
+                  'location_latitude', 'location_longitude')
+    stream = []
+    start_time = 1_760_000_000.0
+    for asset in range(args.assets):
+        for index in range(args.packets):
+            moment = start_time + index * 30 + rng.random()
+            navixy = dict(base, speed=rng.randint(0, 90), odometer_value=1000 + index)
+            if rng.random() < 0.1:
+                navixy['location_latitude'] = None
+            oem = {name: rng.random() * 100 for name in oem_fields}
+            stream.append((moment + rng.random() * args.jitter, asset, 'navixy', navixy, moment))
+            # OEM feed stops halfway for a quarter of the assets (stale -> Navixy wins)
+            if asset % 4 or index < args.packets // 2:
+                stream.append((moment + rng.random() * args.jitter, asset, 'oem', oem, moment + 5))
+    stream.sort(key=lambda item: item[0])  # arrival order
+
+    begin = time.perf_counter()
+    for _, asset, provider, fleeti, moment in stream:
+        merger.update(asset, provider, fleeti, moment)
+    elapsed = time.perf_counter() - begin
+    print(f"Merged {len(stream):,} gateway packets for {args.assets:,} assets: "
+          f"{len(stream) / elapsed:,.0f} updates/s")
+    print(f"Slots per asset: {merger.slot_count} ({merger.footprint() / max(len(merger.assets), 1):,.0f} bytes/asset)")
+
+    per_asset: Dict[int, List] = {}
+    for _, asset, provider, fleeti, moment in stream:
+        per_asset.setdefault(asset, []).append((provider, fleeti, moment))
+    checked = rng.sample(sorted(per_asset), min(100, len(per_asset)))
+    mismatches = sum(1 for asset in checked if merger.merged(asset) != reference_merge(merger, per_asset[asset]))
+    print(f"Mismatches vs buffering merge ({len(checked)} assets): {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Raw Packet Parser - Streaming Parser for Navixy `#D#` AVL Packets
+
+Parses the Navixy Data Forwarding `#D#` line format specified in
+1-provider-fields/raw-packet-structure.md into provider-agnostic packets
+consumed by MappingEngine.transform():
+
+    {
+        "msg_time": "2025-10-06T10:43:10Z",
+        "lat": -20.28516, "lng": 57.43321,
+        "speed": 78, "heading": 143, "alt": 243, "satellites": 15, "hdop": None,
+        "inputs": 9, "outputs": 1, "adc": [0.172, 0.172], "ibutton": None,
+        "params": {"EVENT": 2, "avl_io_1": 1, "board_voltage": 13.642}
+    }
+
+Params are flattened to NAME -> typed VALUE (type 1 int, 2 float, 3 string).
+
+Captures are read from a bytes buffer or a memory-mapped file, one line at
+a time; nothing is decoded to str except the few string-typed values. When
+a params filter is given, params whose NAME is not in it are skipped
+without type conversion. params_projection() derives that filter from a
+mapping YAML with the same column extraction used for the recovery API
+(data-recovery/extract_provider_fields.py), so real-time ingestion and
+recovery read exactly the same provider fields.
+"""
+
+import argparse
+import csv
+import mmap
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Union
+
+sys.path.insert(0, str(Path(__file__).parent / 'data-recovery'))
+from extract_provider_fields import extract_provider_fields  # noqa: E402
+
+
+PACKET_HEADER = b'#D#'
+FIELD_COUNT = 16  # fields after the header, params included
+NOT_AVAILABLE = b'NA'
+
+# Recovery API column prefixes that correspond to `params` section entries
+PARAM_COLUMN_PREFIXES = ('inputs.', 'states.')
+
+# Recovery API bitmask columns -> packet keys
+BITMASK_KEYS = {
+    'discrete_inputs': 'inputs',
+    'discrete_outputs': 'outputs',
+}
+
+FMB140_PARAMETERS_CSV = (
+    Path(__file__).parents[3] / '4-reference-materials' / 'resources' / 'teltonika-fmb140-avl-parameters.csv'
+)
+
+Buffer = Union[bytes, bytearray, mmap.mmap]
+
+
+def parse_coordinate(raw: bytes, hemisphere: bytes) -> float:
+    """Convert DDMM.MMMM / DDDMM.MMMM plus hemisphere to signed decimal degrees."""
+    dot = raw.find(b'.')
+    if dot < 0:
+        dot = len(raw)
+    degrees = int(raw[:dot - 2]) + float(raw[dot - 2:]) / 60
+    if hemisphere == b'S' or hemisphere == b'W':
+        return -degrees
+    return degrees
+
+
+def parse_optional_int(raw: bytes) -> Optional[int]:
+    """Integer field that may be `NA`."""
+    if raw == NOT_AVAILABLE or not raw:
+        return None
+    return int(raw)
+
+
+def parse_adc(raw: bytes) -> list:
+    """Comma-separated ADC floats; empty field -> []."""
+    if not raw:
+        return []
+    return [float(value) for value in raw.split(b',')]
+
+
+def params_projection(yaml_data: Dict[str, Any]) -> FrozenSet[str]:
+    """
+    Names of the `params` entries a mapping YAML references.
+
+    Reuses extract_provider_fields() and keeps its `inputs.*` / `states.*`
+    columns (root fields and discrete_inputs/outputs are not params).
+    """
+    names = set()
+    for column in extract_provider_fields(yaml_data):
+        for prefix in PARAM_COLUMN_PREFIXES:
+            if column.startswith(prefix):
+                names.add(column[len(prefix):])
+    return frozenset(names)
+
+
+def format_msg_time(date: bytes, time_of_day: bytes) -> str:
+    """DDMMYY + HHMMSS (UTC) -> ISO 8601 `YYYY-MM-DDTHH:MM:SSZ`."""
+    return (b'20%b-%b-%bT%b:%b:%bZ' % (
+        date[4:6], date[2:4], date[0:2],
+        time_of_day[0:2], time_of_day[2:4], time_of_day[4:6]
+    )).decode('ascii')
+
+
+class RawPacketParser:
+    """
+    Streaming `#D#` packet parser.
+
+    Args:
+        params_filter: Names of params to decode. None decodes every param.
+
+    Counters:
+        packets: Packets parsed successfully
+        invalid_lines: Non-empty lines that are not valid `#D#` packets
+        params_decoded: Params type-converted into packets
+        params_skipped: Params dropped by the params filter
+        params_malformed: Params dropped for a value that does not parse as its type
+    """
+
+    def __init__(self, params_filter: Optional[Iterable[str]] = None):
+        self.params_filter = (
+            None if params_filter is None
+            else frozenset(name.encode('utf-8') for name in params_filter)
+        )
+        self.packets = 0
+        self.invalid_lines = 0
+        self.params_decoded = 0
+        self.params_skipped = 0
+        self.params_malformed = 0
+
+    @classmethod
+    def for_mapping(cls, yaml_data: Dict[str, Any]) -> 'RawPacketParser':
+        """Parser that decodes only the params referenced by a mapping YAML."""
+        return cls(params_projection(yaml_data))
+
+    def metrics(self) -> Dict[str, int]:
+        """Counters as a dict (for logging / monitoring)."""
+        return {
+            'packets': self.packets,
+            'invalid_lines': self.invalid_lines,
+            'params_decoded': self.params_decoded,
+            'params_skipped': self.params_skipped,
+            'params_malformed': self.params_malformed,
+        }
+
+    def parse_line(self, line: bytes) -> Optional[Dict]:
+        """Parse one packet line (without newline). Returns None for invalid lines."""
+        if not line.startswith(PACKET_HEADER):
+            self.invalid_lines += 1
+            return None
+
+        fields = line[3:].split(b';', FIELD_COUNT - 1)
+        if len(fields) != FIELD_COUNT:
+            self.invalid_lines += 1
+            return None
+
+        try:
+            packet = {
+                'msg_time': format_msg_time(fields[0], fields[1]),
+                'lat': parse_coordinate(fields[2], fields[3]),
+                'lng': parse_coordinate(fields[4], fields[5]),
+                'speed': int(fields[6]),
+                'heading': int(fields[7]),
+                'alt': int(fields[8]),
+                'satellites': int(fields[9]),
+                'hdop': parse_optional_int(fields[10]),
+                'inputs': int(fields[11]),
+                'outputs': int(fields[12]),
+                'adc': parse_adc(fields[13]),
+                'ibutton': None if fields[14] == NOT_AVAILABLE else fields[14].decode('ascii'),
+                'params': self.parse_params(fields[15]),
+            }
+        except ValueError:
+            self.invalid_lines += 1
+            return None
+
+        self.packets += 1
+        return packet
+
+    def parse_params(self, raw: bytes) -> Dict:
+        """Parse `NAME:TYPE:VALUE` entries, decoding only names in the params filter."""
+        params = {}
+        if not raw:
+            return params
+        wanted = self.params_filter
+        items = raw.split(b',')
+        malformed = 0
+
+        for item in items:
+            name, _, typed_value = item.partition(b':')
+            if wanted is not None and name not in wanted:
+                continue
+            value_type, _, value = typed_value.partition(b':')
+            # A malformed param is dropped on its own; the packet is kept
+            try:
+                if value_type == b'1':
+                    params[name.decode('utf-8')] = int(value)
+                elif value_type == b'2':
+                    params[name.decode('utf-8')] = float(value)
+                else:
+                    params[name.decode('utf-8')] = value.decode('utf-8', 'replace')
+            except ValueError:
+                malformed += 1
+
+        self.params_decoded += len(params)
+        self.params_malformed += malformed
+        self.params_skipped += len(items) - len(params) - malformed
+        return params
+
+    def iter_buffer(self, buffer: Buffer, start: int = 0, end: Optional[int] = None) -> Iterator[Dict]:
+        """Yield packets from a newline-separated capture held in a bytes-like buffer or mmap."""
+        end = len(buffer) if end is None else end
+        find = buffer.find
+        parse_line = self.parse_line
+        position = start
+
+        while position < end:
+            line_end = find(b'\n', position, end)
+            if line_end < 0:
+                line_end = end
+            line = buffer[position:line_end].rstrip(b'\r')
+            position = line_end + 1
+            if not line:
+                continue
+            packet = parse_line(line)
+            if packet is not None:
+                yield packet
+
+    def iter_file(self, path: Path) -> Iterator[Dict]:
+        """Yield packets from a capture file via a read-only memory map."""
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield from self.iter_buffer(mapped)
+
+
+def format_packet_line(packet: Dict[str, Any]) -> bytes:
+    """`#D#` line for a packet (inverse of parse_line, for fixtures); coordinates keep 4 minute decimals."""
+    def coordinate(value: float, positive: bytes, negative: bytes, width: int) -> bytes:
+        degrees = int(abs(value))
+        minutes = (abs(value) - degrees) * 60
+        return b'%0*d%07.4f;%b' % (width, degrees, minutes, positive if value >= 0 else negative)
+
+    def optional(value: Any) -> bytes:
+        return b'NA' if value is None else str(value).encode('ascii')
+
+    msg_time = packet['msg_time']
+    params = []
+    for name, value in packet.get('params', {}).items():
+        value_type = b'1' if isinstance(value, int) else b'2' if isinstance(value, float) else b'3'
+        params.append(b'%b:%b:%b' % (name.encode('utf-8'), value_type, str(value).encode('utf-8')))
+    return b';'.join([
+        b'#D#' + (msg_time[8:10] + msg_time[5:7] + msg_time[2:4]).encode('ascii'),
+        (msg_time[11:13] + msg_time[14:16] + msg_time[17:19]).encode('ascii'),
+        coordinate(packet['lat'], b'N', b'S', 2),
+        coordinate(packet['lng'], b'E', b'W', 3),
+        b'%d' % packet.get('speed', 0), b'%d' % packet.get('heading', 0), b'%d' % packet.get('alt', 0),
+        b'%d' % packet.get('satellites', 0), optional(packet.get('hdop')),
+        b'%d' % packet.get('inputs', 0), b'%d' % packet.get('outputs', 0),
+        b','.join(str(value).encode('ascii') for value in packet.get('adc') or ()),
+        optional(packet.get('ibutton')),
+        b','.join(params),
+    ])
+
+
+def load_avl_ids(csv_path: Path = FMB140_PARAMETERS_CSV) -> List[int]:
+    """AVL property IDs listed in the Teltonika FMB140 parameter export (empty if unavailable)."""
+    if not csv_path.exists():
+        return []
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        return [int(row['Property ID in AVL packet']) for row in csv.DictReader(f)
+                if row.get('Property ID in AVL packet', '').isdigit()]
+
+
+def build_sample_line(param_count: int = 120) -> bytes:
+    """Synthetic FMB140-like line: fixed fields plus `param_count` AVL params."""
+    params = [b'EVENT:1:2', b'can_speed:1:79', b'board_voltage:2:13.642', b'hw_mileage:2:46293.146']
+    avl_ids = load_avl_ids() or list(range(1000, 1000 + param_count))
+    params.extend(b'avl_io_%d:1:%d' % (avl_id, avl_id * 7)
+                  for avl_id in avl_ids[:max(param_count - len(params), 0)])
+    return (b'#D#061025;104310;2017.1096;S;05725.9927;E;78;143;243;15;NA;9;1;0.172,0.172;NA;'
+            + b','.join(params))
+
+
+def write_capture(path: Path, lines: int, param_count: int) -> int:
+    """Write a synthetic capture of `lines` packets; returns its size in bytes."""
+    line = build_sample_line(param_count) + b'\n'
+    chunk_lines = 10000
+    with open(path, 'wb') as f:
+        remaining = lines
+        while remaining > 0:
+            count = min(chunk_lines, remaining)
+            f.write(line * count)
+            remaining -= count
+    return path.stat().st_size
+
+
+def main():
+    """Benchmark parser throughput over a synthetic memory-mapped capture."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--lines', type=int, default=10_000_000, help='Packets in the synthetic capture')
+    parser.add_argument('--params', type=int, default=120, help='Params per packet')
+    parser.add_argument('--yaml', type=Path, help='Mapping YAML used for the params filter (default: latest)')
+    args = parser.parse_args()
+
+    import yaml
+    from mapping_engine import OUTPUT_DIR, find_latest_yaml_file
+
+    yaml_file = args.yaml or find_latest_yaml_file(OUTPUT_DIR)
+    with open(yaml_file, 'r', encoding='utf-8') as f:
+        projection = params_projection(yaml.safe_load(f))
+    print(f"Mapping: {yaml_file.name} ({len(projection)} referenced params)")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        capture = Path(tmp_dir) / 'capture.txt'
+        size = write_capture(capture, args.lines, args.params)
+        print(f"Capture: {args.lines:,} lines, {size / 1e6:,.1f} MB, {args.params} params/line")
+
+        for label, params_filter in (('all params', None), ('projection', projection)):
+            packet_parser = RawPacketParser(params_filter)
+            start = time.perf_counter()
+            for _ in packet_parser.iter_file(capture):
+                pass
+            elapsed = time.perf_counter() - start
+            print(f"{label:>11}: {packet_parser.packets / elapsed:,.0f} packets/s "
+                  f"({size / elapsed / 1e6:,.1f} MB/s, {packet_parser.invalid_lines} invalid) - "
+                  f"params decoded {packet_parser.params_decoded:,}, skipped {packet_parser.params_skipped:,}, "
+                  f"malformed {packet_parser.params_malformed:,}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+Recovery Planner - Parallel Multi-Tracker Recovery Requests
+
+Turns recovery scopes (tracker set + time range, or gap_detector.py jobs)
+into Raw Data Read API requests and downloads them concurrently:
+
+- ranges are grouped per (account, tracker), overlapping or adjacent ranges
+  are merged so no time is requested twice, then split into API-sized
+  windows (`--window-hours`, one day by default)
+- requests run on an asyncio scheduler with a concurrency limit per account
+  (API hash); 429/5xx responses and connection errors are retried with
+  exponential backoff and jitter, other HTTP errors fail the request
+- every completed request is appended to a checkpoint file (JSON Lines), so
+  an interrupted run resumes with the requests that are still missing
+- responses are written as `<output_dir>/<tracker_id>/<from>.csv`, the page
+  layout recovery_replay.py --fixtures reads
+
+Payloads are built by extract_provider_fields.generate_json_output with the
+columns the mapping needs. StubRecoveryServer serves fixture CSVs over HTTP
+on localhost, with injectable failures, to exercise the planner without the
+real API (`--stub`).
+
+Usage:
+    python recovery_planner.py --trackers 3312229,3312230 --from 2025-11-20T00:00:00Z --to 2025-11-26T23:59:59Z --hash $NAVIXY_HASH
+    python recovery_planner.py --gap-jobs jobs.jsonl --hash $NAVIXY_HASH --concurrency 8
+    python recovery_planner.py --stub 50 --failure-rate 0.1     # local stub, 50 synthetic trackers
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import yaml
+
+from mapping_engine import OUTPUT_DIR, find_latest_yaml_file
+from mapping_functions import from_epoch_seconds, to_epoch_seconds
+from recovery_replay import (
+    API_HOSTS,
+    RAW_DATA_READ_PATH,
+    RECOVERY_DIR,
+    ApiRecoverySource,
+    iter_page_windows,
+    write_synthetic_fixtures,
+)
+
+sys.path.insert(0, str(Path(__file__).parent / 'data-recovery'))
+from extract_provider_fields import extract_provider_fields, generate_json_output  # noqa: E402
+
+
+PLANNER_OUTPUT_DIR = RECOVERY_DIR / 'output' / 'pages'
+
+# One request covers at most one day (cURL_reference.json range)
+DEFAULT_WINDOW_HOURS = 24.0
+
+# HTTP statuses worth retrying (rate limit, transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# ============================================================================
+# Planning
+# ============================================================================
+
+class PlannedRequest(NamedTuple):
+    """One API-sized request window (from/to inclusive, ISO 8601 UTC)."""
+    account: str
+    tracker_id: str
+    start: str
+    end: str
+
+    @property
+    def key(self) -> str:
+        """Checkpoint key (the account hash is a credential and is not stored)."""
+        return f"{self.tracker_id}/{self.start}/{self.end}"
+
+
+def merge_ranges(ranges: Iterable[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Merge overlapping or adjacent (within one second) inclusive ranges."""
+    merged: List[List[float]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def plan_requests(
+    scopes: Iterable[Tuple[str, str, Any, Any]],
+    window_hours: float = DEFAULT_WINDOW_HOURS,
+) -> Tuple[List[PlannedRequest], Dict[str, float]]:
+    """
+    Split (account, tracker_id, from, to) scopes into deduplicated request windows.
+
+    Returns the requests (tracker, then time order) and planning counters:
+    requested vs planned seconds show how much overlap was removed.
+    """
+    per_tracker: Dict[Tuple[str, str], List[Tuple[float, float]]] = defaultdict(list)
+    requested = 0.0
+    scope_count = 0
+    for account, tracker_id, start, end in scopes:
+        start, end = to_epoch_seconds(start), to_epoch_seconds(end)
+        if start is None or end is None or end < start:
+            continue
+        per_tracker[(account, str(tracker_id))].append((start, end))
+        requested += end - start
+        scope_count += 1
+
+    requests = []
+    planned = 0.0
+    for (account, tracker_id), ranges in sorted(per_tracker.items(), key=lambda item: item[0][1]):
+        for start, end in merge_ranges(ranges):
+            planned += end - start
+            for window_from, window_to in iter_page_windows(
+                from_epoch_seconds(start), from_epoch_seconds(end), window_hours
+            ):
+                requests.append(PlannedRequest(account, tracker_id, window_from, window_to))
+    return requests, {'scopes': scope_count, 'requested_seconds': requested, 'planned_seconds': planned}
+
+
+class Checkpoint:
+    """Append-only JSON Lines record of completed requests (key, rows)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.completed: Dict[str, int] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line of an interrupted run
+                    self.completed[entry['key']] = entry['rows']
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.completed
+
+    def record(self, key: str, rows: int) -> None:
+        self.completed[key] = rows
+        self._file.write(json.dumps({'key': key, 'rows': rows}) + '\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# ============================================================================
+# Scheduler
+# ============================================================================
+
+class RecoveryScheduler:
+    """
+    Downloads planned requests with per-account concurrency, retries and checkpoints.
+
+    Args:
+        columns: Provider columns for the payload (extract_provider_fields)
+        output_dir: Page output directory (<tracker_id>/<from>.csv)
+        checkpoint: Completed-request record; requests already in it are skipped
+        concurrency: Requests in flight per account
+        max_attempts: Attempts per request before it is reported as failed
+        backoff: First retry delay in seconds (doubled per attempt, with jitter)
+        url: API endpoint override (stub server); defaults to the region host
+        region: API region (recovery_replay.API_HOSTS)
+        yaml_version: Mapping version recorded in the payload
+    """
+
+    def __init__(
+        self,
+        columns: Iterable[str],
+        output_dir: Path,
+        checkpoint: Checkpoint,
+        concurrency: int = 4,
+        max_attempts: int = 5,
+        backoff: float = 1.0,
+        url: Optional[str] = None,
+        region: str = 'eu',
+        yaml_version: Optional[str] = None,
+        timeout: float = 120.0,
+    ):
+        self.columns = set(columns)
+        self.output_dir = Path(output_dir)
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.url = url
+        self.region = region
+        self.yaml_version = yaml_version
+        self.timeout = timeout
+        self.sources: Dict[str, ApiRecoverySource] = {}
+        self.stats = {'requests': 0, 'skipped': 0, 'rows': 0, 'retries': 0, 'failed': 0}
+        self.failures: List[Tuple[PlannedRequest, str]] = []
+
+    def _payload(self, request: PlannedRequest) -> Dict[str, Any]:
+        return generate_json_output(
+            self.columns, '', self.yaml_version,
+            tracker_id=request.tracker_id, date_from=request.start, date_to=request.end,
+        )
+
+    def page_path(self, request: PlannedRequest) -> Path:
+        return self.output_dir / request.tracker_id / f"{request.start.replace(':', '')}.csv"
+
+    def _fetch(self, request: PlannedRequest) -> int:
+        """Blocking download of one window to its page file; returns data rows."""
+        source = self.sources.get(request.account)
+        if source is None:
+            source = self.sources[request.account] = ApiRecoverySource(
+                request.account, self.region, self.timeout, url=self.url)
+        path = self.page_path(request)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix('.part')
+        with source.post(self._payload(request)) as response, open(partial, 'wb') as out:
+            shutil.copyfileobj(response, out)
+        with open(partial, 'rb') as f:
+            rows = max(0, sum(1 for line in f if line.strip()) - 1)
+        os.replace(partial, path)  # a page file exists only once complete
+        return rows
+
+    async def _execute(self, request: PlannedRequest, limit: asyncio.Semaphore, executor: ThreadPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+        async with limit:
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    rows = await loop.run_in_executor(executor, self._fetch, request)
+                except urllib.error.HTTPError as error:
+                    reason = f"HTTP {error.code}"
+                    if error.code not in RETRY_STATUSES:
+                        break
+                except (urllib.error.URLError, OSError) as error:
+                    reason = str(error)
+                else:
+                    self.checkpoint.record(request.key, rows)
+                    self.stats['requests'] += 1
+                    self.stats['rows'] += rows
+                    return
+                if attempt < self.max_attempts:
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (0.5 + random.random()))
+        self.stats['failed'] += 1
+        self.failures.append((request, reason))
+
+    async def run(self, requests: List[PlannedRequest]) -> Dict[str, int]:
+        """Execute every request not yet in the checkpoint; returns counters."""
+        pending = [request for request in requests if request.key not in self.checkpoint]
+        self.stats['skipped'] += len(requests) - len(pending)
+        accounts = {request.account for request in pending}
+        limits = {account: asyncio.Semaphore(self.concurrency) for account in accounts}
+        workers = max(1, min(64, self.concurrency * len(accounts)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            await asyncio.gather(*(self._execute(request, limits[request.account], executor) for request in pending))
+        return self.stats
+
+
+# ============================================================================
+# Stub server
+# ============================================================================
+
+class StubRecoveryServer:
+    """
+    Local stand-in for the Raw Data Read API replaying fixture responses.
+
+    Serves the rows of `<fixtures>/<tracker_id>.csv` whose msg_time falls in the
+    request's from/to; `failure_rate` of the requests answer 503 or 429.
+    """
+
+    def __init__(self, fixtures_dir: Path, failure_rate: float = 0.0, latency: float = 0.0, seed: int = 0):
+        self.fixtures_dir = Path(fixtures_dir)
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tables: Dict[str, Tuple[str, List[Tuple[str, str]]]] = {}
+        self.requests = 0
+        self.injected_failures = 0
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    def _table(self, tracker_id: str) -> Optional[Tuple[str, List[Tuple[str, str]]]]:
+        with self.lock:
+            table = self.tables.get(tracker_id)
+            if table is None:
+                path = self.fixtures_dir / f"{tracker_id}.csv"
+                if not path.exists():
+                    return None
+                with open(path, 'r', encoding='utf-8') as f:
+                    header = f.readline()
+                    column = header.rstrip('\r\n').split(',').index('msg_time')
+                    rows = [(line.split(',')[column], line) for line in f]
+                table = self.tables[tracker_id] = (header, rows)
+            return table
+
+    def respond(self, body: Dict[str, Any]) -> Tuple[int, bytes]:
+        with self.lock:
+            self.requests += 1
+            fail = self.random.random() < self.failure_rate
+            if fail:
+                self.injected_failures += 1
+                status = self.random.choice((429, 503))
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return status, b''
+        table = self._table(str(body.get('tracker_id')))
+        if table is None:
+            return 404, b''
+        header, rows = table
+        start, end = body['from'], body['to']  # ISO 8601 UTC strings sort chronologically
+        selected = [line for moment, line in rows if start <= moment <= end]
+        return 200, (header + ''.join(selected)).encode('utf-8')
+
+    def __enter__(self) -> 'StubRecoveryServer':
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != RAW_DATA_READ_PATH:
+                    status, data = 404, b''
+                else:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    status, data = stub.respond(json.loads(self.rfile.read(length) or b'{}'))
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/csv')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}{RAW_DATA_READ_PATH}"
+
+    def __exit__(self, *exc) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def read_gap_jobs(path: Path, default_hash: Optional[str]) -> List[Tuple[str, str, str, str]]:
+    """Scopes from gap_detector.py --output payloads (JSON Lines)."""
+    scopes = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                job = json.loads(line)
+                account = job.get('hash') if not str(job.get('hash', '')).startswith('{{') else None
+                scopes.append((account or default_hash, str(job['tracker_id']), job['from'], job['to']))
+    return scopes
+
+
+def run_planner(scheduler: RecoveryScheduler, requests: List[PlannedRequest]) -> Tuple[Dict[str, int], float]:
+    start = time.perf_counter()
+    stats = asyncio.run(scheduler.run(requests))
+    return stats, time.perf_counter() - start
+
+
+def main():
+    """Plan and download recovery requests (API or local stub)."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mapping', type=Path, help='Mapping YAML for the request columns (default: latest in output/)')
+    parser.add_argument('--trackers', help='Comma-separated tracker IDs')
+    parser.add_argument('--from', dest='date_from', help='Range start (ISO 8601)')
+    parser.add_argument('--to', dest='date_to', help='Range end (ISO 8601)')
+    parser.add_argument('--gap-jobs', type=Path, help='gap_detector.py --output payloads (JSON Lines)')
+    parser.add_argument('--hash', default=os.environ.get('NAVIXY_HASH'), help='API session hash (or NAVIXY_HASH)')
+    parser.add_argument('--region', choices=sorted(API_HOSTS), default='eu', help='API region')
+    parser.add_argument('--output-dir', type=Path,
+                        help=f'Page output directory (default: {PLANNER_OUTPUT_DIR.relative_to(RECOVERY_DIR.parent)})')
+    parser.add_argument('--checkpoint', type=Path, help='Checkpoint file (default: <output-dir>/checkpoint.jsonl)')
+    parser.add_argument('--window-hours', type=float, default=DEFAULT_WINDOW_HOURS, help='Hours per API request')
+    parser.add_argument('--concurrency', type=int, default=4, help='Requests in flight per account')
+    parser.add_argument('--max-attempts', type=int, default=5, help='Attempts per request')
+    parser.add_argument('--backoff', type=float, default=1.0, help='First retry delay (seconds)')
+    parser.add_argument('--stub', type=int, metavar='TRACKERS', help='Run against a local stub with synthetic fixtures')
+    parser.add_argument('--days', type=int, default=3, help='Days of synthetic data per tracker for --stub')
+    parser.add_argument('--failure-rate', type=float, default=0.05, help='Stub responses failing with 429/503')
+    args = parser.parse_args()
+
+    mapping_path = args.mapping or find_latest_yaml_file(OUTPUT_DIR)
+    with open(mapping_path, 'r', encoding='utf-8') as f:
+        yaml_data = yaml.safe_load(f)
+    columns = sorted(extract_provider_fields(yaml_data))
+
+    if args.stub:
+        run_stub_benchmark(args, columns, yaml_data.get('version'))
+        return
+
+    if not args.hash:
+        parser.error('--hash (or NAVIXY_HASH) is required')
+    scopes: List[Tuple[str, str, Any, Any]] = []
+    if args.gap_jobs:
+        scopes.extend(read_gap_jobs(args.gap_jobs, args.hash))
+    if args.trackers:
+        if not (args.date_from and args.date_to):
+            parser.error('--trackers requires --from and --to')
+        scopes.extend((args.hash, t.strip(), args.date_from, args.date_to) for t in args.trackers.split(','))
+    if not scopes:
+        parser.error('nothing to recover: give --trackers/--from/--to or --gap-jobs')
+
+    output_dir = args.output_dir or PLANNER_OUTPUT_DIR
+    requests, plan = plan_requests(scopes, args.window_hours)
+    checkpoint = Checkpoint(args.checkpoint or output_dir / 'checkpoint.jsonl')
+    scheduler = RecoveryScheduler(columns, output_dir, checkpoint, args.concurrency, args.max_attempts,
+                                  args.backoff, region=args.region, yaml_version=yaml_data.get('version'))
+    print(f"Planned {len(requests):,} requests from {plan['scopes']:,} scopes "
+          f"({plan['requested_seconds'] / 3600:,.1f} h requested, {plan['planned_seconds'] / 3600:,.1f} h after merging)")
+    stats, elapsed = run_planner(scheduler, requests)
+    checkpoint.close()
+    print_stats(stats, elapsed)
+    for request, reason in scheduler.failures[:10]:
+        print(f"  failed: {request.key} ({reason})")
+
+
+def print_stats(stats: Dict[str, int], elapsed: float) -> None:
+    print(f"{stats['requests']:,} requests, {stats['rows']:,} rows in {elapsed:.1f} s "
+          f"({stats['requests'] / elapsed:,.1f} requests/s, {stats['rows'] / elapsed:,.0f} rows/s); "
+          f"{stats['skipped']:,} already checkpointed, {stats['retries']:,} retries, {stats['failed']:,} failed")
+
+
+def run_stub_benchmark(args: argparse.Namespace, columns: List[str], yaml_version: Optional[str]) -> None:
+    """Synthetic fixtures behind the stub; interrupted first run, then resume from the checkpoint."""
+    with tempfile.TemporaryDirectory() as scratch:
+        fixtures = Path(scratch) / 'fixtures'
+        tracker_ids = write_synthetic_fixtures(fixtures, columns, args.stub, args.days * 8640)
+        start = to_epoch_seconds('2025-11-26T00:00:00Z')
+        end = start + args.days * 86400 - 1
+        # Overlapping scopes (a manual request plus gap jobs inside it) for two thirds of the trackers
+        scopes = [('account-a' if index % 2 else 'account-b', tracker_id, start, end)
+                  for index, tracker_id in enumerate(tracker_ids)]
+        scopes += [(account, tracker_id, start + 3600 * 5, start + 86400 + 3600)
+                   for account, tracker_id, _, _ in scopes if int(tracker_id) % 3]
+        requests, plan = plan_requests(scopes, args.window_hours)
+        print(f"Synthetic fixtures: {len(tracker_ids)} trackers x {args.days * 8640:,} rows, 2 accounts")
+        print(f"Planned {len(requests):,} requests from {plan['scopes']:,} scopes "
+              f"({plan['requested_seconds'] / 3600:,.0f} h requested, {plan['planned_seconds'] / 3600:,.0f} h after merging)")
+
+        output_dir = Path(scratch) / 'pages'
+        checkpoint_path = output_dir / 'checkpoint.jsonl'
+        with StubRecoveryServer(fixtures, failure_rate=args.failure_rate, latency=0.01) as stub:
+            # First run stops after half the requests (simulated interruption)
+            checkpoint = Checkpoint(checkpoint_path)
+            scheduler = RecoveryScheduler(columns, output_dir, checkpoint, args.concurrency, args.max_attempts,
+                                          backoff=0.05, url=stub.url, yaml_version=yaml_version)
+            stats, elapsed = run_planner(scheduler, requests[:len(requests) // 2])
+            checkpoint.close()
+            print("First run (interrupted):")
+            print_stats(stats, elapsed)
+
+            checkpoint = Checkpoint(checkpoint_path)
+            scheduler = RecoveryScheduler(columns, output_dir, checkpoint, args.concurrency, args.max_attempts,
+                                          backoff=0.05, url=stub.url, yaml_version=yaml_version)
+            stats, elapsed = run_planner(scheduler, requests)
+            checkpoint.close()
+            print("Resumed run:")
+            print_stats(stats, elapsed)
+            print(f"Stub: {stub.requests:,} HTTP requests, {stub.injected_failures:,} injected failures")
+
+        final = Checkpoint(checkpoint_path)
+        final.close()
+        fetched = sum(final.completed.values())
+        expected = len(tracker_ids) * args.days * 8640
+        print(f"Rows in pages: {fetched:,} (fixtures: {expected:,}, "
+              f"{'complete' if fetched == expected else 'INCOMPLETE'}); failed requests: {len(scheduler.failures)}")
+
+
+if __name__ == '__main__':
+    main()
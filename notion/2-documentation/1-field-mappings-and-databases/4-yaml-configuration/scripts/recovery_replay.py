@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Recovery Replay - Stream Recovered Tracker Data Through the Mapping Engine
+
+Replays Navixy Raw Data Read API responses (recovery-workflow.md, F1.5)
+through the same MappingEngine.transform() used in real time and writes the
+Fleeti telemetry as JSON Lines, one file per tracker.
+
+Memory stays bounded whatever the fleet size or date range:
+
+- the date range is requested page by page (one API call per `page_hours`
+  window) and each CSV response is read as a stream, never loaded whole
+- transformed rows are buffered at most `chunk_rows` at a time, then
+  appended to the tracker's output file
+- trackers are spread over `jobs` worker processes; each worker compiles
+  the mapping once and keeps only its current tracker's page open
+
+Responses come either from the API (POST with the request payload format of
+data-recovery/cURL_reference.json) or from recorded fixtures:
+
+    fixtures/<tracker_id>.csv            one response for the whole range
+    fixtures/<tracker_id>/*.csv          one response per page (name order)
+
+If the request payload's `yaml_config_version` differs from the mapping
+version, the columns are re-extracted from the mapping
+(extract_provider_fields.py), as the version-based validation describes.
+
+With `--dedup-index`, packets already delivered in real time (or by an
+earlier replay) are dropped before the mapping engine (packet_dedup.py).
+
+Usage:
+    python recovery_replay.py --trackers 3312229 --from 2025-11-26T00:00:00Z --to 2025-11-26T23:59:59Z --hash $NAVIXY_HASH
+    python recovery_replay.py --fixtures fixtures/ --trackers 101,102 --jobs 4
+    python recovery_replay.py --fixtures fixtures/ --trackers 101 --dedup-index dedup.sqlite
+    python recovery_replay.py --benchmark 16     # synthetic fixtures, 16 trackers
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+import yaml
+
+from asset_state import AssetStateStore
+from mapping_engine import OUTPUT_DIR, MappingEngine, build_sample_packet, find_latest_yaml_file, load_current_artifact
+from mapping_functions import from_epoch_seconds, to_epoch_seconds
+from packet_dedup import DedupIndex, PacketProjection, ingest_capture
+from raw_packet_parser import BITMASK_KEYS, RawPacketParser, format_packet_line
+
+sys.path.insert(0, str(Path(__file__).parent / 'data-recovery'))
+from extract_provider_fields import extract_provider_fields  # noqa: E402
+
+
+RECOVERY_DIR = Path(__file__).parent / 'data-recovery'
+REQUEST_TEMPLATE = RECOVERY_DIR / 'cURL_reference.json'
+REPLAY_OUTPUT_DIR = RECOVERY_DIR / 'output' / 'replay'
+
+API_HOSTS = {
+    'eu': 'api.eu.navixy.com',
+    'us': 'api.us.navixy.com',
+    'ru': 'api.navixy.com',
+}
+RAW_DATA_READ_PATH = '/dwh/v1/tracker/raw_data/read'
+
+PARAM_SECTIONS = ('inputs', 'states')
+
+
+# ============================================================================
+# Requests and pages
+# ============================================================================
+
+def load_request(request_path: Path) -> Dict[str, Any]:
+    """Read a request payload (cURL_reference.json format)."""
+    with open(request_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def request_columns(request: Dict[str, Any], yaml_data: Dict[str, Any]) -> List[str]:
+    """Payload columns, re-extracted from the mapping when its version differs from yaml_config_version."""
+    if request.get('columns') and request.get('yaml_config_version') == yaml_data.get('version'):
+        return list(request['columns'])
+    return sorted(extract_provider_fields(yaml_data))
+
+
+def iter_page_windows(start: str, end: str, page_hours: float) -> Iterator[Tuple[str, str]]:
+    """Split [start, end] into consecutive (from, to) windows of page_hours (ISO 8601 UTC)."""
+    cursor = to_epoch_seconds(start)
+    stop = to_epoch_seconds(end)
+    step = timedelta(hours=page_hours).total_seconds()
+    while cursor <= stop:
+        window_end = min(cursor + step - 1, stop)
+        yield from_epoch_seconds(cursor), from_epoch_seconds(window_end)
+        cursor += step
+
+
+class ApiRecoverySource:
+    """Pages from the Navixy Raw Data Read API (CSV responses, streamed)."""
+
+    def __init__(self, api_hash: str, region: str = 'eu', timeout: float = 120.0, url: Optional[str] = None):
+        self.api_hash = api_hash
+        self.url = url or f"https://{API_HOSTS[region]}{RAW_DATA_READ_PATH}"
+        self.timeout = timeout
+
+    def post(self, request: Dict[str, Any]) -> Any:
+        """POST one request window; returns the (unread) HTTP response."""
+        body = dict(request, hash=self.api_hash)
+        body.pop('yaml_config_version', None)
+        http_request = urllib.request.Request(
+            self.url,
+            data=json.dumps(body).encode('utf-8'),
+            headers={'accept': 'text/csv', 'Content-Type': 'application/json'},
+            method='POST',
+        )
+        return urllib.request.urlopen(http_request, timeout=self.timeout)
+
+    def open_pages(self, request: Dict[str, Any], page_hours: float) -> Iterator[TextIO]:
+        for window_from, window_to in iter_page_windows(request['from'], request['to'], page_hours):
+            response = self.post(dict(request, **{'from': window_from, 'to': window_to}))
+            yield io.TextIOWrapper(response, encoding='utf-8', newline='')
+
+
+class FixtureRecoverySource:
+    """Pages from recorded CSV responses (fixtures/<tracker_id>.csv or fixtures/<tracker_id>/*.csv)."""
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def open_pages(self, request: Dict[str, Any], page_hours: float) -> Iterator[TextIO]:
+        tracker_id = str(request['tracker_id'])
+        page_dir = self.directory / tracker_id
+        if page_dir.is_dir():
+            paths = sorted(page_dir.glob('*.csv'))
+        else:
+            single = self.directory / f"{tracker_id}.csv"
+            paths = [single] if single.exists() else []
+        for path in paths:
+            yield open(path, 'r', encoding='utf-8', newline='')
+
+
+# ============================================================================
+# CSV rows -> packets
+# ============================================================================
+
+def parse_csv_value(raw: str) -> Any:
+    """Typed value of a CSV cell ('' -> None; integers and floats parsed; other text kept)."""
+    if raw == '':
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        pass
+    try:
+        return float(raw)
+    except ValueError:
+        return raw
+
+
+def compile_header(header: Sequence[str]) -> List[Tuple[bool, str]]:
+    """Per column: (is a params entry, packet key)."""
+    plan = []
+    for column in header:
+        section, _, name = column.partition('.')
+        if name and section in PARAM_SECTIONS:
+            plan.append((True, name))
+        else:
+            plan.append((False, BITMASK_KEYS.get(column, column)))
+    return plan
+
+
+def packet_from_row(plan: List[Tuple[bool, str]], row: Sequence[str]) -> Dict[str, Any]:
+    """Provider-agnostic packet (same shape as the real-time parser output) from one CSV row."""
+    packet: Dict[str, Any] = {}
+    params: Dict[str, Any] = {}
+    for (is_param, key), raw in zip(plan, row):
+        value = parse_csv_value(raw)
+        if value is None:
+            continue
+        if is_param:
+            params[key] = value
+        else:
+            packet[key] = value
+    packet['params'] = params
+    return packet
+
+
+# ============================================================================
+# Replay
+# ============================================================================
+
+def replay_tracker(
+    engine: MappingEngine,
+    source: Any,
+    request: Dict[str, Any],
+    output_path: Path,
+    chunk_rows: int = 1000,
+    page_hours: float = 1.0,
+    context: Optional[Dict] = None,
+    dedup: Optional[DedupIndex] = None,
+) -> Dict[str, Any]:
+    """Stream one tracker's pages through the engine into a JSON Lines file; returns counters."""
+    tracker_id = str(request['tracker_id'])
+    stats = {'tracker_id': tracker_id, 'pages': 0, 'rows': 0, 'duplicates': 0, 'output': str(output_path)}
+    transform = engine.transform
+    encode = json.JSONEncoder(default=str, separators=(',', ':')).encode
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    duplicates_before = dedup.duplicates if dedup is not None else 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        for page in source.open_pages(request, page_hours):
+            with page:
+                reader = csv.reader(page)
+                header = next(reader, None)
+                if header is None:
+                    continue
+                plan = compile_header(header)
+                chunk: List[str] = []
+                packets = (packet_from_row(plan, row) for row in reader)
+                if dedup is not None:
+                    packets = dedup.new_packets(tracker_id, packets, chunk_rows)
+                for packet in packets:
+                    chunk.append(encode(transform(packet, context)))
+                    if len(chunk) >= chunk_rows:
+                        chunk.append('')
+                        out.write('\n'.join(chunk))
+                        stats['rows'] += len(chunk) - 1
+                        chunk = []
+                if chunk:
+                    chunk.append('')
+                    out.write('\n'.join(chunk))
+                    stats['rows'] += len(chunk) - 1
+            stats['pages'] += 1
+    if dedup is not None:
+        dedup.flush()
+        stats['duplicates'] = dedup.duplicates - duplicates_before
+    return stats
+
+
+_worker: Dict[str, Any] = {}
+
+
+def _init_worker(mapping_path: str, source_spec: Tuple[str, str, str], options: Dict[str, Any]) -> None:
+    """Process pool initializer: compile the mapping and open the source once per worker."""
+    path = Path(mapping_path)
+    engine = MappingEngine.from_artifact(path) if path.suffix == '.mapc' else MappingEngine.from_file(path)
+    kind, location, region = source_spec
+    if kind == 'fixtures':
+        source = FixtureRecoverySource(Path(location))
+    else:
+        source = ApiRecoverySource(location, region)
+    dedup = None
+    if options.get('dedup_index'):
+        dedup = DedupIndex(Path(options['dedup_index']), memory_budget=options['dedup_memory'],
+                           projection=PacketProjection.for_mapping({'mappings': engine.mappings}))
+    _worker.update(engine=engine, source=source, store=AssetStateStore.for_engine(engine), dedup=dedup, **options)
+
+
+def _replay_job(request: Dict[str, Any]) -> Dict[str, Any]:
+    tracker_id = str(request['tracker_id'])
+    store = _worker['store']
+    # Stateful fields (*_last_changed_at) follow the tracker like in real time
+    asset_id = int(tracker_id) if tracker_id.isdigit() else hash(tracker_id)
+    context = store.bind(_worker['context'], asset_id)
+    start = time.perf_counter()
+    stats = replay_tracker(
+        _worker['engine'], _worker['source'], request,
+        Path(_worker['output_dir']) / f"{tracker_id}.jsonl",
+        _worker['chunk_rows'], _worker['page_hours'], context, _worker['dedup'],
+    )
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def run_replay(
+    mapping_path: Path,
+    requests: List[Dict[str, Any]],
+    source_spec: Tuple[str, str, str],
+    output_dir: Path,
+    jobs: int = 1,
+    chunk_rows: int = 1000,
+    page_hours: float = 1.0,
+    context: Optional[Dict] = None,
+    dedup_index: Optional[Path] = None,
+    dedup_memory: int = 64 * 1024 * 1024,
+) -> List[Dict[str, Any]]:
+    """Replay every tracker request, `jobs` trackers at a time."""
+    options = {'output_dir': str(output_dir), 'chunk_rows': chunk_rows,
+               'page_hours': page_hours, 'context': context or {},
+               'dedup_index': str(dedup_index) if dedup_index else None, 'dedup_memory': dedup_memory}
+    initargs = (str(mapping_path), source_spec, options)
+    if jobs > 1 and len(requests) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=initargs) as pool:
+            return list(pool.map(_replay_job, requests))
+    _init_worker(*initargs)
+    return [_replay_job(request) for request in requests]
+
+
+def peak_rss_mb() -> Tuple[float, float]:
+    """Peak resident set size (MB) of this process and of the largest finished worker."""
+    scale = 1 / 1024 if sys.platform != 'darwin' else 1 / (1024 * 1024)
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own, children
+
+
+# ============================================================================
+# Synthetic fixtures (benchmark)
+# ============================================================================
+
+def write_synthetic_fixtures(directory: Path, columns: List[str], trackers: int, rows: int) -> List[str]:
+    """One CSV response per tracker, derived from the sample packet, one row every 10 s."""
+    packet = build_sample_packet()
+    header = ['msg_time'] + [column for column in columns if column != 'msg_time']
+    template = []
+    for column in header:
+        section, _, name = column.partition('.')
+        if name and section in PARAM_SECTIONS:
+            value = packet['params'].get(name)
+        else:
+            value = packet.get(BITMASK_KEYS.get(column, column))
+        template.append('' if value is None or isinstance(value, list) else str(value))
+    time_index = 0
+    heading_index = header.index('heading') if 'heading' in header else None
+    inputs_index = header.index('discrete_inputs') if 'discrete_inputs' in header else None
+
+    start = to_epoch_seconds('2025-11-26T00:00:00Z')
+    tracker_ids = []
+    directory.mkdir(parents=True, exist_ok=True)
+    for tracker in range(trackers):
+        tracker_id = str(3312229 + tracker)
+        tracker_ids.append(tracker_id)
+        with open(directory / f"{tracker_id}.csv", 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            row = list(template)
+            for index in range(rows):
+                row[time_index] = from_epoch_seconds(start + index * 10)
+                if heading_index is not None:
+                    row[heading_index] = str(index * 7 % 360)
+                if inputs_index is not None:
+                    row[inputs_index] = str(index // 360 % 16)
+                writer.writerow(row)
+    return tracker_ids
+
+
+def write_realtime_captures(fixtures: Path, directory: Path, tracker_ids: List[str], rows: int) -> Dict[str, Path]:
+    """`#D#` captures of the first `rows` fixture rows per tracker (what real-time forwarding delivered)."""
+    captures = {}
+    directory.mkdir(parents=True, exist_ok=True)
+    for tracker_id in tracker_ids:
+        captures[tracker_id] = directory / f"{tracker_id}.txt"
+        with open(fixtures / f"{tracker_id}.csv", 'r', encoding='utf-8', newline='') as f, \
+                open(captures[tracker_id], 'wb') as out:
+            reader = csv.reader(f)
+            plan = compile_header(next(reader))
+            for _, row in zip(range(rows), reader):
+                out.write(format_packet_line(packet_from_row(plan, row)) + b'\n')
+    return captures
+
+
+def main():
+    """Replay recovery data for one or more trackers (API or fixtures)."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mapping', type=Path, help='Mapping YAML or .mapc artifact (default: latest YAML in output/)')
+    parser.add_argument('--request', type=Path, default=REQUEST_TEMPLATE, help='Request payload JSON template')
+    parser.add_argument('--trackers', help='Comma-separated tracker IDs (default: the payload tracker_id)')
+    parser.add_argument('--from', dest='date_from', help='Range start (ISO 8601, default: payload)')
+    parser.add_argument('--to', dest='date_to', help='Range end (ISO 8601, default: payload)')
+    parser.add_argument('--fixtures', type=Path, help='Replay recorded CSV responses from this directory')
+    parser.add_argument('--hash', default=os.environ.get('NAVIXY_HASH'), help='API session hash (or NAVIXY_HASH)')
+    parser.add_argument('--region', choices=sorted(API_HOSTS), default='eu', help='API region')
+    parser.add_argument('--output-dir', type=Path,
+                        help=f'JSON Lines output directory (default: {REPLAY_OUTPUT_DIR.relative_to(RECOVERY_DIR.parent)}, '
+                             'a temporary directory with --benchmark)')
+    parser.add_argument('--jobs', type=int, default=1, help='Trackers replayed in parallel (processes)')
+    parser.add_argument('--chunk-rows', type=int, default=1000, help='Rows buffered before each write')
+    parser.add_argument('--page-hours', type=float, default=1.0, help='API page size (hours per request)')
+    parser.add_argument('--benchmark', type=int, metavar='TRACKERS',
+                        help='Replay synthetic fixtures for this many trackers')
+    parser.add_argument('--rows', type=int, default=8640, help='Rows per tracker for --benchmark (8640 = 1 day @ 10 s)')
+    parser.add_argument('--dedup-index', type=Path, help='Skip packets already in this dedup index (SQLite, created if missing)')
+    parser.add_argument('--dedup-memory-mb', type=float, default=64, help='Bloom filter budget per worker for --dedup-index')
+    args = parser.parse_args()
+
+    mapping_path = args.mapping or find_latest_yaml_file(OUTPUT_DIR)
+    if mapping_path.suffix == '.mapc':
+        yaml_data = load_current_artifact(mapping_path)
+    else:
+        with open(mapping_path, 'r', encoding='utf-8') as f:
+            yaml_data = yaml.safe_load(f)
+
+    template = load_request(args.request)
+    template['columns'] = request_columns(template, yaml_data)
+    template['yaml_config_version'] = yaml_data.get('version')
+    if args.date_from:
+        template['from'] = args.date_from
+    if args.date_to:
+        template['to'] = args.date_to
+
+    with tempfile.TemporaryDirectory() as scratch:
+        fixtures = args.fixtures
+        output_dir = args.output_dir or REPLAY_OUTPUT_DIR
+        tracker_ids = [t.strip() for t in args.trackers.split(',')] if args.trackers else [str(template['tracker_id'])]
+        if args.benchmark:
+            fixtures = Path(scratch) / 'fixtures'
+            tracker_ids = write_synthetic_fixtures(fixtures, template['columns'], args.benchmark, args.rows)
+            output_dir = args.output_dir or Path(scratch) / 'replay'
+            print(f"Synthetic fixtures: {len(tracker_ids)} trackers x {args.rows:,} rows")
+            if args.dedup_index:
+                # First half delivered in real time: the replay must drop exactly those rows
+                captures = write_realtime_captures(fixtures, Path(scratch) / 'realtime', tracker_ids, args.rows // 2)
+                index = DedupIndex(args.dedup_index, memory_budget=int(args.dedup_memory_mb * 1024 * 1024),
+                                   projection=PacketProjection.for_mapping(yaml_data))
+                delivered = sum(ingest_capture(index, tracker_id, capture, RawPacketParser.for_mapping(yaml_data))[0]
+                                for tracker_id, capture in captures.items())
+                index.close()
+                print(f"Real-time captures indexed: {delivered:,} packets")
+
+        if fixtures is not None:
+            source_spec = ('fixtures', str(fixtures), '')
+        elif args.hash:
+            source_spec = ('api', args.hash, args.region)
+        else:
+            parser.error('--hash (or NAVIXY_HASH) is required without --fixtures')
+
+        requests = [dict(template, tracker_id=tracker_id) for tracker_id in tracker_ids]
+        start = time.perf_counter()
+        results = run_replay(mapping_path, requests, source_spec, output_dir,
+                             args.jobs, args.chunk_rows, args.page_hours,
+                             dedup_index=args.dedup_index, dedup_memory=int(args.dedup_memory_mb * 1024 * 1024))
+        elapsed = time.perf_counter() - start
+
+    total_rows = sum(stats['rows'] for stats in results)
+    for stats in results:
+        duplicates = f", {stats['duplicates']:,} duplicates skipped" if stats['duplicates'] else ''
+        print(f"  tracker {stats['tracker_id']}: {stats['rows']:,} rows{duplicates}, {stats['pages']} page(s) "
+              f"in {stats['seconds']:.1f} s -> {stats['output']}")
+    own_mb, worker_mb = peak_rss_mb()
+    print(f"Replayed {total_rows:,} rows from {len(results)} tracker(s) in {elapsed:.1f} s "
+          f"({total_rows / elapsed:,.0f} rows/s, {args.jobs} job(s))")
+    print(f"Peak RSS: main {own_mb:.0f} MB, largest worker {worker_mb:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Status Engine - Table-Driven Status Families and Top Status
+
+Evaluates the four status families of 4-reference-materials/2-status-rules.md
+(connectivity, immobilization, engine, transit) and the top status.
+
+The compatibility matrix is read from the rules document once and compiled
+into one bitmask per asset type/subtype (bit per family), together with the
+subtype's connectivity window (1 h for cold room sites, 24 h otherwise).
+Profiles are cached per (type, subtype) as given in the packet context
+(`asset.type` / `asset.subtype`, names matched case- and separator-
+insensitively), so a packet costs one dict lookup for compatibility.
+
+evaluate() computes every family for a packet in one pass over shared inputs
+(ignition, motion, timestamps) and returns the codes as a tuple in FAMILIES
+order; the top status walks TOP_STATUS_PRIORITY over that tuple:
+
+    1. connectivity = offline
+    2. immobilization = immobilized
+    3. engine = running
+    4. transit (any code)
+    5. connectivity (online)
+
+The mapping's `derive_statuses_*` / `derive_top_status_*` functions
+(mapping_functions.py) use the same compiled profiles; MappingEngine fuses
+the fields computed by them into one evaluate() call per packet, each field
+reading its value from the StatusResult (STATUS_FUNCTIONS). Transit is a state
+machine (3 minutes stationary -> parked, ignition edges immediate); its
+per-asset state lives in the AssetStateStore `transit` slot, and without
+state the initial-state rules apply.
+
+recompute() is the batch mode: statuses for a whole fleet of latest
+snapshots at a given time (e.g. after a matrix change, or to sweep
+connectivity).
+
+Usage:
+    engine = StatusEngine()
+    result = engine.evaluate(fleeti, context)            # StatusResult
+    engine.apply(fleeti, result)                         # statuses_* / top_status_* fields
+    python status_engine.py                              # per-family microbenchmark
+"""
+
+import argparse
+import math
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from mapping_functions import get_installation_value, to_epoch_seconds
+
+
+SCRIPT_DIR = Path(__file__).parent
+STATUS_RULES_MD = SCRIPT_DIR.parents[2] / "4-reference-materials" / "2-status-rules.md"
+
+FAMILIES = ('connectivity', 'immobilization', 'engine', 'transit')
+CONNECTIVITY, IMMOBILIZATION, ENGINE, TRANSIT = range(len(FAMILIES))
+FAMILY_BITS = {family: 1 << index for index, family in enumerate(FAMILIES)}
+CONNECTIVITY_BIT, IMMOBILIZATION_BIT, ENGINE_BIT, TRANSIT_BIT = (1 << index for index in range(len(FAMILIES)))
+
+# (family index, required code or None for any code), first match wins
+TOP_STATUS_PRIORITY = (
+    (CONNECTIVITY, 'offline'),
+    (IMMOBILIZATION, 'immobilized'),
+    (ENGINE, 'running'),
+    (TRANSIT, None),
+    (CONNECTIVITY, None),
+)
+
+ONLINE_WINDOW_SECONDS = 24 * 3600
+# Subtypes with a shorter connectivity window (normalized type, subtype)
+ONLINE_WINDOW_OVERRIDES = {('site', 'coldroom'): 3600}
+
+IN_TRANSIT = 'in_transit'
+PARKED = 'parked'
+TRANSIT_SPEED_THRESHOLD = 0.5  # km/h, filters GPS drift
+PARKED_AFTER_SECONDS = 180
+
+# Unknown asset types keep connectivity only
+UNKNOWN_PROFILE_MASK = CONNECTIVITY_BIT
+
+
+def normalize_asset_name(value: Any) -> str:
+    """'Cold Room', 'cold_room', 'ColdRoom' -> 'coldroom'."""
+    return re.sub(r'[^a-z0-9]', '', str(value).lower()) if value is not None else ''
+
+
+def load_compatibility_matrix(rules_path: Path = STATUS_RULES_MD) -> Dict[Tuple[str, str], int]:
+    """Parse the compatibility matrix table into (type, subtype) -> family bitmask."""
+    matrix: Dict[Tuple[str, str], int] = {}
+    columns: Optional[List[Optional[int]]] = None
+    with open(rules_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.startswith('|'):
+                if columns is not None and matrix:
+                    break  # end of the first table
+                continue
+            cells = [cell.strip() for cell in line.strip().strip('|').split('|')]
+            if columns is None:
+                lowered = [cell.lower() for cell in cells]
+                if 'connectivity' in lowered:
+                    columns = [FAMILY_BITS.get(cell) for cell in lowered]
+                continue
+            if set(cells[0]) <= set('-: '):
+                continue
+            asset_type, _, subtype = cells[0].partition('.')
+            mask = 0
+            for bit, cell in zip(columns, cells):
+                if bit and cell.lower() == 'yes':
+                    mask |= bit
+            matrix[(normalize_asset_name(asset_type), normalize_asset_name(subtype))] = mask
+    if not matrix:
+        raise ValueError(f"No compatibility matrix found in {rules_path}")
+    return matrix
+
+
+def transit_transition(
+    previous: Optional[str],
+    stationary_since: float,
+    previous_ignition: Optional[bool],
+    ignition: Optional[bool],
+    moving: Optional[bool],
+    speed: Optional[float],
+    timestamp: float,
+    parked_after: float = PARKED_AFTER_SECONDS,
+) -> Tuple[Optional[str], float]:
+    """
+    One step of the transit state machine; returns (status, stationary since).
+
+    stationary_since is NaN while moving. With previous=None this applies the
+    initial-state rules (default in_transit until 3 minutes stationary).
+    """
+    if ignition is True and previous_ignition is not True:
+        return IN_TRANSIT, math.nan
+    if ignition is False and previous_ignition is True:
+        return PARKED, timestamp
+    # Speed wins over a conflicting movement flag
+    if moving is True or (speed is not None and speed > TRANSIT_SPEED_THRESHOLD):
+        return IN_TRANSIT, math.nan
+    if moving is None and speed is None:
+        return previous, stationary_since  # missing data: keep status
+    since = stationary_since if stationary_since == stationary_since else timestamp
+    if previous == PARKED or timestamp - since >= parked_after:
+        return PARKED, since
+    return IN_TRANSIT, since
+
+
+class StatusProfile(NamedTuple):
+    """Compiled compatibility of one asset type/subtype."""
+    mask: int
+    online_window: float
+
+
+class StatusResult(NamedTuple):
+    """Family codes in FAMILIES order (None when incompatible or unknown) and the top status."""
+    compatible: int
+    codes: Tuple[Optional[str], ...]
+    top_family: Optional[str]
+    top_code: Optional[str]
+
+
+class StatusEngine:
+    """
+    Table-driven evaluation of all status families.
+
+    Args:
+        matrix: (type, subtype) -> family bitmask (default: parsed from 2-status-rules.md)
+        parked_after: Stationary seconds before in_transit -> parked
+    """
+
+    def __init__(self, matrix: Optional[Dict[Tuple[str, str], int]] = None,
+                 parked_after: float = PARKED_AFTER_SECONDS):
+        self.matrix = matrix if matrix is not None else load_compatibility_matrix()
+        self.parked_after = parked_after
+        self._profiles: Dict[Tuple[Any, Any], StatusProfile] = {}
+
+    # ------------------------------------------------------------------
+    # Profiles
+    # ------------------------------------------------------------------
+
+    def profile(self, asset: Optional[Dict]) -> StatusProfile:
+        """Compiled profile for context['asset'] (cached per raw type/subtype)."""
+        asset = asset or {}
+        raw_key = (asset.get('type'), asset.get('subtype'))
+        profile = self._profiles.get(raw_key)
+        if profile is None:
+            asset_type, subtype = normalize_asset_name(raw_key[0]), normalize_asset_name(raw_key[1])
+            mask = self.matrix.get((asset_type, subtype))
+            if mask is None:
+                mask = self.matrix.get((asset_type, 'undefined'), self.matrix.get((asset_type, '')))
+            if mask is None:
+                mask = UNKNOWN_PROFILE_MASK
+            window = ONLINE_WINDOW_OVERRIDES.get((asset_type, subtype), ONLINE_WINDOW_SECONDS)
+            profile = self._profiles[raw_key] = StatusProfile(mask, window)
+        return profile
+
+    def compatible(self, context: Optional[Dict], family: str) -> bool:
+        return bool(self.profile((context or {}).get('asset')).mask & FAMILY_BITS[family])
+
+    # ------------------------------------------------------------------
+    # Families
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def connectivity_code(profile: StatusProfile, last_updated: Optional[float], now: Optional[float]) -> Optional[str]:
+        """online while last_updated_at is within the subtype's window of now (packet time if no now)."""
+        if not profile.mask & CONNECTIVITY_BIT or last_updated is None:
+            return None
+        if now is None:
+            return 'online'
+        return 'online' if now - last_updated < profile.online_window else 'offline'
+
+    @staticmethod
+    def engine_code(profile: StatusProfile, ignition: Optional[bool]) -> Optional[str]:
+        if not profile.mask & ENGINE_BIT or ignition is None:
+            return None
+        return 'running' if ignition else 'standby'
+
+    @staticmethod
+    def immobilization_code(profile: StatusProfile, fleeti: Dict, context: Optional[Dict]) -> Optional[str]:
+        if not profile.mask & IMMOBILIZATION_BIT:
+            return None
+        output_number = get_installation_value(context, 'immobilizer_output_number', 1)
+        state = fleeti.get(f'outputs_individual_output_{output_number}')
+        if state is None:
+            return None
+        return 'immobilized' if state else 'free'
+
+    def transit_code(self, profile: StatusProfile, fleeti: Dict, state: Any, key: str,
+                     timestamp: Optional[float]) -> Optional[str]:
+        """
+        Transit from the asset's state machine slot, or the initial-state rules without state.
+
+        Without a timestamp the state machine cannot be ordered, so only the
+        initial-state rules apply.
+        """
+        if not profile.mask & TRANSIT_BIT:
+            return None
+        if timestamp is None:
+            state, timestamp = None, 0.0
+        ignition = fleeti.get('ignition_value')
+        moving = fleeti.get('is_moving_value')
+        speed = fleeti.get('speed')
+        if state is not None:
+            return state.transit_status(key, ignition, moving, speed, timestamp, self.parked_after)
+        return transit_transition(None, math.nan, None, ignition, moving, speed, timestamp, self.parked_after)[0]
+
+    @staticmethod
+    def top_status(codes: Tuple[Optional[str], ...]) -> Tuple[Optional[str], Optional[str]]:
+        """(family, code) of the highest-priority status."""
+        for index, required in TOP_STATUS_PRIORITY:
+            code = codes[index]
+            if code is not None and (required is None or code == required):
+                return FAMILIES[index], code
+        return None, None
+
+    # ------------------------------------------------------------------
+    # One pass
+    # ------------------------------------------------------------------
+
+    def evaluate(self, fleeti: Dict, context: Optional[Dict] = None,
+                 transit_key: str = 'derive_statuses_transit_code',
+                 keep_transit: bool = True) -> StatusResult:
+        """
+        All families and the top status for one Fleeti telemetry dict.
+
+        Transit uses context['state'] when bound; otherwise an existing
+        statuses_transit_code (snapshot) is kept when keep_transit is set,
+        else the initial-state rules apply. The state machine is clocked by
+        last_updated_at, or context now without it. MappingEngine passes
+        keep_transit=False: its output dict always holds the key.
+        """
+        context = context or {}
+        profile = self.profile(context.get('asset'))
+        last_updated = to_epoch_seconds(fleeti.get('last_updated_at'))
+        now = to_epoch_seconds(context.get('now'))
+        state = context.get('state')
+
+        if state is None and keep_transit and 'statuses_transit_code' in fleeti:
+            transit = fleeti['statuses_transit_code'] if profile.mask & TRANSIT_BIT else None
+        else:
+            transit = self.transit_code(profile, fleeti, state, transit_key,
+                                        last_updated if last_updated is not None else now)
+        codes = (
+            self.connectivity_code(profile, last_updated, now),
+            self.immobilization_code(profile, fleeti, context),
+            self.engine_code(profile, fleeti.get('ignition_value')),
+            transit,
+        )
+        top_family, top_code = self.top_status(codes)
+        return StatusResult(profile.mask, codes, top_family, top_code)
+
+    @staticmethod
+    def apply(fleeti: Dict, result: StatusResult) -> Dict:
+        """Write statuses_<family>_compatible/_code and top_status_family/_code into fleeti."""
+        for index, family in enumerate(FAMILIES):
+            fleeti[f'statuses_{family}_compatible'] = bool(result.compatible & (1 << index))
+            fleeti[f'statuses_{family}_code'] = result.codes[index]
+        fleeti['top_status_family'] = result.top_family
+        fleeti['top_status_code'] = result.top_code
+        return fleeti
+
+    def recompute(self, snapshots: Iterable[Tuple[Dict, Optional[Dict]]], now: Any) -> Iterator[StatusResult]:
+        """
+        Batch mode: statuses for (latest Fleeti snapshot, asset) pairs at `now`.
+
+        Snapshots keep their transit code (no packet replay); connectivity,
+        compatibility and the top status are recomputed.
+        """
+        context: Dict[str, Any] = {'now': to_epoch_seconds(now)}
+        for fleeti, asset in snapshots:
+            context['asset'] = asset
+            yield self.evaluate(fleeti, context)
+
+
+# Mapping functions covered by one evaluate() call -> reader of their value from the StatusResult
+STATUS_FUNCTIONS: Dict[str, Callable[[StatusResult], Any]] = {
+    'derive_top_status_family': lambda result: result.top_family,
+    'derive_top_status_code': lambda result: result.top_code,
+}
+for _index, _family in enumerate(FAMILIES):
+    STATUS_FUNCTIONS[f'derive_statuses_{_family}_compatible'] = (
+        lambda result, bit=1 << _index: bool(result.compatible & bit))
+    STATUS_FUNCTIONS[f'derive_statuses_{_family}_code'] = lambda result, index=_index: result.codes[index]
+
+
+# ============================================================================
+# Microbenchmark
+# ============================================================================
+
+ASSET_SAMPLES = (
+    {'type': 'Vehicle', 'subtype': 'Truck'},
+    {'type': 'Vehicle', 'subtype': 'Agricultural'},
+    {'type': 'Equipment', 'subtype': 'ElectricGenerator'},
+    {'type': 'Site', 'subtype': 'Coldroom'},
+    {'type': 'Phone'},
+)
+
+
+def synthetic_fleet(count: int, now: float, seed: int = 9) -> List[Tuple[Dict, Dict]]:
+    """Fleeti snapshots with random ignition/motion/outputs and ages up to two days."""
+    rng = random.Random(seed)
+    fleet = []
+    for _ in range(count):
+        fleeti = {
+            'last_updated_at': now - rng.random() * 2 * 86400,
+            'ignition_value': rng.choice((True, False, None)),
+            'is_moving_value': rng.choice((True, False, None)),
+            'speed': rng.choice((0, 0.3, 12.0, None)),
+            'outputs_individual_output_1': rng.choice((0, 1, None)),
+        }
+        fleet.append((fleeti, dict(rng.choice(ASSET_SAMPLES), installation={'immobilizer_output_number': 1})))
+    return fleet
+
+
+def per_field_reference(fleeti: Dict, context: Dict) -> StatusResult:
+    """The mapping's per-field functions chained through a Fleeti dict (used to check evaluate)."""
+    from mapping_functions import FUNCTION_REGISTRY
+    out = dict(fleeti)
+    for family in FAMILIES:
+        out[f'statuses_{family}_compatible'] = FUNCTION_REGISTRY[f'derive_statuses_{family}_compatible'](None, out, {}, context)
+    for family in FAMILIES:
+        out[f'statuses_{family}_code'] = FUNCTION_REGISTRY[f'derive_statuses_{family}_code'](None, out, {}, context)
+    mask = sum(1 << index for index, family in enumerate(FAMILIES) if out[f'statuses_{family}_compatible'])
+    return StatusResult(
+        mask, tuple(out[f'statuses_{family}_code'] for family in FAMILIES),
+        FUNCTION_REGISTRY['derive_top_status_family'](None, out, {}, context),
+        FUNCTION_REGISTRY['derive_top_status_code'](None, out, {}, context),
+    )
+
+
+def main():
+    """Per-family microbenchmark, one-pass vs per-field evaluation, and fleet-wide recompute."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--packets', type=int, default=100_000, help='Synthetic Fleeti dicts per benchmark')
+    args = parser.parse_args()
+
+    engine = StatusEngine()
+    print(f"Compatibility matrix: {len(engine.matrix)} asset types/subtypes from {STATUS_RULES_MD.name}")
+    now = to_epoch_seconds('2025-11-26T12:00:00Z')
+    fleet = synthetic_fleet(args.packets, now)
+    prepared = [(fleeti, engine.profile(asset), to_epoch_seconds(fleeti['last_updated_at']), {'asset': asset})
+                for fleeti, asset in fleet]
+
+    families = {
+        'connectivity': lambda f, p, t, c: engine.connectivity_code(p, t, now),
+        'immobilization': lambda f, p, t, c: engine.immobilization_code(p, f, c),
+        'engine': lambda f, p, t, c: engine.engine_code(p, f.get('ignition_value')),
+        'transit': lambda f, p, t, c: engine.transit_code(p, f, None, 'transit', t),
+    }
+    for family, evaluate in families.items():
+        start = time.perf_counter()
+        for fleeti, profile, moment, context in prepared:
+            evaluate(fleeti, profile, moment, context)
+        elapsed = time.perf_counter() - start
+        print(f"  {family:<15} {elapsed / len(prepared) * 1e9:,.0f} ns/packet")
+
+    contexts = [{'asset': asset, 'now': now} for _, asset in fleet]
+    live = [dict(fleeti) for fleeti, _ in fleet]  # no stored transit code: evaluated like a packet
+    start = time.perf_counter()
+    results = [engine.evaluate(fleeti, context) for fleeti, context in zip(live, contexts)]
+    one_pass = time.perf_counter() - start
+    start = time.perf_counter()
+    references = [per_field_reference(fleeti, context) for fleeti, context in zip(live, contexts)]
+    per_field = time.perf_counter() - start
+    mismatches = sum(1 for result, reference in zip(results, references) if result != reference)
+    print(f"One pass (all families + top status): {one_pass / len(live) * 1e9:,.0f} ns/packet; "
+          f"per-field functions: {per_field / len(live) * 1e9:,.0f} ns/packet; mismatches: {mismatches}")
+
+    snapshots = [(engine.apply(dict(fleeti), result), asset) for (fleeti, asset), result in zip(fleet, results)]
+    start = time.perf_counter()
+    recomputed = list(engine.recompute(snapshots, now + 86400))
+    elapsed = time.perf_counter() - start
+    offline = sum(1 for result in recomputed if result.top_code == 'offline')
+    print(f"Fleet recompute one day later: {len(recomputed):,} assets in {elapsed * 1000:.0f} ms "
+          f"({len(recomputed) / elapsed:,.0f} assets/s), {offline:,} offline")
+
+
+if __name__ == '__main__':
+    main()
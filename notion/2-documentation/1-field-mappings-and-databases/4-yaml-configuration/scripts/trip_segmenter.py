@@ -0,0 +1,708 @@
+#!/usr/bin/env python3
+"""
+Trip Segmenter - Streaming Trips for derive_ongoing_trip_*
+
+A trip is a run of consecutive `in_transit` packets of one asset: it starts
+at the first packet whose transit status is in_transit (after a parked or
+unknown one) and closes at the next packet that is not. TripSegmenter keeps
+per asset only the current trip and a few recent ones; each trip holds
+scalars (bounds, odometer min/max, haversine distance) and a simplified
+waypoint path:
+
+- Waypoints use an opening window: points stay in a small buffer while the
+  segment from the last kept waypoint to the newest point stays within
+  `tolerance_m` of every buffered point. Past `max_waypoints`, the path is
+  re-simplified (Douglas-Peucker) with a doubled tolerance, so memory per
+  trip is capped however long the trip lasts.
+- Every trip remembers the non-transit packets around it (`opened_after`,
+  `closed_at`). A late in_transit packet (out of order or recovered) extends
+  the trip whose gap it falls in, or starts a recovered trip between two
+  known trips; late parked packets tighten those gaps, or split a trip that
+  spanned an outage (both points around a silence longer than
+  `gap_seconds` are always kept, so the cut is exact). Reopened trips are
+  re-emitted with a higher revision.
+- Distances from the trip start are stored on the kept waypoints, so splits
+  divide distance and odometer without the raw points. Late packets older
+  than the trips still kept per asset (`recent_trips`) are dropped
+  (`expired`).
+
+Closed and revised trips are collected for the trip history API (F6.7);
+`pop_trips()` drains them and `Trip.record()` renders one.
+
+Usage:
+    segmenter = TripSegmenter()
+    fleeti = engine.transform(packet, segmenter.bind(context, asset_id))
+    for trip in segmenter.pop_trips():
+        store_trip(trip.record())
+"""
+
+import argparse
+import bisect
+import math
+import random
+import time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from asset_state import EARTH_RADIUS_M, distance_m
+from mapping_functions import FUNCTION_REGISTRY, from_epoch_seconds
+from status_engine import IN_TRANSIT
+
+
+TOLERANCE_M = 15.0
+MAX_WAYPOINTS = 500
+MAX_PENDING = 64
+RECENT_TRIPS = 8
+GAP_SECONDS = 60.0
+METERS_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180.0
+
+# (epoch seconds, lat, lng, meters from the trip start, odometer)
+Point = Tuple[float, float, float, float, Optional[float]]
+
+
+def segment_deviation_m(point: Point, start: Point, end: Point) -> float:
+    """Distance in meters from point to the segment start-end (local equirectangular projection)."""
+    scale = math.cos(math.radians(start[1]))
+    px = (point[2] - start[2]) * scale
+    py = point[1] - start[1]
+    ex = (end[2] - start[2]) * scale
+    ey = end[1] - start[1]
+    length = ex * ex + ey * ey
+    if length > 0:
+        t = max(0.0, min(1.0, (px * ex + py * ey) / length))
+        px -= t * ex
+        py -= t * ey
+    return math.sqrt(px * px + py * py) * METERS_PER_DEGREE
+
+
+def douglas_peucker(points: List[Point], tolerance_m: float) -> List[Point]:
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        worst, index = tolerance_m, None
+        for k in range(first + 1, last):
+            deviation = segment_deviation_m(points[k], points[first], points[last])
+            if deviation > worst:
+                worst, index = deviation, k
+        if index is not None:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def point_distance_m(a: Point, b: Point) -> float:
+    return distance_m(a[1], a[2], b[1], b[2])
+
+
+def shifted(points: List[Point], delta: float) -> List[Point]:
+    """Points with their distance from the trip start moved by delta."""
+    return [(t, lat, lng, meters + delta, odometer) for t, lat, lng, meters, odometer in points]
+
+
+# ============================================================================
+# Waypoint path and trips
+# ============================================================================
+
+class WaypointPath:
+    """
+    Simplified polyline: kept waypoints plus the opening-window buffer (last item = newest point).
+
+    Both points around a time gap longer than `gap_seconds` are always kept,
+    so a trip can later be split exactly where recovered parked packets land.
+    """
+
+    __slots__ = ('tolerance_m', 'max_points', 'max_pending', 'gap_seconds', 'points', 'pending')
+
+    def __init__(self, tolerance_m: float, max_points: int, max_pending: int, gap_seconds: float):
+        self.tolerance_m = tolerance_m
+        self.max_points = max_points
+        self.max_pending = max_pending
+        self.gap_seconds = gap_seconds
+        self.points: List[Point] = []
+        self.pending: List[Point] = []
+
+    def __len__(self) -> int:
+        return len(self.points) + len(self.pending)
+
+    def copy_empty(self) -> 'WaypointPath':
+        return WaypointPath(self.tolerance_m, self.max_points, self.max_pending, self.gap_seconds)
+
+    def sequence(self) -> List[Point]:
+        return self.points + self.pending
+
+    def append(self, point: Point) -> None:
+        points, pending = self.points, self.pending
+        if not points:
+            points.append(point)
+            return
+        newest = pending[-1] if pending else points[-1]
+        if point[0] - newest[0] > self.gap_seconds:
+            if pending:
+                points.append(newest)
+                pending.clear()
+            points.append(point)
+            self._cap()
+            return
+        if pending:
+            anchor = points[-1]
+            if len(pending) >= self.max_pending or any(
+                    segment_deviation_m(kept, anchor, point) > self.tolerance_m for kept in pending):
+                points.append(newest)
+                pending.clear()
+                self._cap()
+        pending.append(point)
+
+    def insert(self, point: Point) -> float:
+        """
+        Place a late point between the first and newest point; returns the path length change.
+
+        The point is kept inside a time gap or when it is off the kept segment
+        by more than the tolerance (dropped points next to it may then end up
+        slightly past the tolerance); otherwise it only counts for the distance.
+        """
+        sequence = self.sequence()
+        index = bisect.bisect_right([item[0] for item in sequence], point[0])
+        before, after = sequence[index - 1], sequence[index]
+        to_point = point_distance_m(before, point)
+        delta = to_point + point_distance_m(point, after) - point_distance_m(before, after)
+        point = (point[0], point[1], point[2], before[3] + to_point, point[4])
+        kept = len(self.points)
+        if index < kept:
+            self.points[index:] = shifted(self.points[index:], delta)
+            self.pending = shifted(self.pending, delta)
+            if (after[0] - before[0] > self.gap_seconds
+                    or segment_deviation_m(point, before, after) > self.tolerance_m):
+                self.points.insert(index, point)
+                self._cap()
+            return delta
+        position = index - kept
+        self.pending[position:] = [point] + shifted(self.pending[position:], delta)
+        if segment_deviation_m(point, self.points[-1], self.pending[-1]) > self.tolerance_m:
+            # Keep the whole buffer rather than re-running the window over it
+            self.points.extend(self.pending[:-1])
+            del self.pending[:-1]
+            self._cap()
+        return delta
+
+    def prepend(self, point: Point) -> float:
+        """Put a point before the first one; returns the added length."""
+        first = self.points[0]
+        delta = point_distance_m(point, first)
+        self.points = [point] + shifted(self.points, delta)
+        self.pending = shifted(self.pending, delta)
+        self._cap()
+        return delta
+
+    def split(self, timestamp: float) -> Optional['WaypointPath']:
+        """Cut the path at timestamp: self keeps the earlier points, the returned path the later ones."""
+        sequence = self.sequence()
+        index = bisect.bisect_right([item[0] for item in sequence], timestamp)
+        if index == 0 or index == len(sequence):
+            return None
+        right = self.copy_empty()
+        base = sequence[index][3]
+        kept = len(self.points)
+        if index < kept:
+            right.points = shifted(self.points[index:], -base)
+            right.pending = shifted(self.pending, -base)
+            del self.points[index:]
+            self.pending = []
+        else:
+            position = index - kept
+            right.points = shifted(self.pending[position:position + 1], -base)
+            right.pending = shifted(self.pending[position + 1:], -base)
+            del self.pending[position:]
+        return right
+
+    def _cap(self) -> None:
+        while len(self.points) > self.max_points:
+            self.tolerance_m *= 2
+            self.points = douglas_peucker(self.points, self.tolerance_m)
+
+    def newest(self) -> Point:
+        return self.pending[-1] if self.pending else self.points[-1]
+
+    def waypoints(self) -> List[Point]:
+        return self.points + self.pending[-1:]
+
+
+class Trip:
+    """One trip of an asset (times are epoch seconds; closed_at is None while ongoing)."""
+
+    __slots__ = ('trip_id', 'asset_id', 'started_at', 'ended_at', 'opened_after', 'closed_at',
+                 'distance_m', 'odometer_min', 'odometer_max', 'path', 'revision')
+
+    def __init__(self, trip_id: int, asset_id: Hashable, started_at: float, opened_after: Optional[float],
+                 closed_at: Optional[float], path: WaypointPath):
+        self.trip_id = trip_id
+        self.asset_id = asset_id
+        self.started_at = started_at
+        self.ended_at = started_at
+        self.opened_after = opened_after    # latest known non-transit packet before the trip
+        self.closed_at = closed_at          # first known non-transit packet after the trip
+        self.distance_m = 0.0
+        self.odometer_min: Optional[float] = None
+        self.odometer_max: Optional[float] = None
+        self.path = path
+        self.revision = 0
+
+    def add_odometer(self, value: Optional[float]) -> None:
+        if value is None:
+            return
+        if self.odometer_min is None or value < self.odometer_min:
+            self.odometer_min = value
+        if self.odometer_max is None or value > self.odometer_max:
+            self.odometer_max = value
+
+    def add_position(self, timestamp: float, lat: float, lng: float, odometer: Optional[float]) -> None:
+        path = self.path
+        if not path.points:
+            path.append((timestamp, lat, lng, 0.0, odometer))
+            return
+        newest = path.newest()
+        if timestamp >= newest[0]:
+            self.distance_m += point_distance_m(newest, (timestamp, lat, lng))
+            path.append((timestamp, lat, lng, self.distance_m, odometer))
+        elif timestamp < path.points[0][0]:
+            self.distance_m += path.prepend((timestamp, lat, lng, 0.0, odometer))
+        else:
+            self.distance_m += path.insert((timestamp, lat, lng, 0.0, odometer))
+
+    def split(self, timestamp: float, trip_id: int) -> Optional['Trip']:
+        """
+        Cut the trip at a late non-transit packet; self keeps the part before it
+        and the returned trip (closed_at / odometer max inherited) the part after.
+        """
+        right_path = self.path.split(timestamp)
+        if right_path is None:
+            return None
+        left_newest = self.path.newest()
+        right_first = right_path.points[0]
+        right = Trip(trip_id, self.asset_id, right_first[0], timestamp, self.closed_at, right_path)
+        right.ended_at = self.ended_at
+        right.distance_m = self.distance_m - (left_newest[3] + point_distance_m(left_newest, right_first))
+        right.odometer_max = self.odometer_max
+        right.odometer_min = min((point[4] for point in right_path.sequence() if point[4] is not None),
+                                 default=self.odometer_max)
+        self.ended_at = left_newest[0]
+        self.closed_at = timestamp
+        self.distance_m = left_newest[3]
+        self.odometer_max = max((point[4] for point in self.path.sequence() if point[4] is not None),
+                                default=self.odometer_min)
+        return right
+
+    def odometer_km(self) -> Optional[float]:
+        if self.odometer_min is None:
+            return None
+        return round(self.odometer_max - self.odometer_min, 3)
+
+    def waypoints(self) -> List[Dict[str, float]]:
+        return [{'latitude': point[1], 'longitude': point[2]} for point in self.path.waypoints()]
+
+    def record(self) -> Dict[str, Any]:
+        """Trip history entry (mileage from the odometer when available, else GPS distance)."""
+        odometer = self.odometer_km()
+        return {
+            'trip_id': self.trip_id,
+            'asset_id': self.asset_id,
+            'started_at': from_epoch_seconds(self.started_at),
+            'ended_at': from_epoch_seconds(self.ended_at),
+            'mileage': {'value': odometer if odometer is not None else round(self.distance_m / 1000, 3), 'unit': 'km'},
+            'gps_distance': {'value': round(self.distance_m / 1000, 3), 'unit': 'km'},
+            'waypoints': self.waypoints(),
+            'revision': self.revision,
+        }
+
+
+# ============================================================================
+# Segmenter
+# ============================================================================
+
+class AssetTrips:
+    """Per-asset segmenter state: latest packet time, whether the last trip is open, recent trips."""
+
+    __slots__ = ('last_at', 'in_transit', 'trips', 'horizon')
+
+    def __init__(self):
+        self.last_at: Optional[float] = None
+        self.in_transit = False
+        self.trips: List[Trip] = []     # sorted by started_at; the last one is open while in_transit
+        self.horizon: Optional[float] = None
+
+
+class TripView:
+    """Per-asset, per-packet view handed to the ongoing trip functions as context['trips']."""
+
+    __slots__ = ('segmenter', 'asset_id', 'timestamp', 'trip')
+
+    def __init__(self, segmenter: 'TripSegmenter', asset_id: Hashable):
+        self.segmenter = segmenter
+        self.asset_id = asset_id
+        self.timestamp: Optional[float] = None
+        self.trip: Optional[Trip] = None
+
+    def transit(self, transit_code: Optional[str], timestamp: Optional[float]) -> Optional[float]:
+        """Segment the packet; returns the start of the trip it belongs to."""
+        if timestamp is None:
+            return None
+        self.timestamp = timestamp
+        self.trip = self.segmenter.observe(self.asset_id, timestamp, transit_code)
+        return self.trip.started_at if self.trip is not None else None
+
+    def odometer(self, value: Optional[float]) -> Optional[float]:
+        """Odometer distance since the trip start (km)."""
+        if self.trip is None:
+            return None
+        self.trip.add_odometer(value)
+        return self.trip.odometer_km() if value is not None else None
+
+    def position(self, lat: Optional[float], lng: Optional[float],
+                 odometer: Optional[float] = None) -> List[Dict[str, float]]:
+        """Add the packet location (odometer stored on the waypoint for splits); returns the waypoints."""
+        if self.trip is None:
+            return []
+        if lat is not None and lng is not None:
+            self.trip.add_position(self.timestamp, lat, lng, odometer)
+        return self.trip.waypoints()
+
+
+class TripSegmenter:
+    """
+    Streaming trip segmentation for many assets.
+
+    Args:
+        tolerance_m: Maximum distance between a dropped point and the simplified path
+        max_waypoints: Waypoints kept per trip before re-simplifying with a doubled tolerance
+        max_pending: Opening-window buffer size
+        recent_trips: Trips kept per asset for late / recovered packets
+        gap_seconds: Silence inside a trip after which both surrounding points are kept
+    """
+
+    def __init__(self, tolerance_m: float = TOLERANCE_M, max_waypoints: int = MAX_WAYPOINTS,
+                 max_pending: int = MAX_PENDING, recent_trips: int = RECENT_TRIPS,
+                 gap_seconds: float = GAP_SECONDS):
+        self.tolerance_m = tolerance_m
+        self.max_waypoints = max_waypoints
+        self.max_pending = max_pending
+        self.recent_trips = recent_trips
+        self.gap_seconds = gap_seconds
+        self.assets: Dict[Hashable, AssetTrips] = {}
+        self.updated: Dict[int, Trip] = {}
+        self.next_id = 1
+        self.stats = {'late': 0, 'reopened': 0, 'recovered': 0, 'split': 0, 'expired': 0, 'unsplit': 0}
+
+    def view(self, asset_id: Hashable) -> TripView:
+        return TripView(self, asset_id)
+
+    def bind(self, context: Optional[Dict], asset_id: Hashable) -> Dict:
+        """Copy of the packet context with `trips` set to this asset's view."""
+        bound = dict(context) if context else {}
+        bound['trips'] = self.view(asset_id)
+        return bound
+
+    def update(self, asset_id: Hashable, timestamp: float, transit_code: Optional[str],
+               lat: Optional[float] = None, lng: Optional[float] = None,
+               odometer: Optional[float] = None) -> Optional[Trip]:
+        """Feed one packet outside the mapping engine; returns the trip it belongs to."""
+        view = self.view(asset_id)
+        view.transit(transit_code, timestamp)
+        view.odometer(odometer)
+        view.position(lat, lng, odometer)
+        return view.trip
+
+    def ongoing(self, asset_id: Hashable) -> Optional[Trip]:
+        state = self.assets.get(asset_id)
+        return state.trips[-1] if state is not None and state.in_transit else None
+
+    def pop_trips(self) -> List[Trip]:
+        """Trips closed or changed since the previous call (revision increases on every re-emission)."""
+        trips = list(self.updated.values())
+        self.updated.clear()
+        for trip in trips:
+            trip.revision += 1
+        return trips
+
+    # ------------------------------------------------------------------
+    # Segmentation
+    # ------------------------------------------------------------------
+
+    def _new_trip(self, state: AssetTrips, asset_id: Hashable, timestamp: float, index: int,
+                  opened_after: Optional[float], closed_at: Optional[float]) -> Trip:
+        path = WaypointPath(self.tolerance_m, self.max_waypoints, self.max_pending, self.gap_seconds)
+        trip = Trip(self.next_id, asset_id, timestamp, opened_after, closed_at, path)
+        self.next_id += 1
+        self._keep(state, index, trip)
+        return trip
+
+    def _keep(self, state: AssetTrips, index: int, trip: Trip) -> None:
+        state.trips.insert(index, trip)
+        if len(state.trips) > self.recent_trips:
+            dropped = state.trips.pop(0)
+            state.horizon = dropped.closed_at if dropped.closed_at is not None else dropped.ended_at
+
+    def _changed(self, trip: Trip) -> None:
+        if trip.closed_at is not None:
+            self.updated[trip.trip_id] = trip
+
+    def observe(self, asset_id: Hashable, timestamp: float, transit_code: Optional[str]) -> Optional[Trip]:
+        """Advance the asset's segmentation with one packet; returns its trip (None when not in transit)."""
+        state = self.assets.get(asset_id)
+        if state is None:
+            state = self.assets[asset_id] = AssetTrips()
+        moving = transit_code == IN_TRANSIT
+        if state.last_at is not None and timestamp < state.last_at:
+            return self._late(state, asset_id, timestamp, moving)
+
+        previous_at = state.last_at
+        state.last_at = timestamp
+        if moving:
+            if state.in_transit:
+                trip = state.trips[-1]
+                trip.ended_at = timestamp
+                return trip
+            state.in_transit = True
+            return self._new_trip(state, asset_id, timestamp, len(state.trips), previous_at, None)
+        if state.in_transit:
+            state.in_transit = False
+            trip = state.trips[-1]
+            trip.closed_at = timestamp
+            self._changed(trip)
+        return None
+
+    def _late(self, state: AssetTrips, asset_id: Hashable, timestamp: float, moving: bool) -> Optional[Trip]:
+        self.stats['late'] += 1
+        if state.horizon is not None and timestamp <= state.horizon:
+            self.stats['expired'] += 1
+            return None
+        trips = state.trips
+        index = bisect.bisect_right([trip.started_at for trip in trips], timestamp)
+        previous = trips[index - 1] if index else None
+        following = trips[index] if index < len(trips) else None
+        after_previous = previous is not None and (previous.closed_at is None or timestamp < previous.closed_at)
+        before_following = following is not None and (
+            following.opened_after is None or timestamp > following.opened_after)
+
+        if not moving:
+            if previous is not None and timestamp < previous.ended_at:
+                self._split(state, index, previous, timestamp)
+            elif after_previous:
+                previous.closed_at = timestamp
+                self._changed(previous)
+            elif before_following:
+                following.opened_after = timestamp
+            return None
+
+        if after_previous:
+            trip = previous
+            trip.ended_at = max(trip.ended_at, timestamp)
+        elif before_following:
+            trip = following
+            trip.started_at = timestamp
+        else:
+            self.stats['recovered'] += 1
+            closed_at = following.opened_after if following is not None else state.last_at
+            trip = self._new_trip(state, asset_id, timestamp, index,
+                                  previous.closed_at if previous is not None else state.horizon, closed_at)
+        if trip.revision or trip.trip_id in self.updated:
+            self.stats['reopened'] += 1
+        self._changed(trip)
+        return trip
+
+    def _split(self, state: AssetTrips, index: int, trip: Trip, timestamp: float) -> None:
+        right = trip.split(timestamp, self.next_id)
+        if right is None:
+            self.stats['unsplit'] += 1
+            return
+        self.next_id += 1
+        self.stats['split'] += 1
+        self._keep(state, index, right)
+        self._changed(trip)
+        self._changed(right)
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def simulate_asset(rng: random.Random, asset_id: int, start: float, hours: float, interval: float) -> List[Dict]:
+    """Alternating parked periods and drives (10 s packets, GPS noise, odometer in km)."""
+    lat, lng = rng.uniform(-30.0, 55.0), rng.uniform(-15.0, 45.0)
+    heading = rng.uniform(0, 2 * math.pi)
+    odometer = rng.uniform(1000.0, 90000.0)
+    packets = []
+    moment = start + rng.uniform(0, interval)
+    end = start + hours * 3600
+    moving = rng.random() < 0.5
+    while moment < end:
+        period_end = moment + (rng.uniform(300, 7200) if moving else rng.uniform(600, 5400))
+        speed = rng.uniform(8.0, 25.0)  # m/s
+        while moment < min(period_end, end):
+            if moving:
+                heading += rng.gauss(0, 0.03) + (rng.choice((-1.5, 1.5)) if rng.random() < 0.03 else 0.0)
+                step = speed * interval
+                lat += math.cos(heading) * step / METERS_PER_DEGREE
+                lng += math.sin(heading) * step / METERS_PER_DEGREE / math.cos(math.radians(lat))
+                odometer += step / 1000
+            noise = 3.0 / METERS_PER_DEGREE
+            packets.append({'asset_id': asset_id, 't': float(round(moment)), 'code': IN_TRANSIT if moving else 'parked',
+                            'lat': lat + rng.uniform(-noise, noise), 'lng': lng + rng.uniform(-noise, noise),
+                            'odometer': round(odometer, 3)})
+            moment += interval * rng.uniform(0.8, 1.2)
+        moving = not moving
+    return packets
+
+
+def reference_trips(packets: List[Dict]) -> List[Tuple[float, float, float, float]]:
+    """(start, end, odometer km, GPS m) of every run of in_transit packets in time order."""
+    trips = []
+    run: List[Dict] = []
+    for packet in sorted(packets, key=lambda item: item['t']) + [{'code': None}]:
+        if packet['code'] == IN_TRANSIT:
+            run.append(packet)
+            continue
+        if run:
+            gps = sum(distance_m(a['lat'], a['lng'], b['lat'], b['lng']) for a, b in zip(run, run[1:]))
+            trips.append((run[0]['t'], run[-1]['t'], round(run[-1]['odometer'] - run[0]['odometer'], 3), gps))
+            run = []
+    return trips
+
+
+def main():
+    """Segment a synthetic fleet delivered out of order (with recovered outages) and compare with offline segmentation."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--assets', type=int, default=2000, help='Assets in the fleet')
+    parser.add_argument('--hours', type=float, default=48.0, help='Simulated period')
+    parser.add_argument('--late-ratio', type=float, default=0.03, help='Packets delayed by up to 2 minutes')
+    parser.add_argument('--outage-ratio', type=float, default=0.3, help='Assets with a recovered outage')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE_M, help='Waypoint tolerance (m)')
+    args = parser.parse_args()
+
+    rng = random.Random(23)
+    start = 1764115200.0  # 2025-11-26T00:00:00Z
+    interval = 10.0
+    packets: List[Dict] = []
+    per_asset: Dict[int, List[Dict]] = {}
+    for asset_id in range(args.assets):
+        asset_packets = simulate_asset(rng, asset_id, start, args.hours, interval)
+        per_asset[asset_id] = asset_packets
+        outage = None
+        if rng.random() < args.outage_ratio:
+            begin = start + rng.uniform(0.1, 0.8) * args.hours * 3600
+            outage = (begin, begin + rng.uniform(1800, 5400))
+        for packet in asset_packets:
+            if outage and outage[0] <= packet['t'] < outage[1]:
+                packet['arrival'] = outage[1] + 7200 + (packet['t'] - outage[0]) / 100  # replayed in order
+            elif rng.random() < args.late_ratio:
+                packet['arrival'] = packet['t'] + rng.uniform(5, 120)
+            else:
+                packet['arrival'] = packet['t'] + rng.uniform(0, 2)
+            packets.append(packet)
+    packets.sort(key=lambda item: item['arrival'])
+
+    segmenter = TripSegmenter(tolerance_m=args.tolerance)
+    trips: Dict[int, Trip] = {}
+    started = time.perf_counter()
+    for index, packet in enumerate(packets):
+        segmenter.update(packet['asset_id'], packet['t'], packet['code'], packet['lat'], packet['lng'],
+                         packet['odometer'])
+        if index % 10000 == 0:
+            for trip in segmenter.pop_trips():
+                trips[trip.trip_id] = trip
+    seconds = time.perf_counter() - started
+    for trip in segmenter.pop_trips():
+        trips[trip.trip_id] = trip
+    for state in segmenter.assets.values():
+        for trip in state.trips:
+            trips[trip.trip_id] = trip
+
+    # Same packets through the mapping functions (in arrival order, one asset)
+    functions = [FUNCTION_REGISTRY[name] for name in (
+        'derive_ongoing_trip_started_at', 'derive_ongoing_trip_mileage', 'derive_ongoing_trip_waypoints')]
+    mapped = TripSegmenter(tolerance_m=args.tolerance)
+    sample = [packet for packet in packets if packet['asset_id'] == 0]
+    function_mismatches = 0
+    for packet in sample:
+        context = mapped.bind({}, 0)
+        fleeti = {'statuses_transit_code': packet['code'], 'last_updated_at': from_epoch_seconds(packet['t'])}
+        fleeti['ongoing_trip_started_at'] = functions[0](None, fleeti, {}, context)
+        fleeti.update(odometer_value=packet['odometer'], location_latitude=packet['lat'],
+                      location_longitude=packet['lng'])
+        mileage = functions[1](None, fleeti, {}, context)
+        waypoints = functions[2](None, fleeti, {}, context)
+        trip = context['trips'].trip
+        if trip is not None and (mileage != trip.odometer_km() or len(waypoints) != len(trip.path.waypoints())):
+            function_mismatches += 1
+    by_bounds = {}
+    for trip in trips.values():
+        if trip.asset_id == 0:
+            by_bounds[(trip.started_at, trip.ended_at)] = trip.odometer_km()
+    function_mismatches += sum(1 for state in mapped.assets.values() for trip in state.trips
+                               if by_bounds.get((trip.started_at, trip.ended_at), -1) != trip.odometer_km())
+
+    streamed: Dict[int, Dict[Tuple[float, float], Trip]] = {}
+    for trip in trips.values():
+        streamed.setdefault(trip.asset_id, {})[(trip.started_at, trip.ended_at)] = trip
+    expected_count = mismatches = mileage_mismatches = 0
+    gps_errors = []
+    raw_points = kept_points = checked_points = outside_tolerance = 0
+    worst_deviation = 0.0
+    for asset_id, asset_packets in per_asset.items():
+        expected = reference_trips(asset_packets)
+        expected_count += len(expected)
+        found = streamed.get(asset_id, {})
+        mismatches += len(set(found) ^ {(begin, end) for begin, end, _, _ in expected})
+        for begin, end, odometer, gps in expected:
+            trip = found.get((begin, end))
+            if trip is None:
+                continue
+            mileage_mismatches += trip.odometer_km() != odometer
+            if gps > 100:
+                gps_errors.append(abs(trip.distance_m - gps) / gps)
+            waypoints = trip.path.waypoints()
+            raw = [(p['t'], p['lat'], p['lng']) for p in asset_packets
+                   if begin <= p['t'] <= end and p['code'] == IN_TRANSIT]
+            raw_points += len(raw)
+            kept_points += len(waypoints)
+            if asset_id < 100 and len(waypoints) > 1:
+                for point in raw:
+                    k = min(max(bisect.bisect_right([w[0] for w in waypoints], point[0]), 1), len(waypoints) - 1)
+                    deviation = segment_deviation_m(point, waypoints[k - 1], waypoints[k])
+                    worst_deviation = max(worst_deviation, deviation)
+                    outside_tolerance += deviation > trip.path.tolerance_m
+                    checked_points += 1
+
+    # One very long trip stays within max_waypoints
+    long_trip = TripSegmenter(tolerance_m=args.tolerance)
+    heading, lat, lng = 0.0, 45.0, 5.0
+    for step in range(3 * 8640):
+        heading += rng.gauss(0, 0.2)
+        lat += math.cos(heading) * 200 / METERS_PER_DEGREE
+        lng += math.sin(heading) * 200 / METERS_PER_DEGREE / math.cos(math.radians(lat))
+        long_trip.update('long', start + step * interval, IN_TRANSIT, lat, lng)
+    capped = long_trip.ongoing('long')
+
+    gps_errors.sort()
+    print(f"Streamed {len(packets):,} packets for {args.assets:,} assets in {seconds:.2f} s "
+          f"({len(packets) / seconds:,.0f} packets/s); {segmenter.stats['late']:,} arrived late")
+    print(f"Trips: {len(trips):,} streamed vs {expected_count:,} offline; boundary mismatches: {mismatches}, "
+          f"odometer mileage mismatches: {mileage_mismatches}")
+    print(f"Late handling: {segmenter.stats['reopened']:,} reopened, {segmenter.stats['recovered']:,} recovered trips, "
+          f"{segmenter.stats['split']:,} splits, "
+          f"{segmenter.stats['expired']} expired, {segmenter.stats['unsplit']} unsplit")
+    if gps_errors:
+        print(f"GPS distance vs raw path: median error {gps_errors[len(gps_errors) // 2]:.4%}, "
+              f"max {gps_errors[-1]:.3%}")
+    print(f"Waypoints: {kept_points:,} kept of {raw_points:,} points ({kept_points / max(raw_points, 1):.1%}), "
+          f"{outside_tolerance:,} of {checked_points:,} checked points beyond tolerance ({args.tolerance:g} m, "
+          f"next to late points), max deviation {worst_deviation:.1f} m")
+    print(f"72 h trip: {len(capped.path):,} waypoints for {3 * 8640:,} points "
+          f"(tolerance grown to {capped.path.tolerance_m:g} m)")
+    print(f"Mapping functions vs segmenter ({len(sample):,} packets of asset 0): {function_mismatches} mismatches")
+
+
+if __name__ == '__main__':
+    main()
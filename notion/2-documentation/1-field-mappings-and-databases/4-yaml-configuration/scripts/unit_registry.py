@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Unit Registry - Compile-Time Unit Conversions (Rule 8)
+
+When a source `unit` differs from the mapping's top-level `unit`, the backend
+converts the value. Every known unit is registered with its dimension and an
+affine relation to the dimension's base unit:
+
+    base_value = value * scale + offset
+
+so any (source unit, Fleeti unit) pair of the same dimension resolves to a
+single precomputed UnitConversion (value * scale + offset). Resolution
+happens once per mapping source at compile time; the per-packet path only
+multiplies (and adds the offset for temperatures). Pairs across dimensions
+or with unknown units raise UnitConversionError, which validation reports.
+
+Unit strings are canonicalized through UNIT_ALIASES, so catalog and CSV
+spellings ('h' / 'hours', 'V' / 'volts', 'L' / 'liters', '°' / 'degrees')
+compare equal. Empty, '-' and 'none' are unitless and never convert.
+
+Usage:
+    conversion = resolve_conversion('meters', 'km')   # None when no conversion
+    convert = conversion.scalar()                      # float -> float
+    column = conversion.apply(column)                  # NumPy arrays (batch mode)
+
+    python unit_registry.py [mapping.yaml]             # conversions used by a mapping
+"""
+
+import argparse
+import math
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class UnitConversionError(ValueError):
+    """Raised when a (source unit, target unit) pair cannot be converted."""
+
+
+# canonical unit -> (dimension, scale to base unit, offset to base unit)
+UNITS: Dict[str, Tuple[str, float, float]] = {
+    # length (base: meters)
+    'mm': ('length', 0.001, 0.0),
+    'meters': ('length', 1.0, 0.0),
+    'km': ('length', 1000.0, 0.0),
+    'miles': ('length', 1609.344, 0.0),
+    # speed (base: m/s)
+    'm/s': ('speed', 1.0, 0.0),
+    'km/h': ('speed', 1 / 3.6, 0.0),
+    'mph': ('speed', 0.44704, 0.0),
+    'knots': ('speed', 1852 / 3600, 0.0),
+    # time (base: seconds)
+    'ms': ('time', 0.001, 0.0),
+    'seconds': ('time', 1.0, 0.0),
+    'minutes': ('time', 60.0, 0.0),
+    'hours': ('time', 3600.0, 0.0),
+    'days': ('time', 86400.0, 0.0),
+    # electric potential (base: volts)
+    'mv': ('voltage', 0.001, 0.0),
+    'volts': ('voltage', 1.0, 0.0),
+    # electric current (base: amperes)
+    'ma': ('current', 0.001, 0.0),
+    'a': ('current', 1.0, 0.0),
+    # volume (base: liters)
+    'ml': ('volume', 0.001, 0.0),
+    'liters': ('volume', 1.0, 0.0),
+    'gallons': ('volume', 3.785411784, 0.0),
+    # flow (base: liters per hour)
+    'l/h': ('flow', 1.0, 0.0),
+    # mass (base: kilograms); 'g' / 'mg' are left out: catalogs use them for acceleration
+    'kg': ('mass', 1.0, 0.0),
+    # temperature (base: degrees Celsius)
+    '°c': ('temperature', 1.0, 0.0),
+    '°f': ('temperature', 5 / 9, -32 * 5 / 9),
+    'k': ('temperature', 1.0, -273.15),
+    # angle (base: degrees)
+    'degrees': ('angle', 1.0, 0.0),
+    'rad': ('angle', 180 / math.pi, 0.0),
+    # ratios and rates
+    '%': ('ratio', 1.0, 0.0),
+    '%rh': ('humidity', 1.0, 0.0),
+    'rpm': ('rotation', 1.0, 0.0),
+    'hz': ('frequency', 1.0, 0.0),
+    'm2': ('area', 1.0, 0.0),
+    'm2/h': ('area_rate', 1.0, 0.0),
+}
+
+# Lowercased spelling -> canonical unit
+UNIT_ALIASES: Dict[str, str] = {
+    'm': 'meters', 'meter': 'meters', 'metres': 'meters',
+    'kilometers': 'km', 'mi': 'miles',
+    'kmh': 'km/h', 'kph': 'km/h', 'kn': 'knots',
+    's': 'seconds', 'sec': 'seconds', 'second': 'seconds',
+    'min': 'minutes', 'h': 'hours', 'hour': 'hours', 'd': 'days',
+    'v': 'volts', 'volt': 'volts', 'millivolts': 'mv',
+    'l': 'liters', 'litres': 'liters', 'liter': 'liters', 'gal': 'gallons',
+    'c': '°c', 'celsius': '°c', 'f': '°f', 'fahrenheit': '°f', 'kelvin': 'k',
+    '°': 'degrees', 'deg': 'degrees', 'degree': 'degrees', 'radians': 'rad',
+    'percent': '%',
+}
+
+UNITLESS = frozenset({'', '-', 'none'})
+
+
+class UnitConversion(NamedTuple):
+    """Precomputed affine conversion: target = value * scale + offset."""
+    source: str
+    target: str
+    scale: float
+    offset: float
+
+    def scalar(self) -> Callable[[Any], Any]:
+        """Per-value converter (the offset term is dropped when it is zero)."""
+        scale, offset = self.scale, self.offset
+        if offset == 0.0:
+            def convert(value):
+                return value * scale
+            return convert
+
+        def convert_affine(value):
+            return value * scale + offset
+        return convert_affine
+
+    def apply(self, values: Any) -> Any:
+        """Vectorized conversion for NumPy (masked) arrays; masks are preserved."""
+        if self.offset == 0.0:
+            return values * self.scale
+        return values * self.scale + self.offset
+
+
+def canonical_unit(unit: Optional[str]) -> Optional[str]:
+    """Canonical registry name for a unit string (None for unitless)."""
+    if unit is None:
+        return None
+    key = str(unit).strip().lower()
+    if key in UNITLESS:
+        return None
+    return UNIT_ALIASES.get(key, key)
+
+
+@lru_cache(maxsize=None)
+def resolve_conversion(source_unit: Optional[str], target_unit: Optional[str]) -> Optional[UnitConversion]:
+    """
+    Resolve a (source unit, Fleeti unit) pair to a UnitConversion.
+
+    Returns None when no conversion is needed (same unit, or either side is
+    unitless). Raises UnitConversionError for unknown units or units of
+    different dimensions.
+    """
+    source = canonical_unit(source_unit)
+    target = canonical_unit(target_unit)
+    if source is None or target is None or source == target:
+        return None
+
+    for unit in (source, target):
+        if unit not in UNITS:
+            raise UnitConversionError(f"No unit conversion from '{source}' to '{target}' (unknown unit '{unit}')")
+    source_dimension, source_scale, source_offset = UNITS[source]
+    target_dimension, target_scale, target_offset = UNITS[target]
+    if source_dimension != target_dimension:
+        raise UnitConversionError(
+            f"No unit conversion from '{source}' ({source_dimension}) to '{target}' ({target_dimension})"
+        )
+
+    # value -> base -> target
+    scale = source_scale / target_scale
+    offset = (source_offset - target_offset) / target_scale
+    if scale == 1.0 and offset == 0.0:
+        return None
+    return UnitConversion(source, target, scale, offset)
+
+
+def conversion_report(yaml_data: Dict) -> List[Dict[str, Any]]:
+    """
+    List every unit conversion a mapping performs.
+
+    One row per direct source whose unit differs from the mapping unit:
+    field, path, source_unit, target_unit, scale, offset and error (None when
+    the pair resolves). Calculated sources are skipped (they return values in
+    the Fleeti unit already).
+    """
+    rows = []
+    for name, mapping in ((yaml_data or {}).get('mappings') or {}).items():
+        if not isinstance(mapping, dict):
+            continue
+        target_unit = mapping.get('unit')
+        for source in mapping.get('sources') or []:
+            if not isinstance(source, dict) or source.get('type') == 'calculated' or 'function' in source:
+                continue
+            row = {
+                'field': name,
+                'path': source.get('path'),
+                'source_unit': canonical_unit(source.get('unit')),
+                'target_unit': canonical_unit(target_unit),
+                'scale': None,
+                'offset': None,
+                'error': None,
+            }
+            try:
+                conversion = resolve_conversion(source.get('unit'), target_unit)
+            except UnitConversionError as e:
+                row['error'] = str(e)
+                rows.append(row)
+                continue
+            if conversion is not None:
+                row['scale'] = conversion.scale
+                row['offset'] = conversion.offset
+                rows.append(row)
+    return rows
+
+
+def main():
+    """Print the unit conversions used by a mapping YAML."""
+    import yaml
+
+    # mapping_engine imports this module, so its helpers are imported here
+    from mapping_engine import OUTPUT_DIR, find_latest_yaml_file
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('yaml_file', nargs='?', type=Path, help='Mapping YAML (default: latest in output/)')
+    args = parser.parse_args()
+
+    yaml_file = args.yaml_file or find_latest_yaml_file(OUTPUT_DIR)
+
+    with open(yaml_file, 'r', encoding='utf-8') as f:
+        yaml_data = yaml.safe_load(f)
+
+    rows = conversion_report(yaml_data)
+    print(f"Unit conversions in {yaml_file.name}: {len(rows)}")
+    for row in rows:
+        if row['error']:
+            print(f"  {row['field']:<32} {row['path']:<24} ERROR: {row['error']}")
+            continue
+        formula = f"x * {row['scale']:.6g}"
+        if row['offset']:
+            formula += f" {'+' if row['offset'] > 0 else '-'} {abs(row['offset']):.6g}"
+        print(f"  {row['field']:<32} {row['path']:<24} {row['source_unit']} -> {row['target_unit']}: {formula}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,122 +1,540 @@
 #!/usr/bin/env python3
-"""Quick validation script for generated YAML."""
+"""
+Validate Generated YAML Configurations
 
-import yaml
-from pathlib import Path
+Importable validator for mapping YAML files produced by
+generate_yaml_from_csv.py. One streaming pass over the Mapping Fields CSV
+(expected field names, Fleeti Field Path format) and one pass over the
+mappings (structure, key cross-check, parameters.fleeti references and
+dependency order) against a field index built once.
+
+Returns a structured report:
+
+    {
+        "file": "...", "csv_file": "...", "version": "1.0.6", "provider": "navixy",
+        "mapping_count": 59, "valid": true, "error_count": 0, "warning_count": 2,
+        "issues": [{"code": "MISSING_IN_YAML", "severity": "warning",
+                    "field": "fuel_level", "message": "..."}],
+        "duration_ms": 3.1
+    }
+
+`valid` is false when any issue has severity "error". Usage:
+
+    report = validate_file(yaml_path, csv_path)
+    report = validate_mapping(yaml_data, csv_rows=rows)   # in-process (generator)
+
+Semantic checks run when a ProviderCatalog is passed: the Provider Field
+(db) export and navixy-field-catalog.csv are loaded once into hash indexes,
+then every source path, parameters.provider field, (source unit, Fleeti
+unit) pair and function reference is checked with O(1) lookups.
+
+CLI: validate the newest YAML (or the given files, in parallel with --jobs),
+print a text summary or --json, exit 1 when a file is invalid.
+"""
+
+import argparse
 import csv
+import json
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import yaml
+
+from packet_paths import provider_field_path
+from unit_registry import UnitConversionError, canonical_unit, resolve_conversion
 
 SCRIPT_DIR = Path(__file__).parent
 OUTPUT_DIR = SCRIPT_DIR.parent / "output"
 EXPORT_DIR = SCRIPT_DIR.parent.parent / "3-mapping-fields" / "export"
+PROVIDER_FIELDS_EXPORT_DIR = SCRIPT_DIR.parent.parent / "1-provider-fields" / "export"
+FIELD_CATALOG_CSV = SCRIPT_DIR.parents[2] / "4-reference-materials" / "resources" / "navixy-field-catalog.csv"
+# Notion export filename date: `Mapping Fields (db) 1-8-26.csv` (month-day-year)
+EXPORT_DATE = re.compile(r'(\d{1,2})-(\d{1,2})-(\d{2}|\d{4})\.csv$')
+
+MAPPING_TYPES = {'direct', 'prioritized', 'calculated', 'transformed', 'io_mapped', 'mix'}
+REQUIRED_TOP_LEVEL_KEYS = ('version', 'provider', 'mappings')
+
+# Error codes -> severity
+ISSUE_SEVERITY = {
+    'YAML_PARSE_ERROR': 'error',          # file is not valid YAML
+    'MISSING_TOP_LEVEL_KEY': 'error',     # version / provider / mappings absent
+    'INVALID_MAPPING': 'error',           # mapping entry is not a mapping object
+    'INVALID_MAPPING_TYPE': 'error',      # type not in MAPPING_TYPES
+    'MISSING_SOURCES': 'error',           # direct/prioritized without sources
+    'MISSING_FUNCTION': 'error',          # calculated without function
+    'MISSING_TRANSFORMATION': 'error',    # transformed without transformation
+    'INVALID_FLEETI_REFERENCE': 'error',  # parameters.fleeti entry is a field path, not a name
+    'DEPENDENCY_ORDER': 'error',          # parameters.fleeti dependency appears after its dependent
+    'UNKNOWN_DEPENDENCY': 'warning',      # parameters.fleeti names a field not in this YAML
+    'MISSING_IN_YAML': 'warning',         # CSV field not generated
+    'EXTRA_IN_YAML': 'warning',           # YAML field not in CSV
+    'INVALID_FIELD_PATH': 'warning',      # malformed Fleeti Field Path in CSV
+    'CSV_NOT_FOUND': 'warning',           # no CSV to cross-check against
+    # Semantic checks (ProviderCatalog)
+    'UNKNOWN_PROVIDER_PATH': 'error',     # source path not in the provider field catalog
+    'UNKNOWN_PROVIDER_FIELD': 'warning',  # parameters.provider field not in the catalog
+    'UNCONVERTIBLE_UNIT': 'error',        # no conversion from source unit to Fleeti unit
+    'CATALOG_UNIT_MISMATCH': 'warning',   # source unit differs from the catalog unit (after aliasing)
+    'UNKNOWN_FUNCTION': 'warning',        # function not implemented (evaluates to null)
+}
+
+
+def extract_field_name(raw: str) -> str:
+    """Extract field name from Notion link format: 'field_name (https://...)'."""
+    if not raw:
+        return ""
+    return raw.split('(')[0].strip()
 
-# Find most recent YAML file
-yaml_files = list(OUTPUT_DIR.glob("*.yaml"))
-if not yaml_files:
-    print("No YAML files found")
-    exit(1)
-
-yaml_file = max(yaml_files, key=lambda p: p.stat().st_mtime)
-print(f"Validating: {yaml_file}")
-
-with open(yaml_file, 'r', encoding='utf-8') as f:
-    data = yaml.safe_load(f)
-
-print("=== YAML SUMMARY ===")
-print(f"Version: {data['version']}")
-print(f"Provider: {data['provider']}")
-print(f"Total mappings: {len(data['mappings'])}")
-print("YAML parsed successfully.")
-print("")
-
-# Cross-check: ensure every Mapping Fields CSV row is represented in YAML
-csv_files = list(EXPORT_DIR.glob("Mapping Fields (db) *.csv"))
-if not csv_files:
-    print("\nWarning: No Mapping Fields CSV files found for cross-check.")
-else:
-    csv_file = max(csv_files, key=lambda p: p.stat().st_mtime)
-    print("=== CSV/YAML KEY CHECK ===")
-    print(f"Cross-checking against CSV: {csv_file}")
-
-    def extract_field_name(raw: str) -> str:
-        """Extract field name from Notion link format: 'field_name (https://...)'."""
-        if not raw:
-            return ""
-        return raw.split('(')[0].strip()
-
-    def is_valid_field_path(path: str) -> bool:
-        if not path:
-            return False
-        if ',' in path or ' ' in path:
-            return False
-        # Allow root-level fields (e.g., last_updated_at) and array paths (e.g., geofences[])
-        if '.' not in path:
-            return path.endswith('[]') or path.replace('_', '').isalnum()
-        return True
-
-    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as f:
-        reader = csv.DictReader(f)
-        expected = []
-        invalid_paths = []
-
-        for row in reader:
-            # Prefer Fleeti Field column when present (matches YAML keys)
-            raw = row.get('Fleeti Field', '').strip()
-            if not raw:
-                raw = row.get('Name', '').strip()
-            name = extract_field_name(raw)
-            if name:
-                expected.append(name)
-
-            field_path = (row.get('Fleeti Field Path') or '').strip()
-            if field_path and not is_valid_field_path(field_path):
-                invalid_paths.append((name or raw, field_path))
-
-    yaml_keys = set(data.get('mappings', {}).keys())
-    expected_set = set(expected)
-
-    missing_in_yaml = sorted(expected_set - yaml_keys)
-    extra_in_yaml = sorted(yaml_keys - expected_set)
-
-    if missing_in_yaml:
-        print(f"Missing in YAML ({len(missing_in_yaml)}): {missing_in_yaml}")
-    if extra_in_yaml:
-        print(f"Extra in YAML ({len(extra_in_yaml)}): {extra_in_yaml}")
-    if not missing_in_yaml and not extra_in_yaml:
-        print("CSV/YAML key sets match.")
-    print("")
 
-    if invalid_paths:
-        print("=== FIELD PATH CHECK ===")
-        print(f"Invalid Fleeti Field Path ({len(invalid_paths)}): {invalid_paths}")
-        print("")
-
-# Dependency order check (YAML order must respect parameters.fleeti dependencies)
-order = list(data.get('mappings', {}).keys())
-index = {name: i for i, name in enumerate(order)}
-violations = []
-
-for name, mapping in data.get('mappings', {}).items():
-    deps = []
-    params = mapping.get('parameters', {})
-    fleeti = params.get('fleeti') if isinstance(params, dict) else None
-    if isinstance(fleeti, list):
-        deps.extend([d for d in fleeti if isinstance(d, str)])
-    for source in mapping.get('sources', []) or []:
-        params = source.get('parameters', {}) if isinstance(source, dict) else {}
+def is_valid_field_path(path: str) -> bool:
+    if not path:
+        return False
+    if ',' in path or ' ' in path:
+        return False
+    # Allow root-level fields (e.g., last_updated_at) and array paths (e.g., geofences[])
+    if '.' not in path:
+        return path.endswith('[]') or path.replace('_', '').isalnum()
+    return True
+
+
+def fleeti_references(mapping: Dict) -> List[str]:
+    """parameters.fleeti names of a mapping and of its calculated sources."""
+    refs = []
+    parameter_sets = [mapping.get('parameters')]
+    parameter_sets.extend(
+        source.get('parameters') for source in mapping.get('sources') or [] if isinstance(source, dict)
+    )
+    for params in parameter_sets:
         fleeti = params.get('fleeti') if isinstance(params, dict) else None
         if isinstance(fleeti, list):
-            deps.extend([d for d in fleeti if isinstance(d, str)])
+            refs.extend(ref for ref in fleeti if isinstance(ref, str))
+    return refs
+
+
+def export_date(path: Path) -> Tuple[int, int, int]:
+    """(year, month, day) of a Notion export named `... M-D-YY.csv`; (0, 0, 0) without a date."""
+    match = EXPORT_DATE.search(path.name)
+    if match is None:
+        return 0, 0, 0
+    month, day, year = (int(part) for part in match.groups())
+    return (year + 2000 if year < 100 else year), month, day
+
+
+def latest_export(paths: Iterable[Path]) -> Optional[Path]:
+    """Export with the latest filename date (name as tiebreak), or None."""
+    return max(paths, key=lambda path: (export_date(path), path.name), default=None)
+
+
+def latest_provider_fields_export() -> Optional[Path]:
+    """Newest Provider Field (db) export by filename date, or None."""
+    return latest_export(PROVIDER_FIELDS_EXPORT_DIR.glob("Provider Field (db) *.csv"))
+
+
+class ProviderCatalog:
+    """
+    Provider field catalog indexed for O(1) lookups.
+
+    paths: (provider, field path) -> normalized unit (None = unitless)
+    names: (provider, field name) -> field path
+    """
+
+    def __init__(self):
+        self.paths: Dict[Tuple[str, str], Optional[str]] = {}
+        self.names: Dict[Tuple[str, str], str] = {}
+        self.providers: Set[str] = set()
+
+    def add_field(self, provider: str, name: str, path: str, unit: Optional[str]) -> None:
+        provider = provider.strip().lower()
+        unit = canonical_unit(unit)
+        self.providers.add(provider)
+        self.names.setdefault((provider, name), path)
+        # First source wins for units (Provider Field export is loaded first)
+        self.paths.setdefault((provider, path), unit)
+
+    @staticmethod
+    def source_files(
+        provider_fields_csv: Optional[Path] = None,
+        field_catalog_csv: Optional[Path] = FIELD_CATALOG_CSV
+    ) -> List[Path]:
+        """Files load() reads with these arguments (newest Provider Field (db) export by default)."""
+        if provider_fields_csv is None:
+            provider_fields_csv = latest_provider_fields_export()
+        sources = [Path(provider_fields_csv)] if provider_fields_csv is not None else []
+        if field_catalog_csv is not None and Path(field_catalog_csv).exists():
+            sources.append(Path(field_catalog_csv))
+        return sources
+
+    @classmethod
+    def load(
+        cls,
+        provider_fields_csv: Optional[Path] = None,
+        field_catalog_csv: Optional[Path] = FIELD_CATALOG_CSV
+    ) -> 'ProviderCatalog':
+        """Load the newest Provider Field (db) export and the Navixy field catalog (either may be missing)."""
+        catalog = cls()
+        if provider_fields_csv is None:
+            provider_fields_csv = latest_provider_fields_export()
+        if provider_fields_csv is not None:
+            with open(provider_fields_csv, 'r', encoding='utf-8-sig', newline='') as f:
+                for row in csv.DictReader(f):
+                    name = (row.get('Name') or '').strip()
+                    path = (row.get('Field Path') or '').strip() or provider_field_path(name)
+                    if name:
+                        catalog.add_field(row.get('Provider') or 'navixy', name, path, row.get('Unit'))
+
+        if field_catalog_csv is not None and Path(field_catalog_csv).exists():
+            with open(field_catalog_csv, 'r', encoding='utf-8-sig', newline='') as f:
+                for row in csv.DictReader(f):
+                    name = (row.get('provider_name') or '').strip()
+                    if name:
+                        catalog.add_field('navixy', name, provider_field_path(name), row.get('unit'))
+        return catalog
+
+
+class SemanticChecker:
+    """Per-source / per-mapping checks against a ProviderCatalog and a function set."""
+
+    def __init__(self, catalog: ProviderCatalog, functions: Iterable[str], report: 'ValidationReport'):
+        self.catalog = catalog
+        self.functions = set(functions)
+        self.report = report
+
+    def check_mapping(self, name: str, mapping: Dict, default_provider: str) -> None:
+        target_unit = mapping.get('unit')
+        self.check_call(name, mapping, default_provider)
+        for source in mapping.get('sources') or []:
+            if not isinstance(source, dict):
+                continue
+            provider = (source.get('provider') or default_provider).lower()
+            if source.get('type') == 'calculated' or 'function' in source:
+                self.check_call(name, source, provider)
+                continue
+            path = source.get('path')
+            if path and provider in self.catalog.providers:
+                key = (provider, path)
+                if key not in self.catalog.paths:
+                    self.report.add('UNKNOWN_PROVIDER_PATH', f"Source path '{path}' not in {provider} field catalog", name)
+                else:
+                    self.check_catalog_unit(name, path, source.get('unit'), self.catalog.paths[key])
+            self.check_unit_pair(name, source.get('unit'), target_unit)
+
+    def check_call(self, name: str, entry: Dict, provider: str) -> None:
+        function_name = entry.get('function')
+        if function_name and function_name not in self.functions:
+            self.report.add('UNKNOWN_FUNCTION', f"Function '{function_name}' is not implemented", name)
+        provider_params = ((entry.get('parameters') or {}).get('provider') or {}).get(provider)
+        if provider_params is None or provider not in self.catalog.providers:
+            return
+        for field_name in provider_params if isinstance(provider_params, list) else [provider_params]:
+            if (provider, field_name) not in self.catalog.names:
+                self.report.add('UNKNOWN_PROVIDER_FIELD',
+                                f"parameters.provider field '{field_name}' not in {provider} field catalog", name)
+
+    def check_catalog_unit(self, name: str, path: str, source_unit: Optional[str], catalog_unit: Optional[str]) -> None:
+        unit = canonical_unit(source_unit)
+        if unit is not None and catalog_unit is not None and unit != catalog_unit:
+            self.report.add('CATALOG_UNIT_MISMATCH',
+                            f"Source '{path}' declares unit '{unit}', catalog says '{catalog_unit}'", name)
+
+    def check_unit_pair(self, name: str, source_unit: Optional[str], target_unit: Optional[str]) -> None:
+        try:
+            resolve_conversion(source_unit, target_unit)
+        except UnitConversionError as e:
+            self.report.add('UNCONVERTIBLE_UNIT', str(e), name)
+
+
+class ValidationReport:
+    """Accumulates issues and renders the report dict."""
+
+    def __init__(self, file: Optional[str] = None):
+        self.file = file
+        self.issues: List[Dict[str, Any]] = []
+        self.counts = {'error': 0, 'warning': 0}
+
+    def add(self, code: str, message: str, field: Optional[str] = None) -> None:
+        severity = ISSUE_SEVERITY[code]
+        self.counts[severity] += 1
+        self.issues.append({'code': code, 'severity': severity, 'field': field, 'message': message})
+
+    def to_dict(self, **summary) -> Dict[str, Any]:
+        return {
+            'file': self.file,
+            **summary,
+            'valid': self.counts['error'] == 0,
+            'error_count': self.counts['error'],
+            'warning_count': self.counts['warning'],
+            'issues': self.issues,
+        }
+
+
+def scan_csv_rows(rows: Iterable[Dict], report: ValidationReport) -> List[str]:
+    """Single pass over CSV rows: expected field names (CSV order), invalid Fleeti Field Paths reported."""
+    expected = []
+    for row in rows:
+        # Prefer Fleeti Field column when present (matches YAML keys)
+        raw = (row.get('Fleeti Field') or '').strip() or (row.get('Name') or '').strip()
+        name = extract_field_name(raw)
+        if name:
+            expected.append(name)
+
+        field_path = (row.get('Fleeti Field Path') or '').strip()
+        if field_path and not is_valid_field_path(field_path):
+            report.add('INVALID_FIELD_PATH', f"Invalid Fleeti Field Path '{field_path}'", name or raw)
+    return expected
+
+
+def validate_mapping(
+    yaml_data: Any,
+    csv_rows: Optional[Iterable[Dict]] = None,
+    file: Optional[str] = None,
+    csv_file: Optional[str] = None,
+    catalog: Optional[ProviderCatalog] = None,
+    functions: Optional[Iterable[str]] = None
+) -> Dict[str, Any]:
+    """
+    Validate parsed mapping YAML data, optionally cross-checked against CSV rows.
+
+    csv_rows is consumed once (a csv.DictReader streams without loading the file).
+    With a catalog, sources, units and functions are checked semantically;
+    functions defaults to the names in mapping_functions.FUNCTION_REGISTRY.
+    """
+    start = time.perf_counter()
+    report = ValidationReport(file)
+
+    if not isinstance(yaml_data, dict):
+        report.add('MISSING_TOP_LEVEL_KEY', "YAML root is not a mapping")
+        yaml_data = {}
+    for key in REQUIRED_TOP_LEVEL_KEYS:
+        if key not in yaml_data:
+            report.add('MISSING_TOP_LEVEL_KEY', f"Missing top-level key '{key}'")
+    mappings = yaml_data.get('mappings') or {}
+    if not isinstance(mappings, dict):
+        report.add('MISSING_TOP_LEVEL_KEY', "'mappings' is not a mapping")
+        mappings = {}
+
+    # Field index built once: name -> position in YAML order
+    index = {name: position for position, name in enumerate(mappings)}
+
+    checker = None
+    if catalog is not None:
+        if functions is None:
+            from mapping_functions import FUNCTION_REGISTRY
+            functions = FUNCTION_REGISTRY
+        checker = SemanticChecker(catalog, functions, report)
+    default_provider = str(yaml_data.get('provider') or 'navixy').strip().lower()
+
+    expected = scan_csv_rows(csv_rows, report) if csv_rows is not None else None
+    if expected is not None:
+        expected_set = set(expected)
+        reported = set()
+        for name in expected:
+            if name not in index and name not in reported:
+                reported.add(name)
+                report.add('MISSING_IN_YAML', "CSV field has no YAML mapping", name)
+
+    for position, (name, mapping) in enumerate(mappings.items()):
+        if expected is not None and name not in expected_set:
+            report.add('EXTRA_IN_YAML', "YAML mapping has no CSV row", name)
+        if not isinstance(mapping, dict):
+            report.add('INVALID_MAPPING', "Mapping entry is not an object", name)
+            continue
+
+        mapping_type = mapping.get('type')
+        if mapping_type not in MAPPING_TYPES:
+            report.add('INVALID_MAPPING_TYPE', f"Unknown mapping type {mapping_type!r}", name)
+        elif mapping_type in ('direct', 'prioritized') and not mapping.get('sources'):
+            report.add('MISSING_SOURCES', f"{mapping_type} mapping without sources", name)
+        elif mapping_type == 'calculated' and not mapping.get('function'):
+            report.add('MISSING_FUNCTION', "calculated mapping without function", name)
+        elif mapping_type == 'transformed' and not mapping.get('transformation'):
+            report.add('MISSING_TRANSFORMATION', "transformed mapping without transformation", name)
+
+        for dep in fleeti_references(mapping):
+            if '.' in dep:
+                report.add('INVALID_FLEETI_REFERENCE',
+                           f"parameters.fleeti entry '{dep}' is a field path, not a field name", name)
+            elif dep not in index:
+                report.add('UNKNOWN_DEPENDENCY', f"parameters.fleeti references unknown field '{dep}'", name)
+            elif index[dep] > position:
+                report.add('DEPENDENCY_ORDER', f"Depends on '{dep}', which appears later in the YAML", name)
+
+        if checker is not None:
+            checker.check_mapping(name, mapping, default_provider)
+
+    return report.to_dict(
+        csv_file=csv_file,
+        version=yaml_data.get('version'),
+        provider=yaml_data.get('provider'),
+        mapping_count=len(mappings),
+        duration_ms=round((time.perf_counter() - start) * 1000, 3),
+    )
+
+
+def find_latest_csv(export_dir: Path = EXPORT_DIR) -> Optional[Path]:
+    """Most recent Mapping Fields (db) export by the date in its filename."""
+    return latest_export(export_dir.glob("Mapping Fields (db) *.csv"))
+
+
+def validate_file(
+    yaml_path: Path,
+    csv_path: Optional[Path] = None,
+    catalog: Optional[ProviderCatalog] = None
+) -> Dict[str, Any]:
+    """Load and validate one YAML file (CSV streamed from csv_path when given)."""
+    yaml_path = Path(yaml_path)
+    try:
+        with open(yaml_path, 'r', encoding='utf-8') as f:
+            data = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+    except yaml.YAMLError as e:
+        report = ValidationReport(str(yaml_path))
+        report.add('YAML_PARSE_ERROR', str(e))
+        return report.to_dict(csv_file=str(csv_path) if csv_path else None,
+                              version=None, provider=None, mapping_count=0, duration_ms=0.0)
+
+    if csv_path is None:
+        return validate_mapping(data, file=str(yaml_path), catalog=catalog)
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        return validate_mapping(data, csv.DictReader(f), file=str(yaml_path), csv_file=str(csv_path),
+                                catalog=catalog)
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Human-readable summary of a report."""
+    print(f"Validating: {report['file']}")
+    print(f"Version: {report['version']}  Provider: {report['provider']}  Mappings: {report['mapping_count']}")
+    if report['csv_file']:
+        print(f"Cross-checked against CSV: {report['csv_file']}")
+    by_code: Dict[str, List[Dict]] = {}
+    for issue in report['issues']:
+        by_code.setdefault(issue['code'], []).append(issue)
+    for code, issues in by_code.items():
+        fields = [issue['field'] for issue in issues if issue['field']]
+        print(f"  [{issues[0]['severity'].upper()}] {code} ({len(issues)}): {fields[:10]}"
+              + (' ...' if len(fields) > 10 else ''))
+    status = 'VALID' if report['valid'] else 'INVALID'
+    print(f"{status}: {report['error_count']} error(s), {report['warning_count']} warning(s) "
+          f"in {report['duration_ms']:.1f} ms")
+    print("")
+
+
+_worker_catalog: Optional[ProviderCatalog] = None
+
+
+def _load_worker_catalog(enabled: bool) -> None:
+    """Process pool initializer: each worker loads the catalogs once."""
+    global _worker_catalog
+    _worker_catalog = ProviderCatalog.load() if enabled else None
+
+
+def _validate_job(job) -> Dict[str, Any]:
+    yaml_path, csv_path = job
+    return validate_file(yaml_path, csv_path, _worker_catalog)
+
+
+def write_synthetic_files(directory: Path, count: int) -> tuple:
+    """Synthetic YAML + CSV with `count` mappings (chains of calculated dependencies)."""
+    mappings = {}
+    rows = []
+    for i in range(count):
+        name = f"field_{i}"
+        if i % 4 == 0:
+            mappings[name] = {'type': 'direct', 'sources': [{'field': f'avl_io_{i}', 'path': f'params.avl_io_{i}',
+                                                             'unit': 'none'}], 'unit': 'none'}
+        else:
+            mappings[name] = {'type': 'calculated', 'calculation_type': 'function_reference',
+                              'function': f'derive_{i}', 'parameters': {'fleeti': [f'field_{i - 1}']},
+                              'unit': 'none'}
+        mappings[name].update({'data_type': 'number', 'error_handling': 'return_null'})
+        rows.append({'Fleeti Field': f"{name} (https://www.notion.so/{i})", 'Fleeti Field Path': f"synthetic.{name}"})
+
+    yaml_path = directory / 'synthetic-mapping.yaml'
+    with open(yaml_path, 'w', encoding='utf-8') as f:
+        yaml.dump({'version': '1.0.0', 'provider': 'navixy', 'mappings': mappings}, f, sort_keys=False,
+                  Dumper=getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+    csv_path = directory / 'Mapping Fields (db) synthetic.csv'
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['Fleeti Field', 'Fleeti Field Path'])
+        writer.writeheader()
+        writer.writerows(rows)
+    return yaml_path, csv_path, mappings
+
+
+def run_benchmark(count: int) -> None:
+    """Validate a synthetic `count`-mapping configuration (in memory and from file)."""
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        yaml_path, csv_path, mappings = write_synthetic_files(Path(tmp_dir), count)
+        data = {'version': '1.0.0', 'provider': 'navixy', 'mappings': mappings}
+
+        with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+            report = validate_mapping(data, csv.DictReader(f))
+        print(f"In-memory: {count:,} mappings validated in {report['duration_ms']:.1f} ms "
+              f"({report['error_count']} errors, {report['warning_count']} warnings)")
+
+        start = time.perf_counter()
+        report = validate_file(yaml_path, csv_path)
+        elapsed = time.perf_counter() - start
+        print(f"From file (YAML load + validate): {elapsed * 1000:,.1f} ms "
+              f"(validation {report['duration_ms']:.1f} ms)")
+
+
+def main():
+    """Validate YAML configuration files and print (or emit JSON) reports."""
+    parser = argparse.ArgumentParser(description="Validate generated YAML configurations")
+    parser.add_argument('yaml_files', nargs='*', type=Path, help='YAML files (default: most recent in output/)')
+    parser.add_argument('--csv', type=Path, help='Mapping Fields CSV (default: most recent export)')
+    parser.add_argument('--no-csv', action='store_true', help='Skip the CSV cross-check')
+    parser.add_argument('--no-catalog', action='store_true',
+                        help='Skip semantic checks against the provider field catalogs')
+    parser.add_argument('--json', action='store_true', help='Print reports as JSON')
+    parser.add_argument('--jobs', type=int, default=1, help='Validate files in parallel processes')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='Benchmark on N synthetic mappings')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_benchmark(args.benchmark)
+        return
+
+    yaml_files = args.yaml_files
+    if not yaml_files:
+        from mapping_engine import find_latest_yaml_file
+        try:
+            yaml_files = [find_latest_yaml_file(OUTPUT_DIR)]
+        except FileNotFoundError:
+            print("No YAML files found")
+            sys.exit(1)
+
+    csv_path = None if args.no_csv else (args.csv or find_latest_csv())
+    jobs = [(path, csv_path) for path in yaml_files]
+    use_catalog = not args.no_catalog
+    if args.jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs, initializer=_load_worker_catalog,
+                                 initargs=(use_catalog,)) as pool:
+            reports = list(pool.map(_validate_job, jobs))
+    else:
+        _load_worker_catalog(use_catalog)
+        reports = [_validate_job(job) for job in jobs]
+
+    if csv_path is None and not args.no_csv:
+        for report in reports:
+            report['issues'].append({'code': 'CSV_NOT_FOUND', 'severity': 'warning', 'field': None,
+                                     'message': f"No Mapping Fields CSV found in {EXPORT_DIR}"})
+            report['warning_count'] += 1
 
-    for dep in deps:
-        if dep in index and index[dep] > index[name]:
-            violations.append((name, dep))
+    if args.json:
+        print(json.dumps(reports if len(reports) > 1 else reports[0], indent=2, ensure_ascii=False))
+    else:
+        for report in reports:
+            print_report(report)
 
-print("=== DEPENDENCY ORDER CHECK ===")
-if violations:
-    print(f"Dependency order violations ({len(violations)}): {violations}")
-else:
-    print("Dependency order check: OK")
-print("")
+    if not all(report['valid'] for report in reports):
+        sys.exit(1)
 
-print("=== VALIDATION COMPLETE ===")
 
+if __name__ == '__main__':
+    main()